@@ -1,44 +1,389 @@
 #db.py
 
 import datetime
+import threading
+import time
 import pandas as pd
 import psycopg2
+import psycopg2.pool
 import traceback
+import weakref
 import numpy as np
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+from metrics import metrics
+
+
+KEEPALIVE_KWARGS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 5,
+    "keepalives_count": 5,
+}
+CENTRAL_DB = {
+    "database": "central_database",
+    "user": "postgres",
+    "password": "55555",
+    "host": "100.121.194.26",
+    "port": "5432",
+}
+CENTRAL_POOL_SIZE = 8
+REMOTE_POOL_SIZE = 4
+REMOTE_POOL_IDLE_SECONDS = 10 * 60
+
+# Query cache lifetimes (seconds; None = until invalidated or evicted)
+MILLS_TTL = 60 * 60
+MACHINES_TTL = 60 * 60
+PROGRAM_DETAIL_TTL = 60 * 60
+ROLLS_TODAY_TTL = 60
+ROLLS_RECENT_TTL = 5 * 60  # yesterday: rolls still running at midnight finish later
+ROLLS_PAST_TTL = None
+BANDWIDTH_TTL = 60
+QUERY_CACHE_SIZE = 512
+
+RESULT_PAGE_SIZE = 5000  # rows converted per step by the columnar selects
+ROLL_PAGE_SIZE = 2000  # rows per round trip of the roll range cursor
+EXCLUDED_ROLL_STATUSES = (1,)
+
+RollRecord = namedtuple(
+    "RollRecord",
+    ["roll_number", "roll_name", "machineprgdtl_id", "roll_start_date", "roll_end_date", "roll_sts_id"],
+)
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 pool shared by every Streamlit session and worker thread.
+    Connections are opened lazily, run in autocommit mode, and a connection that
+    dropped (VPN blip, server restart) is discarded and the call retried once.
+    Callers block while all maxconn connections are in use. in_use and
+    last_used change under _lock, so close_if_idle never closes a busy pool; a
+    closed pool reopens on its next connection().
+    """
+
+    def __init__(self, maxconn, **connect_kwargs):
+        self.maxconn = maxconn
+        self.connect_kwargs = connect_kwargs
+        self._pool = psycopg2.pool.ThreadedConnectionPool(0, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.last_used = time.time()
+
+    @contextmanager
+    def connection(self):
+        waited = time.perf_counter()
+        self._slots.acquire()
+        with self._lock:
+            if self._pool is None:
+                self._pool = psycopg2.pool.ThreadedConnectionPool(0, self.maxconn, **self.connect_kwargs)
+            pool = self._pool
+            self.in_use += 1
+        conn = None
+        broken = False
+        try:
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+            metrics.observe("db.pool_wait", time.perf_counter() - waited)
+            if not conn.autocommit:
+                conn.autocommit = True
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if conn is not None:
+                pool.putconn(conn, close=broken or bool(conn.closed))
+            with self._lock:
+                self.in_use -= 1
+                self.last_used = time.time()
+            self._slots.release()
+
+    def run(self, fn):
+        """Call fn(conn) with a pooled connection; retried once on a dropped connection."""
+        for attempt in range(2):
+            try:
+                with self.connection() as conn:
+                    return fn(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                if attempt:
+                    raise
+
+    def close_if_idle(self, idle_seconds, now=None):
+        """Close every connection if none is in use and none was for idle_seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.in_use or now - self.last_used <= idle_seconds:
+                return False
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            return True
+
+
+class QueryCache:
+    """
+    Process-wide cache of query results with a TTL per entry.
+    Keys are tuples such as ("rolls", ip, date); invalidate(*prefix) drops every
+    key starting with prefix. Failed or empty results are not cached.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = {}  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, ttl, loader):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (entry[0] is None or entry[0] > now):
+                metrics.increment("db.cache_hits", query=key[0])
+                return entry[1]
+
+        metrics.increment("db.cache_misses", query=key[0])
+        with metrics.span("db.load", query=key[0]) as span:
+            value = loader()
+            span.count = len(value) if hasattr(value, "__len__") else 0
+        if value:
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    self._evict(now)
+                self._entries[key] = (None if ttl is None else now + ttl, value)
+        return value
+
+    def _evict(self, now):
+        expired = [k for k, (expires, _) in self._entries.items() if expires is not None and expires <= now]
+        for key in expired:
+            del self._entries[key]
+        # Still full: drop the oldest insertions
+        for key in list(self._entries)[:max(0, len(self._entries) - self.max_entries + 1)]:
+            del self._entries[key]
+
+    def invalidate(self, *prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k[:len(prefix)] == prefix]:
+                del self._entries[key]
+
+
+query_cache = QueryCache()
+
+
+def roll_range_query(statuses=None, exclude_statuses=EXCLUDED_ROLL_STATUSES, program_ids=None, order_by="roll_number DESC"):
+    """
+    SQL + params builder for rolls that started or ended in [start, end).
+    Each predicate gets its own UNION branch, so both are plain range
+    conditions that an index on roll_start_date / roll_end_date can serve
+    (one OR across the two columns forces a sequential scan of roll_details).
+    The query takes the range as %(start)s / %(end)s.
+    """
+    filters = []
+    params = {}
+    if statuses:
+        filters.append("roll_sts_id = ANY(%(statuses)s)")
+        params["statuses"] = list(statuses)
+    if exclude_statuses:
+        filters.append("roll_sts_id <> ALL(%(exclude_statuses)s)")
+        params["exclude_statuses"] = list(exclude_statuses)
+    if program_ids:
+        filters.append("machineprgdtl_id = ANY(%(program_ids)s)")
+        params["program_ids"] = list(program_ids)
+    extra = "".join(f" AND {f}" for f in filters)
+
+    columns = ", ".join(RollRecord._fields)
+    query = f"""
+        SELECT {columns} FROM roll_details
+        WHERE roll_start_date >= %(start)s AND roll_start_date < %(end)s{extra}
+        UNION
+        SELECT {columns} FROM roll_details
+        WHERE roll_end_date >= %(start)s AND roll_end_date < %(end)s{extra}
+        ORDER BY {order_by}
+    """
+    return query, params
+
+
+def roll_dates(roll, start_date, end_date):
+    """
+    Days of [start_date, end_date] the roll ran on, i.e. the date folders its
+    data can be under. A roll that is still running runs through end_date.
+    """
+    def day(value, default):
+        if value is None:
+            return default
+        return value.date() if isinstance(value, datetime.datetime) else value
+
+    first = max(day(roll.roll_start_date, start_date), start_date)
+    last = min(day(roll.roll_end_date, end_date), end_date)
+    return [first + datetime.timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def rolls_ttl(selected_date):
+    if isinstance(selected_date, datetime.datetime):
+        selected_date = selected_date.date()
+    age = (datetime.date.today() - selected_date).days
+    if age <= 0:
+        return ROLLS_TODAY_TTL
+    if age == 1:
+        return ROLLS_RECENT_TTL
+    return ROLLS_PAST_TTL
+
+
+_central_pool = None
+_remote_pools = {}
+_pools_lock = threading.Lock()
+
+
+def central_pool():
+    global _central_pool
+    with _pools_lock:
+        if _central_pool is None:
+            _central_pool = ConnectionPool(CENTRAL_POOL_SIZE, **CENTRAL_DB, **KEEPALIVE_KWARGS)
+        return _central_pool
+
+
+def remote_pool(ip, database, user, password, port):
+    """Pool for one machine database; pools idle for REMOTE_POOL_IDLE_SECONDS are closed."""
+    key = (ip, int(port), database, user)
+    with _pools_lock:
+        now = time.time()
+        for other, pool in list(_remote_pools.items()):
+            if other != key and pool.close_if_idle(REMOTE_POOL_IDLE_SECONDS, now):
+                del _remote_pools[other]
+        if key not in _remote_pools:
+            _remote_pools[key] = ConnectionPool(
+                REMOTE_POOL_SIZE, host=ip, database=database, user=user, password=password,
+                port=port, connect_timeout=10, **KEEPALIVE_KWARGS,
+            )
+        return _remote_pools[key]
+
+
+# Server-side prepared statements ($n placeholders), see Execute.select_prepared
+PREPARED_QUERIES = {
+    "machine_details_by_mill": """
+        SELECT * FROM public.machine_details
+        WHERE milldetails_id = $1
+        ORDER BY machinedetail_id ASC
+    """,
+    "machine_details_all": """
+        SELECT * FROM public.machine_details
+        ORDER BY milldetails_id ASC, machinedetail_id ASC
+    """,
+}
+
+
+@lru_cache(maxsize=64)
+def record_type(columns):
+    """Tuple-backed row type for a column list (invalid names become _0, _1, ...)."""
+    return namedtuple("Record", columns, rename=True)
+
+
+def read_result(cur, shape="dicts", page_size=RESULT_PAGE_SIZE):
+    """
+    Convert an executed cursor's rows to one of:
+      dicts   - list of {column: value} (what Execute.select returns)
+      records - list of namedtuples, one shared type per column list
+      frame   - pandas DataFrame
+      columns - {column: numpy array}
+    frame/columns are built page_size rows at a time instead of one dict per row.
+    """
+    columns = tuple(d[0] for d in cur.description)
+    if shape == "dicts":
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+    if shape == "records":
+        return list(map(record_type(columns)._make, cur.fetchall()))
+
+    frames = []
+    while True:
+        rows = cur.fetchmany(page_size)
+        if not rows:
+            break
+        frames.append(pd.DataFrame.from_records(rows, columns=columns))
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    if shape == "frame":
+        return frame
+    if shape == "columns":
+        return {column: frame[column].to_numpy() for column in frame.columns}
+    raise ValueError(f"unknown result shape: {shape}")
 
 
 class Execute:
+    # Statements already PREPAREd, per pooled connection
+    _prepared = weakref.WeakKeyDictionary()
+    _prepared_lock = threading.Lock()
+
     def __init__(self):
-        self.keepalive_kwargs = {
-            "keepalives": 1,
-            "keepalives_idle": 30,
-            "keepalives_interval": 5,
-            "keepalives_count": 5,
-        }
-        self.conn = self.connect()
+        self.pool = self.connect()
 
     def connect(self):
-        conn = psycopg2.connect(
-            database="central_database",
-            user="postgres",
-            password="55555",
-            host="100.121.194.26",
-            port="5432",
-            **self.keepalive_kwargs,
-        )
-        conn.autocommit = True
-        return conn
-
-    def select(self, query):
+        return central_pool()
+
+    def _select(self, query, params, shape):
+        def run(conn):
+            cur = conn.cursor()
+            cur.execute(query, params)
+            result = read_result(cur, shape)
+            cur.close()
+            return result
+
         try:
-            cur = self.conn.cursor()
-            cur.execute(query)
-            rows = [
-                {cur.description[i][0]: value for i, value in enumerate(row)}
-                for row in cur.fetchall()
-            ]
+            with metrics.span("db.select", shape=shape) as span:
+                result = self.pool.run(run)
+                span.count = len(result) if shape != "columns" else 0
+            return result
+
+        except Exception as e:
+            print("Error:", str(e))
+            traceback.print_exc()
+            return False
+
+    def select(self, query, params=None):
+        return self._select(query, params, "dicts")
+
+    def select_prepared(self, name, params=(), shape="dicts"):
+        """
+        Run PREPARED_QUERIES[name]. The statement is prepared once per pooled
+        connection, so repeated calls skip parsing and planning on the server.
+        """
+        def run(conn):
+            cur = conn.cursor()
+            with self._prepared_lock:
+                prepared = self._prepared.setdefault(conn, set())
+            if name not in prepared:
+                cur.execute(f"PREPARE {name} AS {PREPARED_QUERIES[name]}")
+                prepared.add(name)
+            if params:
+                cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", tuple(params))
+            else:
+                cur.execute(f"EXECUTE {name}")
+            result = read_result(cur, shape)
             cur.close()
-            return rows
+            return result
+
+        try:
+            with metrics.span("db.prepared", query=name) as span:
+                result = self.pool.run(run)
+                span.count = len(result) if shape != "columns" else 0
+            return result
+
+        except Exception as e:
+            print("Error:", str(e))
+            traceback.print_exc()
+            return False
+
+    def write(self, query, params=None):
+        """Run an INSERT/UPDATE/DDL statement; returns True on success."""
+        def run(conn):
+            cur = conn.cursor()
+            cur.execute(query, params)
+            cur.close()
+            return True
+
+        try:
+            return self.pool.run(run)
 
         except Exception as e:
             print("Error:", str(e))
@@ -46,6 +391,9 @@ class Execute:
             return False
 
 class Fetch_data:
+    upload_history_ready = False
+    bandwidth_table_ready = False
+
     def __init__(self):
         self.execute = Execute()
         
@@ -56,7 +404,7 @@ class Fetch_data:
                 FROM public.mill_details
                 ORDER BY milldetails_id ASC           
             """
-            result = self.execute.select(query)
+            result = query_cache.get_or_load(("mills",), MILLS_TTL, lambda: self.execute.select(query))
             return result
             
         except Exception as e:
@@ -65,19 +413,146 @@ class Fetch_data:
     
     def fetch_machine_details(self, milldetails_id):
         try:
-            query = f"""
-                SELECT * 
-                FROM public.machine_details
-                WHERE milldetails_id = {milldetails_id}
-                ORDER BY machinedetail_id ASC 
-            """
-            result = self.execute.select(query)
+            result = query_cache.get_or_load(
+                ("machines", milldetails_id), MACHINES_TTL,
+                lambda: self.execute.select_prepared("machine_details_by_mill", (milldetails_id,)),
+            )
             return result
         
         except Exception as e:
             print("Error in fetch_machine_details:", e)
             return None
 
+    def fetch_machine_table(self, milldetails_id=None, shape="records"):
+        """
+        machine_details of one mill (or all mills) as namedtuples, or with
+        shape="frame" / "columns" as a DataFrame / column arrays for reporting.
+        Record lists are cached like fetch_machine_details.
+        """
+        if milldetails_id is None:
+            name, params = "machine_details_all", ()
+        else:
+            name, params = "machine_details_by_mill", (milldetails_id,)
+        try:
+            if shape != "records":
+                return self.execute.select_prepared(name, params, shape=shape)
+            return query_cache.get_or_load(
+                ("machines", milldetails_id, shape), MACHINES_TTL,
+                lambda: self.execute.select_prepared(name, params, shape=shape),
+            )
+
+        except Exception as e:
+            print("Error in fetch_machine_table:", e)
+            return None
+
+    def ensure_upload_history_table(self):
+        """One row per finished upload run, used to estimate upload times per storage unit."""
+        if Fetch_data.upload_history_ready:
+            return True
+        Fetch_data.upload_history_ready = self.execute.write("""
+            CREATE TABLE IF NOT EXISTS public.upload_throughput (
+                id           BIGSERIAL PRIMARY KEY,
+                mill_name    TEXT NOT NULL,
+                machine_name TEXT NOT NULL,
+                mode         TEXT NOT NULL,
+                files        INTEGER NOT NULL,
+                bytes        BIGINT NOT NULL,
+                seconds      DOUBLE PRECISION NOT NULL,
+                finished_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE INDEX IF NOT EXISTS upload_throughput_unit_idx
+                ON public.upload_throughput (mill_name, machine_name, finished_at DESC);
+        """)
+        return Fetch_data.upload_history_ready
+
+    def record_upload_throughput(self, mill_name, machine_name, mode, files, nbytes, seconds):
+        try:
+            if not self.ensure_upload_history_table():
+                return False
+            return self.execute.write("""
+                INSERT INTO public.upload_throughput (mill_name, machine_name, mode, files, bytes, seconds)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (mill_name, machine_name, mode, int(files), int(nbytes), float(seconds)))
+
+        except Exception as e:
+            print("Error in record_upload_throughput:", e)
+            return False
+
+    def fetch_upload_throughput(self, mill_name, machine_name, limit=30):
+        """Most recent upload runs of one storage unit (newest first)."""
+        try:
+            if not self.ensure_upload_history_table():
+                return []
+            query = """
+                SELECT mode, files, bytes, seconds, finished_at
+                FROM public.upload_throughput
+                WHERE mill_name = %s AND machine_name = %s
+                ORDER BY finished_at DESC
+                LIMIT %s
+            """
+            return self.execute.select(query, (mill_name, machine_name, int(limit))) or []
+
+        except Exception as e:
+            print("Error in fetch_upload_throughput:", e)
+            return []
+
+    def ensure_bandwidth_table(self):
+        """Upload bandwidth limits: one row per mill link (machine_name '') and per storage unit."""
+        if Fetch_data.bandwidth_table_ready:
+            return True
+        Fetch_data.bandwidth_table_ready = self.execute.write("""
+            CREATE TABLE IF NOT EXISTS public.upload_bandwidth (
+                mill_name     TEXT NOT NULL,
+                machine_name  TEXT NOT NULL DEFAULT '',
+                shift_mbps    DOUBLE PRECISION NOT NULL DEFAULT 0,
+                offshift_mbps DOUBLE PRECISION NOT NULL DEFAULT 0,
+                windows       TEXT NOT NULL DEFAULT '',
+                ramp_minutes  DOUBLE PRECISION NOT NULL DEFAULT 0,
+                updated_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (mill_name, machine_name)
+            );
+        """)
+        return Fetch_data.bandwidth_table_ready
+
+    def fetch_bandwidth_settings(self, mill_name):
+        """{machine_name ('' = the mill link): row} of one mill."""
+        def load():
+            if not self.ensure_bandwidth_table():
+                return None
+            rows = self.execute.select("""
+                SELECT machine_name, shift_mbps, offshift_mbps, windows, ramp_minutes
+                FROM public.upload_bandwidth
+                WHERE mill_name = %s
+            """, (mill_name,))
+            return {row["machine_name"]: row for row in rows} if rows is not None else None
+
+        try:
+            return query_cache.get_or_load(("bandwidth", mill_name), BANDWIDTH_TTL, load) or {}
+
+        except Exception as e:
+            print("Error in fetch_bandwidth_settings:", e)
+            return {}
+
+    def save_bandwidth_settings(self, mill_name, machine_name, shift_mbps, offshift_mbps, windows="", ramp_minutes=0):
+        try:
+            if not self.ensure_bandwidth_table():
+                return False
+            saved = self.execute.write("""
+                INSERT INTO public.upload_bandwidth
+                    (mill_name, machine_name, shift_mbps, offshift_mbps, windows, ramp_minutes)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (mill_name, machine_name) DO UPDATE SET
+                    shift_mbps = EXCLUDED.shift_mbps, offshift_mbps = EXCLUDED.offshift_mbps,
+                    windows = EXCLUDED.windows, ramp_minutes = EXCLUDED.ramp_minutes, updated_at = now()
+            """, (mill_name, machine_name or "", float(shift_mbps), float(offshift_mbps), windows or "",
+                  float(ramp_minutes)))
+            query_cache.invalidate("bandwidth", mill_name)
+            return saved
+
+        except Exception as e:
+            print("Error in save_bandwidth_settings:", e)
+            return False
+
 class RemoteFetchData:
     def __init__(self, ip, database="knitting", user="postgres", password="55555", port=5432):
         self.ip = ip
@@ -85,83 +560,124 @@ class RemoteFetchData:
         self.user = user
         self.password = password
         self.port = port
-        self.conn = self.connect()
+        self.pool = self.connect()
 
     def connect(self):
+        """Shared pool for this machine's database (cheap to call on every rerun)."""
         try:
-            conn = psycopg2.connect(
-                host=self.ip,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                port=self.port
-            )
-            conn.autocommit = True
-            return conn
+            return remote_pool(self.ip, self.database, self.user, self.password, self.port)
         except Exception as e:
             print(f"Failed to connect to remote DB at {self.ip}: {e}")
             traceback.print_exc()
             return None
 
   
-    def fetch_rolls_by_date(self, selected_date):
-        if not self.conn:
+    def fetch_rolls_by_date(self, selected_date, end_date=None):
+        """
+        RollRecords of rolls that started or ended on selected_date, newest
+        first. With an end_date after it, the
+        whole range through end_date (inclusive) is listed, oldest first, so a
+        roll crossing midnight or a week-long audit is one pick.
+        """
+        if not self.pool:
             print(f"No connection to remote DB at {self.ip}")
             return []
+        if end_date and end_date > selected_date:
+            key = ("rolls", self.ip, self.port, self.database, selected_date, end_date)
+            try:
+                return query_cache.get_or_load(
+                    key, rolls_ttl(end_date),
+                    lambda: list(self.fetch_rolls_in_range(selected_date, end_date)),
+                )
+            except Exception as e:
+                print(f"Error fetching rolls from {self.ip}: {e}")
+                traceback.print_exc()
+                return []
         try:
-            cur = self.conn.cursor()
-
             # Range: selected_date 00:00 → next day 00:00
             start_dt = datetime.datetime.combine(selected_date, datetime.time.min)
             end_dt = datetime.datetime.combine(selected_date + datetime.timedelta(days=1), datetime.time.min)
 
-            query = """
-                SELECT roll_number, roll_name, machineprgdtl_id
-                FROM roll_details
-                WHERE roll_sts_id != 1
-                AND (
-                        (roll_start_date >= %s AND roll_start_date < %s) OR
-                        (roll_end_date   >= %s AND roll_end_date   < %s)
-                    )
-                ORDER BY roll_number DESC;
-            """
-            cur.execute(query, (start_dt, end_dt, start_dt, end_dt))
-            rows = cur.fetchall()
-            cur.close()
-            return rows
+            query, params = roll_range_query()
+            params.update(start=start_dt, end=end_dt)
+
+            def run(conn):
+                cur = conn.cursor()
+                cur.execute(query, params)
+                rows = [RollRecord(*row) for row in cur.fetchall()]
+                cur.close()
+                return rows
+
+            key = ("rolls", self.ip, self.port, self.database, selected_date)
+            return query_cache.get_or_load(key, rolls_ttl(selected_date), lambda: self.pool.run(run))
         except Exception as e:
             print(f"Error fetching rolls from {self.ip}: {e}")
             traceback.print_exc()
             return []
 
 
+    def fetch_rolls_in_range(self, start_date, end_date, statuses=None, exclude_statuses=EXCLUDED_ROLL_STATUSES,
+                             program_ids=None, page_size=ROLL_PAGE_SIZE):
+        """
+        Yield RollRecords of rolls that started or ended between start_date and
+        end_date (both inclusive), oldest first.
+        Rows stream from a named (server-side) cursor page_size at a time, so
+        months of roll metadata never sit in memory at once. The generator holds
+        a pooled connection until it is exhausted or closed.
+        """
+        if not self.pool:
+            print(f"No connection to remote DB at {self.ip}")
+            return
+        start_dt = datetime.datetime.combine(start_date, datetime.time.min)
+        end_dt = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min)
+        query, params = roll_range_query(statuses, exclude_statuses, program_ids,
+                                         order_by="roll_start_date, roll_number")
+        params.update(start=start_dt, end=end_dt)
 
+        with self.pool.connection() as conn:
+            # Named cursors only live inside a transaction
+            conn.autocommit = False
+            cur = conn.cursor(name=f"rolls_{id(self):x}_{int(time.time() * 1000)}")
+            cur.itersize = page_size
+            try:
+                cur.execute(query, params)
+                while True:
+                    rows = cur.fetchmany(page_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield RollRecord(*row)
+            finally:
+                if not conn.closed:
+                    cur.close()
+                    conn.rollback()
+                    conn.autocommit = True
 
     def fetch_machine_program_detail(self, machineprgdtl_id):
         """
         Fetch details of a machine program given machineprgdtl_id.
         Returns a dict or None if not found.
         """
-        if not self.conn:
+        if not self.pool:
             print(f"No connection to remote DB at {self.ip}")
             return None
         try:
-            cur = self.conn.cursor()
-            cur.execute("""
-                SELECT *
-                FROM public.machine_program_details
-                WHERE machineprgdtl_id = %s
-                LIMIT 1;
-            """, (machineprgdtl_id,))
-            row = cur.fetchone()
-            cur.close()
-            if row:
+            def run(conn):
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT *
+                    FROM public.machine_program_details
+                    WHERE machineprgdtl_id = %s
+                    LIMIT 1;
+                """, (machineprgdtl_id,))
+                row = cur.fetchone()
                 colnames = [desc[0] for desc in cur.description]
-                return dict(zip(colnames, row))
-            else:
-                return None
+                cur.close()
+                return dict(zip(colnames, row)) if row else None
+
+            key = ("program_detail", self.ip, self.port, self.database, machineprgdtl_id)
+            return query_cache.get_or_load(key, PROGRAM_DETAIL_TTL, lambda: self.pool.run(run))
         except Exception as e:
             print(f"Error fetching machine program detail from {self.ip}: {e}")
-            import traceback
             traceback.print_exc()
             return None
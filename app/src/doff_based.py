@@ -3,17 +3,42 @@ import subprocess
 import streamlit as st
 import time,traceback
 import os
-import re
 import paramiko
+import pandas as pd
 from db import Fetch_data, RemoteFetchData
+from remote_manifest import build_doff_manifest, fetch_doff_summary, fetch_folder_tree
+from jobs import SCHEDULED, get_job_manager, upload_job, upload_mode
+from metrics import metrics
+from upload_schedule import off_shift_option
+from upload_eta import format_duration, load_throughput_model
 
 MDD_DIR = "/home/kniti/projects/knit-i/knitting-core/data"
 FDA_DIR = "/home/kniti/projects/knit-i/knitting-core/images"
 CLOUD_UPLOAD_DIR = "/home/kniti/MegaUpload"
+MAX_CACHED_LISTINGS = 32
 
 fetcher = Fetch_data()
 
 
+def image_reduction_options(key="reduce"):
+    """
+    "Reduce images" widgets; returns the transform dict for upload_job, or None
+    when the originals should be uploaded.
+    """
+    with st.expander("🗜️ Reduce images before upload"):
+        if not st.checkbox("Re-encode JPEGs on the storage unit", value=False, key=f"{key}_enabled"):
+            return None
+        quality = st.slider("JPEG quality", 40, 95, 85, key=f"{key}_quality")
+        max_dim = st.number_input("Maximum width/height (px, 0 = keep)", min_value=0, step=256, value=1280,
+                                  key=f"{key}_max_dim")
+        grayscale = st.checkbox("Grayscale", value=False, key=f"{key}_grayscale")
+        st.caption(
+            "Uploaded to a separate `reduced_*` folder next to the full-resolution images; "
+            "the bytes saved are shown on the job when it finishes."
+        )
+    return {"quality": quality, "max_dim": int(max_dim), "grayscale": grayscale}
+
+
 class DoffBasedZipHandler:
     def __init__(self, choice, roll_path, roll_number, roll_name,
                  selected_date, ssh_client, db, machineprgdtl_id,
@@ -77,83 +102,143 @@ class DoffBasedZipHandler:
     # -----------------------
     # OneDrive Upload
     # -----------------------
-    def upload_to_onedrive(self, remote_path, mill_name=None, machine_name=None, silent=False, **kwargs):
+    def _upload_options(self, data_label, min_doff, max_doff):
+        """Upload-mode widgets shared by the FDA and MDA flows."""
+        options = {"sync": False, "archive": None, "shard_mb": 0, "transform": None, "not_before": None}
+        mode = st.radio("Upload as", ["Tar archive shards", "Individual files"], horizontal=True)
+        if mode == "Tar archive shards":
+            options["shard_mb"] = st.number_input(
+                "Shard size (MB, 0 = single archive)", min_value=0, step=256, value=1024
+            )
+            date_str = (
+                self.selected_date.strftime("%Y-%m-%d")
+                if isinstance(self.selected_date, (datetime.date, datetime.datetime))
+                else str(self.selected_date)
+            )
+            options["archive"] = f"{self.roll_name}_{date_str}_{data_label}_doff{min_doff}-{max_doff}"
+            st.caption(
+                f"📦 Streamed on the storage unit as `{options['archive']}.tar[.NNN]` "
+                "(restore with `cat *.tar.* | tar -x`)"
+            )
+        else:
+            options["sync"] = st.checkbox("Skip files already in OneDrive (compare size + hash)", value=True)
+            if data_label == "FDA":
+                options["transform"] = image_reduction_options()
+        options["not_before"] = off_shift_option(getattr(self, "mill_name", None))
+        return options
+
+    def _throughput_model(self, mode="files"):
+        """Upload-time model of this storage unit, fitted from its past uploads."""
+        return load_throughput_model(fetcher, self.mill_name, self.machine_name, mode)
+
+    def _show_eta(self, files, nbytes, mode="files"):
+        """ETA from this unit's measured throughput and per-file overhead."""
+        try:
+            model = self._throughput_model(mode)
+            eta_sec = model.estimate(files, nbytes)
+            st.info(f"⏳ Estimated total upload time: ~{format_duration(eta_sec)} ({model.describe()})")
+        except Exception as e:
+            st.warning(f"⚠️ Could not calculate ETA dynamically: {e}")
+
+    # -----------------------
+    # Storage-side selection (storage_agent/file_select.py)
+    # -----------------------
+    def _cached_listing(self, date_folder, key, loader):
         """
-        Upload folder/file to OneDrive via remote bash script.
-        Clean output: progress bar, ETA, final summary only (unless silent=False).
+        Folder trees and doff summaries are kept for this browser session, so
+        widget changes do not query the storage unit again; "Rescan folders"
+        drops the entries of the current date folder.
         """
-        try:
-            if not remote_path:
-                if not silent:
-                    st.error("❌ No remote path provided.")
-                return False
-
-            mill_name = mill_name or kwargs.get("mill_name")
-            machine_name = machine_name or kwargs.get("machine_name")
-
-            if not mill_name or not machine_name:
-                if not silent:
-                    st.error("❌ Mill name and Machine name required.")
-                return False
-
-            if "onedrive_folder" in kwargs and not silent:
-                st.warning(f"⚠️ Ignoring legacy argument: onedrive_folder={kwargs['onedrive_folder']}")
-
-            remote_script = "/home/kniti/upload_to_onedrive.sh"
-            cmd = f"bash {remote_script} '{mill_name}' '{machine_name}' '{remote_path}'"
-
-            stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
-
-            buffer = ""
-            uploaded_files = 0
-            total_files = None
-
-            re_upload = re.compile(r"^⬆️ Uploading (.+) → (.+)$")
-            re_total = re.compile(r"^TOTAL_FILES=(\d+)$")
-
-            while True:
-                if stdout.channel.recv_ready():
-                    chunk = stdout.channel.recv(4096).decode("utf-8", errors="ignore")
-                    buffer += chunk
-                    while "\n" in buffer:
-                        line, buffer = buffer.split("\n", 1)
-                        line = line.strip()
-                        if not line:
-                            continue
-
-                        # Parse total files
-                        total_match = re_total.search(line)
-                        if total_match:
-                            total_files = int(total_match.group(1))
-                            continue
-
-                        # Parse file uploads
-                        upload_match = re_upload.match(line)
-                        if upload_match:
-                            uploaded_files += 1
-
-                if stdout.channel.exit_status_ready():
-                    break
-                time.sleep(0.2)
-
-            exit_status = stdout.channel.recv_exit_status()
-            if exit_status == 0:
-                if not silent:
-                    st.success(
-                        f"✅ Upload completed: /Backup/{mill_name}/{machine_name}\n"
-                        f"📦 {uploaded_files} files"
-                    )
-                return True
-            else:
-                error_output = stderr.read().decode().strip()
-                if not silent:
-                    st.error(f"❌ Remote script failed: {error_output}")
-                return False
+        key = (getattr(self.ssh_client, "host", None), date_folder) + key
+        cache = st.session_state.setdefault("storage_listings", {})
+        metrics.increment("listing.cache_hits" if key in cache else "listing.cache_misses", listing=key[2])
+        if key not in cache:
+            value = loader()
+            if value is None:
+                return None
+            if len(cache) >= MAX_CACHED_LISTINGS:
+                cache.clear()
+            cache[key] = value
+        return cache[key]
+
+    def _rescan_button(self, date_folder):
+        if st.button("🔄 Rescan folders"):
+            cache = st.session_state.setdefault("storage_listings", {})
+            for key in [k for k in cache if k[1] == date_folder]:
+                del cache[key]
+
+    def _folder_tree(self, date_folder, defects=False):
+        """{camera: [defect types]} of the date folder; {} if it does not exist."""
+        return self._cached_listing(
+            date_folder, ("tree", defects),
+            lambda: fetch_folder_tree(self.ssh_client, date_folder, defects),
+        )
 
-        except Exception as e:
-            if not silent:
-                st.error(f"❌ Upload process failed: {e}")
-            return False
+    def _doff_summary(self, date_folder, cameras, defects=None, exts=None):
+        """Per-doff histogram of the selection, computed on the storage unit."""
+        key = ("summary", tuple(cameras), tuple(defects or ()), tuple(exts or ()))
+
+        def load():
+            with st.spinner("Indexing files by doff on the storage unit..."):
+                return fetch_doff_summary(self.ssh_client, date_folder, cameras, defects, exts)
+
+        return self._cached_listing(date_folder, key, load)
+
+    def _extension_input(self, default=""):
+        text = st.text_input("File extensions (comma separated, empty = all)", value=default)
+        return [e.strip() for e in text.split(",") if e.strip()]
+
+    def _show_doff_histogram(self, summary):
+        frame = pd.DataFrame(
+            {"Files": summary.files, "MB": [b / 1024 ** 2 for b in summary.bytes]},
+            index=pd.Index(summary.doffs, name="Doff"),
+        )
+        note = f" · {summary.undoffed[0]} files without a doff id" if summary.undoffed[0] else ""
+        st.caption(
+            f"📊 {len(summary)} doffs ({summary.first}–{summary.last}) · "
+            f"{sum(summary.files)} files · {sum(summary.bytes) / 1024 ** 3:.2f} GB{note}"
+        )
+        files_tab, bytes_tab = st.tabs(["Files per doff", "MB per doff"])
+        files_tab.bar_chart(frame["Files"])
+        bytes_tab.bar_chart(frame["MB"])
+
+    def _doff_range_inputs(self, summary, columns=True):
+        """Min/max doff inputs defaulting to the indexed range; None when invalid."""
+        first, last = int(summary.first), int(summary.last)
+        if columns:
+            col1, col2 = st.columns(2)
+        else:
+            col1 = col2 = st
+        min_doff = col1.number_input("Enter Minimum Doff ID", min_value=0, step=1, value=first)
+        max_doff = col2.number_input("Enter Maximum Doff ID", min_value=0, step=1, value=last)
+        if min_doff > max_doff:
+            st.warning("⚠️ Invalid range")
+            return None
+        return min_doff, max_doff
+
+    def _upload_batch(self, manifest, mill_name, machine_name, sync=False, archive=None, shard_mb=0,
+                      transform=None, not_before=None):
+        """Queue the selected files as a background upload job; progress shows in the jobs panel."""
+        mode = upload_mode(archive, transform)
+        job = get_job_manager().submit(
+            archive or f"{self.roll_name} ({len(manifest)} files)",
+            mill_name, machine_name,
+            upload_job(
+                self.ssh_client, manifest, mill_name, machine_name, self._throughput_model(mode),
+                journal=str(self.roll_name), sync=sync, archive=archive, shard_mb=shard_mb,
+                transform=transform, history=fetcher,
+            ),
+            total_files=len(manifest), total_bytes=manifest.total_bytes, not_before=not_before,
+        )
+        queued = (
+            f"scheduled as job #{job.id} for {time.strftime('%a %H:%M', time.localtime(not_before))}"
+            if job.status == SCHEDULED else f"queued as job #{job.id}"
+        )
+        st.success(
+            f"🗂️ Upload {queued}. Follow it in the Upload jobs panel; "
+            "it keeps running if you change the selection or close this tab."
+        )
+        return job
 
     # -----------------------
     # FDA Workflow
@@ -177,90 +262,56 @@ class DoffBasedZipHandler:
         st.text(f"📂 Using roll/date folder: {date_folder}")
 
         ssh_client = self.ssh_client  # Ensure SSH client is set
+        self._rescan_button(date_folder)
 
         # -----------------------------
-        # Verify date folder exists
+        # Verify date folder exists and list cameras (one remote call)
         # -----------------------------
-        stdin, stdout, stderr = ssh_client.exec_command(
-            f"ls {os.path.join(fda_base_path, str(self.roll_name))}"
-        )
-        available_dates = stdout.read().decode().splitlines()
-        if selected_date_str not in available_dates:
-            st.warning(f"The folder is not available: {selected_date_str}")
+        tree = self._folder_tree(date_folder)
+        if tree is None:
+            st.error("❌ Could not list the date folder on the storage unit")
             return
-
-        # -----------------------------
-        # List cameras
-        # -----------------------------
-        stdin, stdout, stderr = ssh_client.exec_command(f"ls {date_folder}")
-        cameras = stdout.read().decode().splitlines()
-        if not cameras:
-            st.warning("No cameras found")
+        if not tree:
+            st.warning(f"The folder is not available: {selected_date_str}")
             return
+        cameras = list(tree)
 
         selected_cameras = st.multiselect("Select Cameras", cameras)
         if not selected_cameras:
             return
+        exts = self._extension_input("jpg")
 
         # -----------------------------
-        # Collect all images
+        # Doff histogram of the selection (filtered and counted on the storage unit)
         # -----------------------------
-        all_files = []
-        for cam in selected_cameras:
-            cam_path = os.path.join(date_folder, cam)
-            stdin, stdout, stderr = ssh_client.exec_command(
-                f"find {cam_path} -type f -name '*.jpg'"
-            )
-            files = stdout.read().decode().splitlines()
-            all_files.extend(files)
-
-        if not all_files:
+        summary = self._doff_summary(date_folder, selected_cameras, exts=exts)
+        if summary is None:
+            st.error("❌ Could not index the camera folders on the storage unit")
+            return
+        if not len(summary):
             st.warning("No files found")
             return
+        self._show_doff_histogram(summary)
 
         # -----------------------------
         # Doff range input
         # -----------------------------
-        col1, col2 = st.columns(2)
-        min_doff = col1.number_input("Enter Minimum Doff ID", min_value=0, step=1, value=0)
-        max_doff = col2.number_input("Enter Maximum Doff ID", min_value=0, step=1, value=0)
-        if min_doff > max_doff:
-            st.warning("⚠️ Invalid range")
+        doff_range = self._doff_range_inputs(summary)
+        if not doff_range:
             return
+        min_doff, max_doff = doff_range
 
-        # -----------------------------
-        # Filter files by Doff
-        # -----------------------------
-        def extract_doff(fname):
-            try:
-                return int(os.path.basename(fname).split("_")[3])
-            except Exception:
-                return None
-
-        files_in_range = [
-            f for f in all_files
-            if (d := extract_doff(f)) is not None and min_doff <= d <= max_doff
-        ]
-
+        # Totals of the range from the index (no listing per rerun)
+        files_in_range, total_bytes = summary.totals(min_doff, max_doff)
         if not files_in_range:
             st.warning(f"No files found in range {min_doff}–{max_doff}")
             return
 
-        st.success(f"✅ Found {len(files_in_range)} files in range {min_doff}–{max_doff}")
-        
-         # ✅ Calculate total size of filtered files
-        total_bytes = 0
-        for f in files_in_range:
-            stdin, stdout, stderr = ssh_client.exec_command(f"stat -c %s '{f}' || true")
-            size_out = stdout.read().decode().strip()
-            if size_out.isdigit():
-                total_bytes += int(size_out)
-
         size_mb = total_bytes / (1024 ** 2)
         size_gb = total_bytes / (1024 ** 3)
 
         st.success(
-            f"✅ Found {len(files_in_range)} files "
+            f"✅ Found {files_in_range} files "
             f"(~{size_mb:.2f} MB / {size_gb:.2f} GB) in range {min_doff}–{max_doff}"
         )
 
@@ -292,61 +343,22 @@ class DoffBasedZipHandler:
             st.warning(f"⚠️ Could not write program details TXT: {e}")
 
         # -----------------------------
-        # Calculate total ETA
-        # -----------------------------
-        try:
-            total_bytes = 0
-            for f in files_in_range:
-                stdin, stdout, stderr = ssh_client.exec_command(f"stat -c %s '{f}' || true")
-                size_out = stdout.read().decode().strip()
-                if size_out.isdigit():
-                    total_bytes += int(size_out)
-
-            upload_speed_bytes_per_sec = 5 * 1024 * 1024  # 5 MB/s
-            eta_sec = total_bytes / upload_speed_bytes_per_sec
-            eta_min = int(eta_sec // 60)
-            eta_rem_sec = int(eta_sec % 60)
-            st.info(
-                f"⏳ Estimated total upload time: ~{eta_min}m {eta_rem_sec}s "
-                f"at {upload_speed_bytes_per_sec/1024/1024:.1f} MB/s"
-            )
-
-        except Exception as e:
-            st.warning(f"⚠️ Could not calculate ETA dynamically: {e}")
-            
-        # -----------------------------
 # Upload button (clean, batched progress only)
 # -----------------------------
         mill_name = getattr(self, "mill_name", "DefaultMill")
         machine_name = getattr(self, "machine_name", "DefaultMachine")
 
+        options = self._upload_options("FDA", min_doff, max_doff)
+        # ETA from this unit's measured throughput (no longer a fixed 5 MB/s)
+        self._show_eta(files_in_range, total_bytes, upload_mode(options["archive"], options["transform"]))
         if st.button("Start Upload to OneDrive"):
-            total_files = len(files_in_range)
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            start_time = time.time()
-
-            for idx, fpath in enumerate(files_in_range, 1):
-                # Upload without printing per-file messages
-                self.upload_to_onedrive(
-                    remote_path=fpath,
-                    mill_name=mill_name,
-                    machine_name=machine_name,
-                    silent=True  # 👈 suppress per-file logs
-                )
-
-                elapsed = int(time.time() - start_time)
-                progress_bar.progress(idx / total_files)
-                status_text.text(
-                    f"⬆️ Uploading... {idx}/{total_files} files | Elapsed: {elapsed}s"
-                )
-
-            # ✅ After upload completes
-            total_elapsed = int(time.time() - start_time)
-            progress_bar.progress(1.0)
-            status_text.text(
-                f"✅ Upload completed: {total_files} files uploaded in {total_elapsed}s"
+            range_manifest = build_doff_manifest(
+                ssh_client, date_folder, selected_cameras, min_doff, max_doff, exts=exts
             )
+            if not range_manifest:
+                st.error("❌ Could not list the files of this doff range")
+                return
+            self._upload_batch(range_manifest, mill_name, machine_name, **options)
 
 
     # -----------------------
@@ -368,43 +380,30 @@ class DoffBasedZipHandler:
         st.text(f"📂 Using roll/date folder: {date_folder}")
 
         ssh_client = self.ssh_client  # Ensure self.ssh_client is set
+        self._rescan_button(date_folder)
 
         # -----------------------------
-        # Step 0: Verify date folder exists
+        # Step 0: Verify date folder, list cameras and their defect types (one remote call)
         # -----------------------------
-        stdin, stdout, stderr = ssh_client.exec_command(f"ls {os.path.join(base_path, self.roll_name)}")
-        available_dates = stdout.read().decode().splitlines()
-        if selected_date_str not in available_dates:
+        tree = self._folder_tree(date_folder, defects=True)
+        if tree is None:
+            st.error("❌ Could not list the date folder on the storage unit")
+            return
+        if not tree:
             st.warning(f"The folder is not available: {selected_date_str}")
             return
 
         # -----------------------------
-        # Step 1: List cameras
+        # Step 1: Select cameras
         # -----------------------------
-        stdin, stdout, stderr = ssh_client.exec_command(f"ls {date_folder}")
-        cameras = stdout.read().decode().splitlines()
-        if not cameras:
-            st.warning("No cameras found")
-            return
-
-        selected_cameras = st.multiselect("Select Cameras", cameras)
+        selected_cameras = st.multiselect("Select Cameras", list(tree))
         if not selected_cameras:
             return
 
         # -----------------------------
-        # Step 2: Collect defect types
+        # Step 2: Select defect types
         # -----------------------------
-        union_defects = set()
-        cam_defect_paths = {}
-        for cam in selected_cameras:
-            defect_label_path = os.path.join(date_folder, cam, "defect", "labels")
-            cam_defect_paths[cam] = defect_label_path
-
-            stdin, stdout, stderr = ssh_client.exec_command(f"ls {defect_label_path}")
-            defects = stdout.read().decode().splitlines()
-            union_defects.update(defects)
-
-        union_defects = sorted(union_defects)
+        union_defects = sorted({d for cam in selected_cameras for d in tree[cam]})
         if not union_defects:
             st.warning("No defect labels found")
             return
@@ -412,97 +411,41 @@ class DoffBasedZipHandler:
         selected_defects = st.multiselect("Select Defect Types", union_defects)
         if not selected_defects:
             return
+        exts = self._extension_input()
 
         # -----------------------------
-        # Step 3: Doff range input
+        # Step 3: Doff histogram of the selected defect folders (computed on the storage unit)
         # -----------------------------
-        min_doff = st.number_input("Enter Minimum Doff ID", min_value=0, step=1, value=0)
-        max_doff = st.number_input("Enter Maximum Doff ID", min_value=0, step=1, value=0)
-        if min_doff > max_doff:
-            st.warning("⚠️ Invalid range")
+        summary = self._doff_summary(date_folder, selected_cameras, selected_defects, exts)
+        if summary is None:
+            st.error("❌ Could not index the defect folders on the storage unit")
             return
+        if not len(summary):
+            st.warning("No files found")
+            return
+        self._show_doff_histogram(summary)
 
         # -----------------------------
-        # Step 4: Collect files
+        # Step 4: Doff range input
         # -----------------------------
-        all_files = []
-        for cam in selected_cameras:
-            for defect in selected_defects:
-                defect_path = os.path.join(cam_defect_paths[cam], defect)
-                stdin, stdout, stderr = ssh_client.exec_command(f"ls {defect_path}")
-                files = stdout.read().decode().splitlines()
-                for f in files:
-                    if f:
-                        all_files.append(os.path.join(defect_path, f))
-
-        def extract_doff(fname):
-            parts = fname.split("_")
-            if len(parts) < 4:
-                return None
-            try:
-                return int(parts[3])
-            except ValueError:
-                return None
-
-        # Debug: print all doff IDs
-        all_doff_ids = [extract_doff(os.path.basename(f)) for f in all_files]
-
-        # Filter files based on user input
-        files_in_range = [
-            f for f in all_files
-            if (d := extract_doff(os.path.basename(f))) is not None
-            and min_doff <= d <= max_doff
-        ]
-
-
-
+        doff_range = self._doff_range_inputs(summary, columns=False)
+        if not doff_range:
+            return
+        min_doff, max_doff = doff_range
 
+        files_in_range, total_bytes = summary.totals(min_doff, max_doff)
         if not files_in_range:
             st.warning(f"No files in range {min_doff}–{max_doff}")
             return
 
-        st.success(f"✅ Found {len(files_in_range)} files in range {min_doff}–{max_doff}")
-
-         # ✅ Calculate total size of filtered files
-        total_bytes = 0
-        for f in files_in_range:
-            stdin, stdout, stderr = ssh_client.exec_command(f"stat -c %s '{f}' || true")
-            size_out = stdout.read().decode().strip()
-            if size_out.isdigit():
-                total_bytes += int(size_out)
-
         size_mb = total_bytes / (1024 ** 2)
         size_gb = total_bytes / (1024 ** 3)
 
         st.success(
-            f"✅ Found {len(files_in_range)} files "
+            f"✅ Found {files_in_range} files "
             f"(~{size_mb:.2f} MB / {size_gb:.2f} GB) in range {min_doff}–{max_doff}"
         )
-       # -----------------------------
-# Step 5: Calculate ETA (before upload)
-# -----------------------------
-        try:
-            num_files = len(files_in_range)
-            st.info(f"📂 Total files to upload: {num_files}")
-
-            # Get total bytes for all files
-            total_bytes = 0
-            for f in files_in_range:
-                stdin, stdout, stderr = ssh_client.exec_command(f"stat -c %s '{f}' || true")
-                size_out = stdout.read().decode().strip()
-                if size_out.isdigit():
-                    total_bytes += int(size_out)
-
-            # Upload speed in bytes/sec (can be dynamic later)
-            upload_speed_bytes_per_sec = 5 * 1024 * 1024  # 5 MB/s
-
-            eta_sec = total_bytes / upload_speed_bytes_per_sec
-            eta_min = int(eta_sec // 60)
-            eta_rem_sec = int(eta_sec % 60)
-            st.info(f"⏳ Estimated total upload time: ~{eta_min}m {eta_rem_sec}s at {upload_speed_bytes_per_sec/1024/1024:.1f} MB/s")
-
-        except Exception as e:
-            st.warning(f"⚠️ Could not calculate ETA dynamically: {e}")
+        st.info(f"📂 Total files to upload: {files_in_range}")
 
 
 # -----------------------------
@@ -511,31 +454,15 @@ class DoffBasedZipHandler:
         mill_name = getattr(self, "mill_name", "DefaultMill")
         machine_name = getattr(self, "machine_name", "DefaultMachine")
 
+        options = self._upload_options("MDD", min_doff, max_doff)
+        # ETA from this unit's measured throughput (no longer a fixed 5 MB/s)
+        self._show_eta(files_in_range, total_bytes, upload_mode(options["archive"], options["transform"]))
         if st.button("Start Upload to OneDrive"):
-            total_files = len(files_in_range)
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            start_time = time.time()
-
-            for idx, fpath in enumerate(files_in_range, 1):
-                # Upload without printing per-file messages
-                self.upload_to_onedrive(
-                    remote_path=fpath,
-                    mill_name=mill_name,
-                    machine_name=machine_name,
-                    silent=True  # 👈 suppress per-file logs
-                )
-
-                elapsed = int(time.time() - start_time)
-                progress_bar.progress(idx / total_files)
-                status_text.text(
-                    f"⬆️ Uploading... {idx}/{total_files} files | Elapsed: {elapsed}s"
-                )
-
-            # ✅ After upload completes
-            total_elapsed = int(time.time() - start_time)
-            progress_bar.progress(1.0)
-            status_text.text(
-                f"✅ Upload completed: {total_files} files uploaded in {total_elapsed}s"
+            range_manifest = build_doff_manifest(
+                ssh_client, date_folder, selected_cameras, min_doff, max_doff, selected_defects, exts
             )
+            if not range_manifest:
+                st.error("❌ Could not list the files of this doff range")
+                return
+            self._upload_batch(range_manifest, mill_name, machine_name, **options)
 
@@ -0,0 +1,257 @@
+# fleet.py
+
+import datetime
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+
+from db import RemoteFetchData
+from doff_based import FDA_DIR, MDD_DIR
+from jobs import POLL_SECONDS, get_job_manager
+from metrics import metrics
+from remote_manifest import build_remote_manifests
+from remote_upload import BatchUploader, install_storage_agent
+from ssh_pool import get_ssh_pool, read_storage_ip
+from upload_schedule import get_bandwidth_manager, off_shift_option
+
+DEFAULT_FLEET_WORKERS = 4
+MAX_FLEET_WORKERS = 16
+
+
+# -----------------------
+# Fleet run
+# -----------------------
+class MachineProgress:
+    """Per-machine state of a fleet run, shown as one row of the progress table."""
+
+    def __init__(self, machine_name, ip_address):
+        self.machine_name = machine_name
+        self.ip_address = ip_address
+        self.state = "queued"
+        self.rolls = 0
+        self.total_files = 0
+        self.total_bytes = 0
+        self.done = 0
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self.message = ""
+
+    def row(self):
+        pct = self.bytes_done / self.total_bytes if self.total_bytes else (1.0 if self.state == "done" else 0.0)
+        return {
+            "Machine": self.machine_name,
+            "IP": self.ip_address,
+            "State": self.state,
+            "Rolls": self.rolls,
+            "Files": f"{self.done}/{self.total_files}",
+            "Uploaded": self.uploaded,
+            "Skipped": self.skipped,
+            "Failed": self.failed,
+            "MB": round(self.bytes_done / 1024 ** 2, 1),
+            "Progress": f"{pct * 100:.0f}%",
+            "Message": self.message,
+        }
+
+
+class FleetRun:
+    """
+    Collect one day's MDD or FDA data from every machine of a mill.
+    Machines are processed by a bounded pool; each worker takes the machine's
+    pooled SSH session and storage tunnel (ssh_pool.py) and uploads every roll
+    of the day from that storage unit.
+    """
+
+    def __init__(self, mill_name, machines, selected_date, data_type, workers=DEFAULT_FLEET_WORKERS, sync=True):
+        self.mill_name = mill_name
+        self.date_str = (
+            selected_date.strftime("%Y-%m-%d")
+            if isinstance(selected_date, (datetime.date, datetime.datetime))
+            else str(selected_date)
+        )
+        self.selected_date = selected_date
+        self.data_type = data_type
+        self.base_path = MDD_DIR if data_type == "MDD" else FDA_DIR
+        self.workers = max(1, min(workers, MAX_FLEET_WORKERS))
+        self.sync = sync
+        self.machines = [
+            (m, MachineProgress(m.machine_name, m.ip_address))
+            for m in machines if m.ip_address
+        ]
+        self._lock = threading.Lock()
+
+    def rows(self):
+        return [progress.row() for _, progress in self.machines]
+
+    def _sync_job(self, job):
+        """Roll the per-machine counters up into the job shown in the jobs panel."""
+        with self._lock:
+            progress = [p for _, p in self.machines]
+            job.total_files = sum(p.total_files for p in progress)
+            job.total_bytes = sum(p.total_bytes for p in progress)
+            job.done = sum(p.done for p in progress)
+            job.uploaded = sum(p.uploaded for p in progress)
+            job.skipped = sum(p.skipped for p in progress)
+            job.failed = sum(p.failed for p in progress)
+            job.bytes_done = sum(p.bytes_done for p in progress)
+
+    def _collect_machine(self, machine_info, progress, job, result):
+        try:
+            progress.state = "connecting"
+            pool = get_ssh_pool()
+            machine = pool.machine(progress.ip_address)
+            storage_ip = read_storage_ip(machine)
+            if not storage_ip:
+                raise RuntimeError("no storage_ip in coreconfig.ini")
+            storage = pool.storage(progress.ip_address, storage_ip)
+            install_storage_agent(storage)
+
+            progress.state = "listing"
+            db = RemoteFetchData(progress.ip_address)
+            rolls = db.fetch_rolls_by_date(self.selected_date)
+
+            # One find per roll, run concurrently over the storage transport
+            listed = build_remote_manifests(storage, {
+                str(roll.roll_name): os.path.join(self.base_path, str(roll.roll_name), self.date_str)
+                for roll in rolls
+            })
+            manifests = [(roll_name, manifest) for roll_name, manifest in listed.items() if len(manifest)]
+            progress.rolls = len(manifests)
+            progress.total_files = sum(len(m) for _, m in manifests)
+            progress.total_bytes = sum(m.total_bytes for _, m in manifests)
+            self._sync_job(job)
+            if not manifests:
+                progress.state = "done"
+                progress.message = "no data for this date"
+                return
+
+            progress.state = "uploading"
+            uploader = BatchUploader(storage)
+            with get_bandwidth_manager().shaped(self.mill_name, progress.machine_name, storage):
+                self._upload_rolls(uploader, manifests, machine_info, progress, job, result)
+
+            progress.state = "failed" if progress.failed else "done"
+            progress.message = f"{progress.failed} files failed" if progress.failed else ""
+        except Exception as e:
+            print(f"Fleet collection failed on {progress.machine_name} ({progress.ip_address}): {e}")
+            traceback.print_exc()
+            progress.state = "failed"
+            progress.message = str(e)
+        finally:
+            self._sync_job(job)
+
+    def _upload_rolls(self, uploader, manifests, machine_info, progress, job, result):
+        """One upload run per roll, under the unit's share of the mill link."""
+        for roll_name, manifest in manifests:
+            progress.message = roll_name
+
+            def on_progress(done, total, path, outcome, manifest=manifest):
+                progress.done += 1
+                setattr(progress, outcome, getattr(progress, outcome) + 1)
+                progress.bytes_done += manifest.size_of(path)
+                self._sync_job(job)
+
+            with metrics.span("upload.batch", mode="fleet") as span:
+                run = uploader.upload_files(
+                    manifest.paths, self.mill_name, machine_info.machine_name,
+                    progress_callback=on_progress, journal=roll_name, sync=self.sync,
+                )
+                span.count = len(run["uploaded"])
+                span.nbytes = sum(manifest.size_of(p) for p in run["uploaded"])
+            metrics.record_engine(run["metrics"], mill=self.mill_name, machine=machine_info.machine_name)
+            with self._lock:
+                for key in ("uploaded", "skipped", "failed"):
+                    result[key].extend(run[key])
+            if run["exit_status"] == -1:
+                raise RuntimeError(f"upload run for {roll_name} aborted")
+
+    def run(self, job):
+        """Job function for JobManager.submit."""
+        result = {"uploaded": [], "skipped": [], "failed": [], "exit_status": 0}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fleet") as pool:
+            for machine_info, progress in self.machines:
+                pool.submit(self._collect_machine, machine_info, progress, job, result)
+
+        unreachable = [p.machine_name for _, p in self.machines if p.state == "failed" and not p.failed]
+        if unreachable:
+            job.message = f"{len(unreachable)} machines failed: {', '.join(unreachable)}"
+        return result
+
+
+def start_fleet_collection(mill_name, machines, selected_date, data_type, workers=DEFAULT_FLEET_WORKERS, sync=True,
+                           not_before=None):
+    """Queue a fleet run as one background job (from not_before on, if given); returns the job."""
+    run = FleetRun(mill_name, machines, selected_date, data_type, workers, sync)
+    job = get_job_manager().submit(
+        f"Fleet {data_type} {run.date_str} ({len(run.machines)} machines)",
+        mill_name, "all machines", run.run, not_before=not_before,
+    )
+    job.fleet = run
+    return job
+
+
+# -----------------------
+# UI
+# -----------------------
+def _render_fleet_runs():
+    runs = [job for job in get_job_manager().list() if getattr(job, "fleet", None)]
+    if not runs:
+        st.caption("No fleet collections yet.")
+        return
+    for job in runs:
+        run = job.fleet
+        st.markdown(f"**#{job.id} {run.mill_name} · {run.date_str} · {run.data_type}** — {job.status}")
+        st.progress(job.fraction)
+        st.caption(
+            f"{job.done}/{job.total_files} files · {job.bytes_done / 1024 ** 3:.2f} / "
+            f"{job.total_bytes / 1024 ** 3:.2f} GB · {job.uploaded} uploaded · {job.skipped} skipped · "
+            f"{job.failed} failed" + (f" · {job.message}" if job.message else "")
+        )
+        st.dataframe(pd.DataFrame(run.rows()), hide_index=True, use_container_width=True)
+
+
+if hasattr(st, "fragment"):
+    _render_fleet_runs = st.fragment(run_every=POLL_SECONDS)(_render_fleet_runs)
+
+
+def fleet_page(fetcher):
+    """Mill + date + data type → one background collection over every machine of the mill."""
+    st.header("🏭 Fleet Collection")
+
+    mill_list = fetcher.fetch_mill_details()
+    if not mill_list:
+        st.error("No mills found in the database.")
+        return
+    mill_map = {mill["mill_name"]: mill["milldetails_id"] for mill in mill_list}
+    mill_name = st.selectbox("Select Mill", ["--Select--"] + list(mill_map.keys()), key="fleet_mill")
+    if mill_name == "--Select--":
+        _render_fleet_runs()
+        return
+
+    machines = fetcher.fetch_machine_table(mill_map[mill_name]) or []
+    machines = [m for m in machines if m.ip_address]
+    if not machines:
+        st.warning("No machines with an IP address found for this mill.")
+        return
+    st.caption(f"{len(machines)} machines: " + ", ".join(str(m.machine_name) for m in machines))
+
+    selected_date = st.date_input(
+        "Collection Date", value=datetime.date.today(),
+        min_value=datetime.date(2020, 1, 1), max_value=datetime.date.today(), key="fleet_date",
+    )
+    data_type = st.selectbox("Select Data Type", ["MDD", "FDA"], key="fleet_data_type")
+    workers = st.slider("Machines in parallel", 1, MAX_FLEET_WORKERS, DEFAULT_FLEET_WORKERS, key="fleet_workers")
+    sync = st.checkbox("Skip files already in OneDrive (compare size + hash)", value=True, key="fleet_sync")
+    not_before = off_shift_option(mill_name, key="fleet_defer")
+
+    if st.button(f"Start collection on all {len(machines)} machines"):
+        job = start_fleet_collection(mill_name, machines, selected_date, data_type, workers, sync, not_before)
+        st.success(f"🗂️ Fleet collection {job.status} as job #{job.id}")
+
+    st.subheader("Progress")
+    _render_fleet_runs()
@@ -1,13 +1,22 @@
 # fullrole_based.py
 
 import time
-import os,re
+import os
 import streamlit as st
 import paramiko
 from db import Fetch_data, RemoteFetchData
+from remote_manifest import build_remote_manifest
+from ssh_pool import run_concurrently
+from remote_upload import parse_sync_check, sync_check_command
+from jobs import SCHEDULED, get_job_manager, upload_job, upload_mode
+from metrics import metrics
+from doff_based import image_reduction_options
+from upload_schedule import off_shift_option
+from upload_eta import format_duration, load_throughput_model
 from config import config
 import subprocess
 
+fetcher = Fetch_data()
 
 
 class FullRollZipper:
@@ -23,84 +32,29 @@ class FullRollZipper:
         exit_status = stdout.channel.recv_exit_status()
         return exit_status, stdout.read().decode(), stderr.read().decode()
 
-    def upload_to_onedrive(self, remote_path, mill_name=None, machine_name=None, silent=False, **kwargs):
-        """
-        Upload folder/file to OneDrive via remote bash script.
-        Clean output: progress bar, ETA, final summary only (unless silent=False).
-        """
-        try:
-            if not remote_path:
-                if not silent:
-                    st.error("❌ No remote path provided.")
-                return False
-
-            mill_name = mill_name or kwargs.get("mill_name")
-            machine_name = machine_name or kwargs.get("machine_name")
-
-            if not mill_name or not machine_name:
-                if not silent:
-                    st.error("❌ Mill name and Machine name required.")
-                return False
-
-            if "onedrive_folder" in kwargs and not silent:
-                st.warning(f"⚠️ Ignoring legacy argument: onedrive_folder={kwargs['onedrive_folder']}")
-
-            remote_script = "/home/kniti/upload_to_onedrive.sh"
-            cmd = f"bash {remote_script} '{mill_name}' '{machine_name}' '{remote_path}'"
-
-            stdin, stdout, stderr = self.ssh_client.exec_command(cmd)
-
-            buffer = ""
-            uploaded_files = 0
-            total_files = None
-
-            re_upload = re.compile(r"^⬆️ Uploading (.+) → (.+)$")
-            re_total = re.compile(r"^TOTAL_FILES=(\d+)$")
-
-            while True:
-                if stdout.channel.recv_ready():
-                    chunk = stdout.channel.recv(4096).decode("utf-8", errors="ignore")
-                    buffer += chunk
-                    while "\n" in buffer:
-                        line, buffer = buffer.split("\n", 1)
-                        line = line.strip()
-                        if not line:
-                            continue
-
-                        # Parse total files
-                        total_match = re_total.search(line)
-                        if total_match:
-                            total_files = int(total_match.group(1))
-                            continue
-
-                        # Parse file uploads
-                        upload_match = re_upload.match(line)
-                        if upload_match:
-                            uploaded_files += 1
-
-                if stdout.channel.exit_status_ready():
-                    break
-                time.sleep(0.2)
-
-            exit_status = stdout.channel.recv_exit_status()
-            if exit_status == 0:
-                if not silent:
-                    st.success(
-                        f"✅ Upload completed: /Backup/{mill_name}/{machine_name}\n"
-                        f"📦 {uploaded_files} files"
-                    )
-                return True
-            else:
-                error_output = stderr.read().decode().strip()
-                if not silent:
-                    st.error(f"❌ Remote script failed: {error_output}")
-                return False
-
-        except Exception as e:
-            if not silent:
-                st.error(f"❌ Upload process failed: {e}")
-            return False
-
+    def _upload_batch(self, manifest, mill_name, machine_name, label="files", journal=None, sync=False,
+                      transform=None, not_before=None, after=None):
+        """Queue every file in the manifest as a background upload job (after another job, if given)."""
+        job = get_job_manager().submit(
+            f"{journal or 'roll'} ({len(manifest)} {label})",
+            mill_name, machine_name,
+            upload_job(
+                self.ssh_client, manifest, mill_name, machine_name,
+                load_throughput_model(fetcher, mill_name, machine_name, upload_mode(transform=transform)),
+                journal=journal, sync=sync, transform=transform, history=fetcher,
+            ),
+            total_files=len(manifest), total_bytes=manifest.total_bytes, not_before=not_before, after=after,
+        )
+        if after is not None:
+            st.success(f"🗂️ Upload of {len(manifest)} {label} queued as job #{job.id}, after job #{after.id}")
+        elif job.status == SCHEDULED:
+            st.success(
+                f"🌙 Upload of {len(manifest)} {label} scheduled as job #{job.id} for "
+                f"{time.strftime('%a %H:%M', time.localtime(not_before))}"
+            )
+        else:
+            st.success(f"🗂️ Upload of {len(manifest)} {label} queued as job #{job.id}")
+        return job
 
     def handle_full_roll_zip(self, roll_path, rolls, selected_roll, data_type, mill_name, machine_name):
         st.header("📤 Direct Upload to OneDrive (No Zipping)")
@@ -116,17 +70,40 @@ class FullRollZipper:
 
         # --- 🔍 Count all files and total size BEFORE upload ---
         try:
-            status, count_out, _ = self._exec(f"find '{folder_to_upload}' -type f | wc -l")
-            status, size_out, _ = self._exec(f"du -sb '{folder_to_upload}' | cut -f1")
-
-            total_files = int(count_out.strip()) if count_out.strip().isdigit() else 0
-            total_bytes = int(size_out.strip()) if size_out.strip().isdigit() else 0
+            # Count, size and background-sync state run concurrently on the storage transport
+            with metrics.span("fullroll.precount") as span:
+                results = {r.key: r for r in run_concurrently(self.ssh_client, {
+                    "count": f"find '{folder_to_upload}' -type f | wc -l",
+                    "size": f"du -sb '{folder_to_upload}' | cut -f1",
+                    "synced": sync_check_command(mill_name, machine_name, folder_to_upload, roll_name),
+                })}
+                count_out, size_out = results["count"].stdout, results["size"].stdout
+                synced = parse_sync_check(results["synced"].stdout) if results["synced"].ok else None
+
+                total_files = int(count_out.strip()) if count_out.strip().isdigit() else 0
+                total_bytes = int(size_out.strip()) if size_out.strip().isdigit() else 0
+                span.count, span.nbytes = total_files, total_bytes
 
             size_gb = total_bytes / (1024 ** 3)
             size_mb = total_bytes / (1024 ** 2)
 
             if total_files > 0:
                 st.info(f"📦 Total files: {total_files} | Total size: {size_gb:.2f} GB ({size_mb:.0f} MB)")
+                if synced and synced["synced"]:
+                    if synced["pending"] == 0:
+                        st.success(f"✅ All {synced['synced']} files are already synced to OneDrive")
+                    else:
+                        st.info(
+                            f"🔄 {synced['synced']} files already synced; {synced['pending']} left "
+                            f"({synced['pending_bytes'] / 1024 ** 2:.0f} MB)"
+                        )
+                    # Only the remainder has to be uploaded
+                    total_files, total_bytes = synced["pending"], synced["pending_bytes"]
+                model = load_throughput_model(fetcher, mill_name, machine_name)
+                st.info(
+                    f"⏳ Estimated total upload time: ~{format_duration(model.estimate(total_files, total_bytes))} "
+                    f"({model.describe()})"
+                )
             else:
                 st.warning("⚠️ No files found in this roll.")
                 return
@@ -135,49 +112,32 @@ class FullRollZipper:
             return
 
         # --- 🚀 Upload button ---
+        sync = st.checkbox("Skip files already in OneDrive (compare size + hash)", value=True)
+        transform = image_reduction_options("fullroll_reduce") if data_type == "FDA" else None
+        not_before = off_shift_option(mill_name, key="fullroll_defer")
         if st.button("Upload Directly"):
+            # One remote find for path/size/mtime of every file in the roll
+            roll_manifest = build_remote_manifest(self.ssh_client, folder_to_upload)
+            json_job = None
 
             # --- Special handling for MDD (only JSONs in defect/labels) ---
             if data_type == "MDD":
                 try:
                     st.info("📂 Collecting JSON files from `defect/labels`...")
 
-                    cmd_find_jsons = f"find '{folder_to_upload}' -type f -path '*/defect/labels/*.json'"
-                    status, out, err = self._exec(cmd_find_jsons)
-                    if status != 0:
-                        st.error(f"❌ Failed to list JSON files: {err}")
-                        return
-
-                    json_files = out.strip().splitlines()
+                    json_manifest = roll_manifest.filter(
+                        lambda e: "/defect/labels/" in e.path and e.path.endswith(".json")
+                    )
+                    json_files = json_manifest.paths
                     if not json_files:
                         st.warning("⚠️ No JSON files found in defect/labels.")
                         return
 
-                    st.info(f"📄 Found {len(json_files)} JSON files. Starting upload...")
-
-                    # Upload with progress bar
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    uploaded_bytes = 0
-                    start_time = time.time()
-                    total_json_bytes = sum(os.path.getsize(f) for f in json_files if os.path.exists(f))
+                    st.info(f"📄 Found {len(json_files)} JSON files.")
 
-                    for idx, jf in enumerate(json_files, 1):
-                        fsize = os.path.getsize(jf) if os.path.exists(jf) else 0
-                        self.upload_to_onedrive(jf, mill_name, machine_name, silent=True)
-
-                        uploaded_bytes += fsize
-                        elapsed = int(time.time() - start_time)
-                        pct = uploaded_bytes / total_json_bytes if total_json_bytes > 0 else idx / len(json_files)
-
-                        progress_bar.progress(min(1.0, pct))
-                        status_text.text(
-                            f"⬆️ {idx}/{len(json_files)} JSON files | "
-                            f"{uploaded_bytes / (1024**2):.1f} MB uploaded | "
-                            f"Elapsed: {elapsed}s"
-                        )
-
-                    st.success(f"🌐 Uploaded {len(json_files)} JSON files from defect/labels to OneDrive ✅")
+                    # Runs in the background; progress is in the Upload jobs panel
+                    json_job = self._upload_batch(json_manifest, mill_name, machine_name, label="JSON files", journal=roll_name,
+                                       sync=sync, not_before=not_before)
 
                 except Exception as e:
                     st.error(f"❌ Failed to upload JSON files: {e}")
@@ -190,8 +150,7 @@ class FullRollZipper:
                         (r for r in rolls if f"{r[0]} - {r[1]}" == selected_roll), None
                     )
                     if selected_roll_obj:
-                        _, _, machineprgdtl_id = selected_roll_obj
-                        details = self.db.fetch_machine_program_detail(machineprgdtl_id)
+                        details = self.db.fetch_machine_program_detail(selected_roll_obj.machineprgdtl_id)
                         if details:
                             program_details_file = os.path.join(folder_to_upload, "program_details.txt")
                             program_details_dir = os.path.dirname(program_details_file)
@@ -211,35 +170,14 @@ class FullRollZipper:
 
             # --- Upload remaining files to OneDrive (for FDA or general upload) ---
             try:
-                st.info(f"📤 Uploading `{roll_name}` → OneDrive...")
-
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                uploaded_bytes = 0
-                start_time = time.time()
-
-                # Get all files
-                status, file_list_out, _ = self._exec(f"find '{folder_to_upload}' -type f")
-                files = file_list_out.strip().split("\n") if file_list_out else []
-
-                for idx, fpath in enumerate(files, 1):
-                    fsize = os.path.getsize(fpath) if os.path.exists(fpath) else 0
-
-                    # Upload file
-                    self.upload_to_onedrive(fpath, mill_name, machine_name, silent=True)
-
-                    uploaded_bytes += fsize
-                    elapsed = int(time.time() - start_time)
-                    pct = uploaded_bytes / total_bytes if total_bytes > 0 else idx / len(files)
-
-                    progress_bar.progress(min(1.0, pct))
-                    status_text.text(
-                        f"⬆️ {idx}/{len(files)} files | "
-                        f"{uploaded_bytes / (1024**2):.1f} MB uploaded | "
-                        f"Elapsed: {elapsed}s"
-                    )
-
-                st.success("🌐 Folder uploaded to OneDrive successfully ✅")
+                st.info(f"📤 Queueing `{roll_name}` for upload to OneDrive...")
+
+                # Get all files (program_details.txt may have been added since the first listing).
+                # For MDD this runs after the JSON job; the shared journal skips the JSONs it sent.
+                roll_manifest = build_remote_manifest(self.ssh_client, folder_to_upload)
+                self._upload_batch(roll_manifest, mill_name, machine_name, journal=roll_name, sync=sync,
+                                   transform=transform, not_before=not_before, after=json_job)
+                st.info("ℹ️ The upload keeps running if you change the selection or close this tab.")
 
             except Exception as e:
                 st.error(f"❌ Error during upload: {e}")
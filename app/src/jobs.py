@@ -0,0 +1,315 @@
+# jobs.py
+
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from metrics import metrics
+from remote_upload import BatchUploader
+from upload_eta import LiveEta, format_duration
+from upload_schedule import get_bandwidth_manager
+
+SCHEDULED = "scheduled"
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+DEFAULT_JOB_WORKERS = 2
+KEEP_FINISHED_JOBS = 50
+POLL_SECONDS = 2
+
+STATUS_ICONS = {SCHEDULED: "🌙", QUEUED: "🕒", RUNNING: "⬆️", DONE: "✅", FAILED: "❌", CANCELLED: "🚫"}
+
+
+class UploadJob:
+    """
+    One background upload. The worker thread updates the counters as files
+    finish; the UI only reads them, so a rerun, refresh or closed tab does not
+    touch the transfer.
+    """
+
+    def __init__(self, job_id, label, mill_name, machine_name, total_files=0, total_bytes=0):
+        self.id = job_id
+        self.label = label
+        self.mill_name = mill_name
+        self.machine_name = machine_name
+        self.status = QUEUED
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done = 0
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self.eta_seconds = None
+        self.message = ""
+        self.result = None
+        self.fn = None
+        self.future = None
+        self.timer = None
+        self.not_before = None
+        self.after = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in (SCHEDULED, QUEUED, RUNNING)
+
+    @property
+    def fraction(self):
+        if self.status == DONE:
+            return 1.0
+        if self.total_bytes > 0:
+            return min(1.0, self.bytes_done / self.total_bytes)
+        return min(1.0, self.done / self.total_files) if self.total_files else 0.0
+
+    @property
+    def elapsed(self):
+        if not self.started_at:
+            return 0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobManager:
+    """
+    Process-wide upload queue (one per Streamlit server, see get_job_manager).
+    Jobs run on a small thread pool, so several rolls and machines can be queued
+    back to back and keep running without a browser attached. A job submitted
+    with not_before waits as "scheduled" (without taking a worker) until then,
+    e.g. the mill's next off-shift window. A job submitted with after waits,
+    also without a worker, until that job has finished.
+    """
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, keep_finished=KEEP_FINISHED_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload-job")
+        self.keep_finished = keep_finished
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, label, mill_name, machine_name, fn, total_files=0, total_bytes=0, not_before=None,
+               after=None):
+        """Queue fn(job); it runs on a worker thread and returns a result dict."""
+        with self._lock:
+            job = UploadJob(next(self._ids), label, mill_name, machine_name, total_files, total_bytes)
+            job.fn = fn
+            job.after = after
+            self._jobs[job.id] = job
+            self._prune()
+            delay = not_before - time.time() if not_before else 0
+            if delay > 0:
+                job.status = SCHEDULED
+                job.not_before = not_before
+                job.timer = threading.Timer(delay, self._enqueue, args=(job,))
+                job.timer.daemon = True
+                job.timer.start()
+        if job.status == QUEUED:
+            self._enqueue(job)
+        return job
+
+    def _enqueue(self, job):
+        with self._lock:
+            if job.status not in (SCHEDULED, QUEUED) or job.future:
+                return
+            if job.timer:
+                job.timer.cancel()
+            job.status = QUEUED
+            if job.after and job.after.active:
+                # Handed to the executor by _release_followers once job.after finishes
+                return
+            job.future = self.executor.submit(self._run, job)
+
+    def _release_followers(self, job):
+        with self._lock:
+            followers = [j for j in self._jobs.values() if j.after is job and j.status == QUEUED]
+        for follower in followers:
+            self._enqueue(follower)
+
+    def start_now(self, job_id):
+        """Queue a scheduled job without waiting for its start time."""
+        job = self._jobs.get(job_id)
+        if job and job.status == SCHEDULED:
+            self._enqueue(job)
+            return True
+        return False
+
+    def _run(self, job):
+        # Checked and set under the lock, so a concurrent cancel either wins or fails
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            job.result = job.fn(job) or {}
+            failed = len(job.result.get("failed", []))
+            if job.result.get("exit_status") == -1:
+                job.status, job.message = FAILED, "Upload run aborted (see server log)"
+            elif failed:
+                job.status, job.message = FAILED, f"{failed} files failed to upload"
+            else:
+                job.status = DONE
+        except Exception as e:
+            print(f"Upload job {job.id} failed: {e}")
+            traceback.print_exc()
+            job.status, job.message = FAILED, str(e)
+        finally:
+            job.finished_at = time.time()
+            self._release_followers(job)
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started yet; returns True on success."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return False
+            if job.status == SCHEDULED:
+                job.timer.cancel()
+            elif not (job.status == QUEUED and (job.future is None or job.future.cancel())):
+                return False
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        self._release_followers(job)
+        return True
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        """All known jobs, newest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.id, reverse=True)
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if not j.active]
+        for job in sorted(finished, key=lambda j: j.id)[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+
+def upload_mode(archive=None, transform=None):
+    """Throughput-history mode of an upload ("archive", "reduced" or "files")."""
+    if archive:
+        return "archive"
+    return "reduced" if transform else "files"
+
+
+def upload_job(ssh_client, manifest, mill_name, machine_name, model, journal=None, sync=False,
+               archive=None, shard_mb=0, transform=None, history=None):
+    """
+    Build the job function for one BatchUploader run over a RemoteManifest.
+    Progress and a live ETA are kept on the job; with history (a Fetch_data)
+    the achieved throughput is recorded for future estimates. Re-encoded runs
+    are recorded as mode "reduced", by the bytes actually sent. The run and the
+    engine's Graph request statistics go to the diagnostics metrics.
+    """
+    mode = upload_mode(archive, transform)
+
+    def run(job):
+        eta = LiveEta(model, len(manifest), manifest.total_bytes)
+
+        def on_progress(done, total, path, outcome):
+            size = manifest.size_of(path)
+            if outcome == "uploaded":
+                eta.update(size)
+            else:
+                eta.skip(size)
+            job.done, job.total_files = done, total
+            setattr(job, outcome, getattr(job, outcome) + 1)
+            job.bytes_done += size
+            job.eta_seconds = eta.remaining()
+
+        start_time = time.time()
+        # The unit's share of the mill link is (re)written for as long as this runs
+        with get_bandwidth_manager().shaped(mill_name, machine_name, ssh_client), \
+                metrics.span("upload.batch", mode=mode) as span:
+            result = BatchUploader(ssh_client).upload_files(
+                manifest.paths, mill_name, machine_name, progress_callback=on_progress,
+                journal=journal, sync=sync, archive=archive, shard_mb=shard_mb, transform=transform,
+            )
+            span.count = len(result["uploaded"])
+            span.nbytes = sum(manifest.size_of(p) for p in result["uploaded"])
+            if result["exit_status"] == -1:
+                span.error = "batch failed"
+        metrics.record_engine(result["metrics"], mill=mill_name, machine=machine_name)
+        bytes_in, bytes_out = result["transform_bytes"] or (0, 0)
+        if bytes_in:
+            saved = bytes_in - bytes_out
+            job.message = (
+                f"images re-encoded {bytes_in / 1024 ** 2:.0f} → {bytes_out / 1024 ** 2:.0f} MB, "
+                f"{saved / 1024 ** 2:.0f} MB saved ({saved / bytes_in:.0%})"
+            )
+        if history and result["uploaded"] and result["exit_status"] != -1:
+            sent = sum(manifest.size_of(p) for p in result["uploaded"])
+            if bytes_in:
+                sent = int(sent * bytes_out / bytes_in)
+            history.record_upload_throughput(
+                mill_name, machine_name, mode, len(result["uploaded"]), sent, time.time() - start_time,
+            )
+        return result
+
+    return run
+
+
+def _render_jobs():
+    manager = get_job_manager()
+    jobs = manager.list()
+    st.subheader("📋 Upload jobs")
+    if not jobs:
+        st.caption("No upload jobs yet.")
+        return
+
+    for job in jobs:
+        st.markdown(
+            f"{STATUS_ICONS[job.status]} **#{job.id} {job.label}**  \n"
+            f"{job.mill_name} / {job.machine_name} · {job.status}"
+        )
+        if job.status == RUNNING:
+            st.progress(job.fraction)
+            eta = f" · ETA ~{format_duration(job.eta_seconds)}" if job.eta_seconds is not None else ""
+            st.caption(
+                f"{job.done}/{job.total_files} files · {job.bytes_done / 1024 ** 2:.1f} MB · "
+                f"{format_duration(job.elapsed)} elapsed{eta}"
+            )
+        elif job.status == SCHEDULED:
+            st.caption(f"Starts {time.strftime('%a %H:%M', time.localtime(job.not_before))} (off-shift window)")
+            col1, col2 = st.columns(2)
+            if col1.button("Start now", key=f"start_job_{job.id}"):
+                manager.start_now(job.id)
+            if col2.button("Cancel", key=f"cancel_job_{job.id}"):
+                manager.cancel(job.id)
+        elif job.status == QUEUED:
+            if job.after and job.after.active:
+                st.caption(f"Starts after job #{job.after.id}")
+            if st.button("Cancel", key=f"cancel_job_{job.id}"):
+                manager.cancel(job.id)
+        elif job.finished_at:
+            st.caption(
+                f"{job.uploaded} uploaded · {job.skipped} skipped · {job.failed} failed · "
+                f"{format_duration(job.elapsed)}" + (f" · {job.message}" if job.message else "")
+            )
+
+
+# Re-render only the jobs panel every POLL_SECONDS (Streamlit >= 1.37); older
+# versions refresh it on the next interaction.
+if hasattr(st, "fragment"):
+    _render_jobs = st.fragment(run_every=POLL_SECONDS)(_render_jobs)
+
+
+def show_jobs_panel():
+    """Job list with live progress; safe to call on every rerun."""
+    _render_jobs()
+    if not hasattr(st, "fragment"):
+        st.button("🔄 Refresh jobs")
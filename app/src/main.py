@@ -3,12 +3,17 @@ import time
 import datetime
 import os
 import streamlit as st
-import paramiko
-from db import Fetch_data, RemoteFetchData
+from db import Fetch_data, RemoteFetchData, query_cache, roll_dates
 from doff_based import DoffBasedZipHandler
 from fullrole_based import FullRollZipper
+from fleet import fleet_page
+from jobs import show_jobs_panel
+from metrics import metrics, show_diagnostics_panel
 from config import config
 import subprocess,traceback
+from remote_upload import install_storage_agent, start_sync_agent, stop_sync_agent, sync_agent_status
+from ssh_pool import get_ssh_pool
+from upload_schedule import bandwidth_settings
 
 fetcher = Fetch_data()
 
@@ -28,19 +33,11 @@ class MachineManager:
         if "storage_ssh" not in st.session_state:
             st.session_state.storage_ssh = None
 
+    @metrics.timed("machine.connect")
     def connect_ssh(self, ip, username="supernova", password="Charlemagne@1", timeout=15):
-        """Connect to a remote machine via Paramiko SSH."""
+        """Pooled SSH session to a machine, reused across reruns and browser sessions."""
         try:
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            client.connect(
-                hostname=ip,
-                username=username,
-                password=password,
-                timeout=timeout,
-                look_for_keys=False,
-                allow_agent=False
-            )
+            client = get_ssh_pool().machine(ip, username=username, password=password, timeout=timeout)
             st.success(f"Successfully connected to {ip}")
             return client
         except Exception as e:
@@ -48,23 +45,12 @@ class MachineManager:
             print(traceback.format_exc())
             return None
 
+    @metrics.timed("machine.connect_storage")
     def connect_storage_through_machine(self, machine_client, storage_ip, username="supernova", password="Charlemagne@1"):
-        """Connect to storage unit through an already-connected machine (jump host)."""
+        """Pooled storage-unit session tunnelled through the machine (jump host)."""
         try:
-            transport = machine_client.get_transport()
-            dest_addr = (storage_ip, 22)
-            local_addr = ("127.0.0.1", 0)
-            channel = transport.open_channel("direct-tcpip", dest_addr, local_addr)
-
-            storage_client = paramiko.SSHClient()
-            storage_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            storage_client.connect(
-                hostname=storage_ip,
-                username=username,
-                password=password,
-                sock=channel,
-                look_for_keys=False,
-                allow_agent=False
+            storage_client = get_ssh_pool().storage(
+                machine_client.machine_ip, storage_ip, username=username, password=password
             )
             st.success(f"Successfully connected to Storage Unit {storage_ip} via machine")
             return storage_client
@@ -167,6 +153,7 @@ class MachineManager:
                     print(traceback.format_exc())
                     return
 
+    @metrics.timed("machine.prepare_script")
     def copy_upload_script(self):
         """Ensure upload_to_onedrive.sh exists on remote storage (always replace)."""
         local_script = os.path.join(os.path.dirname(__file__), "upload_to_onedrive.sh")
@@ -204,34 +191,107 @@ class MachineManager:
         except Exception as e:
             st.error(f"❌ Failed to copy upload_to_onedrive.sh: {e}")
 
+        self.copy_storage_agent()
+
+    def copy_storage_agent(self):
+        """Ship the Python upload engine (storage_agent/*.py), skipping files already up to date."""
+        try:
+            stale = install_storage_agent(st.session_state.storage_ssh)
+            if stale:
+                st.success(f"📂 Upload engine updated ({len(stale)} files)")
+        except Exception as e:
+            st.error(f"❌ Failed to copy upload engine: {e}")
+
+
+    def sync_agent_controls(self, mill_info, machine_info):
+        """Start/stop the storage unit's background sync (sync_agent.py) and show its progress."""
+        ssh = st.session_state.storage_ssh
+        status = sync_agent_status(ssh)
+        with st.expander("🔄 Background sync", expanded=bool(status and status["running"])):
+            if status is None:
+                st.warning("⚠️ Could not read the sync agent status")
+                return
+            if status["running"]:
+                st.success(
+                    f"Syncing {status.get('mill')}/{status.get('machine')} (pid {status['running']}) · "
+                    f"{status.get('uploaded', 0)} uploaded · {status.get('failed', 0)} failed · "
+                    f"{status.get('queued_files', 0)} files waiting"
+                )
+                if st.button("Stop background sync"):
+                    stop_sync_agent(ssh)
+                    st.info("Sync agent stopped")
+                return
+            st.caption(
+                "Uploads new images and data as they are written, so collecting a roll later "
+                "only has to confirm that everything is synced."
+            )
+            max_mbps = st.number_input("Upload rate cap (MB/s, 0 = unlimited)", min_value=0.0, value=2.0, step=0.5)
+            if st.button("Start background sync"):
+                pid = start_sync_agent(ssh, mill_info["mill_name"], machine_info["machine_name"], max_mbps)
+                if pid:
+                    st.success(f"✅ Sync agent started (pid {pid})")
+                else:
+                    st.error("❌ Could not start the sync agent (see ~/onedrive_upload_logs/sync_agent.out)")
 
     def select_roll(self, ip_address):
-        """Dropdown to select roll from DB by date."""
+        """Dropdown to select roll from DB by date, or by a date range (end date optional)."""
         db = RemoteFetchData(ip_address)
-        selected_date = st.date_input(
+        col1, col2 = st.columns(2)
+        selected_date = col1.date_input(
             "Select Roll Start Date",
             value=None,
             min_value=datetime.date(2020, 1, 1),
             max_value=datetime.date.today()
         )
+        end_date = col2.date_input(
+            "Through Date (optional)",
+            value=None,
+            min_value=selected_date or datetime.date(2020, 1, 1),
+            max_value=datetime.date.today(),
+            help="Lists every roll that started or ended in the range, e.g. rolls crossing midnight",
+        )
+        if selected_date and st.button("🔄 Reload rolls"):
+            query_cache.invalidate("rolls", ip_address)
 
-        rolls = db.fetch_rolls_by_date(selected_date) if selected_date else []
+        rolls = db.fetch_rolls_by_date(selected_date, end_date) if selected_date else []
         if not rolls:
             st.warning("No rolls found for selected date")
-            return None, None, None
+            return None, None, None, []
 
         roll_options = [f"{r[0]} - {r[1]}" for r in rolls]
         selected_roll = st.selectbox("Select Roll Number & Name", ["--Select--"] + roll_options)
 
-        return db, selected_date, selected_roll
+        # In a range the roll's data sits under the days it ran on, not under the start date
+        roll = next((r for r in rolls if f"{r[0]} - {r[1]}" == selected_roll), None)
+        if roll and end_date and end_date > selected_date:
+            dates = roll_dates(roll, selected_date, end_date) or [selected_date]
+            if len(dates) > 1:
+                selected_date = st.selectbox("Roll Date Folder", dates)
+            else:
+                selected_date = dates[0]
+
+        return db, selected_date, selected_roll, rolls
 
 # -------------------- Streamlit App -------------------- # 
 
 def main():
     st.title("Data Collection Software")
 
+    # Uploads run as background jobs; the panel polls their progress.
+    with st.sidebar:
+        show_jobs_panel()
+        show_diagnostics_panel()
+        # Mill, machine and roll lists are cached (db.query_cache); force a re-query
+        if st.button("🔄 Reload lists from database"):
+            query_cache.invalidate()
+
     manager = MachineManager()
 
+    mode = st.radio("Mode", ["Single machine", "Fleet (all machines of a mill)"], horizontal=True)
+    if mode != "Single machine":
+        fleet_page(manager.fetcher)
+        st.stop()
+
     # -------------------------------
     # Step 1: Select Mill & Machine
     # -------------------------------
@@ -253,12 +313,14 @@ def main():
     # -------------------------------
     st.header("Step 3: Prepare Upload Script")
     manager.copy_upload_script()
+    manager.sync_agent_controls(mill_info, machine_info)
+    bandwidth_settings(mill_info["mill_name"], machine_info["machine_name"])
 
     # -------------------------------
     # Step 4: Select Roll
     # -------------------------------
     st.header("Step 4: Select Roll")
-    db, selected_date, selected_roll = manager.select_roll(machine_info["ip_address"])
+    db, selected_date, selected_roll, rolls = manager.select_roll(machine_info["ip_address"])
     if not selected_roll:
         st.stop()
 
@@ -297,12 +359,9 @@ def main():
     if choice == "Doff-based Zip":
         st.subheader("📦 Doff-based Zipping")
 
-        # Fetch rolls for the selected date
-        rows = db.fetch_rolls_by_date(selected_date)
-
         # ✅ Resolve machineprgdtl_id from selected roll
         selected_roll_obj = next(
-            (r for r in rows if f"{r[0]} - {r[1]}" == selected_roll),
+            (r for r in rolls if f"{r[0]} - {r[1]}" == selected_roll),
             None
         )
         machineprgdtl_id = selected_roll_obj[2] if selected_roll_obj else None
@@ -340,7 +399,7 @@ def main():
 
         zipper.handle_full_roll_zip(
             roll_path=roll_path,
-            rolls=db.fetch_rolls_by_date(selected_date),
+            rolls=rolls,
             selected_roll=selected_roll,
             data_type=data_type,
             mill_name=mill_name,
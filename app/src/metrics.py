@@ -0,0 +1,326 @@
+# metrics.py
+
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+import streamlit as st
+
+# Latency buckets (seconds) of the span histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+RECENT_SPANS = 2000
+PROM_FLUSH_SECONDS = 15
+# Optional sinks: every span appended as a JSON line, and the Prometheus text
+# rewritten periodically (for node_exporter's textfile collector)
+METRICS_JSONL = os.environ.get("METRICS_JSONL")
+METRICS_PROM_FILE = os.environ.get("METRICS_PROM_FILE")
+
+
+class Span:
+    """One timed phase; set count/nbytes inside the block to record volume."""
+
+    __slots__ = ("name", "labels", "started", "seconds", "count", "nbytes", "error")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.started = time.time()
+        self.seconds = 0.0
+        self.count = 0
+        self.nbytes = 0
+        self.error = None
+
+    def as_dict(self):
+        return {
+            "ts": round(self.started, 3), "span": self.name, "seconds": round(self.seconds, 6),
+            "count": self.count, "bytes": self.nbytes, "error": self.error, **self.labels,
+        }
+
+
+class _Series:
+    __slots__ = ("calls", "seconds", "max", "count", "nbytes", "errors", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.count = 0
+        self.nbytes = 0
+        self.errors = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds, count, nbytes, error):
+        self.calls += 1
+        self.seconds += seconds
+        self.max = max(self.max, seconds)
+        self.count += count
+        self.nbytes += nbytes
+        self.errors += bool(error)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Upper bucket bound holding the q-quantile (max for the overflow bucket)."""
+        target = q * self.calls
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return 0.0
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _prom_escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(pairs):
+    return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """
+    Process-wide timings of the collection hot paths (database, SSH, storage
+    listings, uploads). Spans are aggregated per (name, labels) into call and
+    error counts, total/max seconds, items, bytes and a latency histogram; the
+    most recent ones are also kept as they were for the diagnostics panel.
+    Request statistics reported by the storage-unit engine (METRIC= lines) are
+    merged under "engine".
+    """
+
+    def __init__(self, recent=RECENT_SPANS, jsonl_path=METRICS_JSONL, prom_path=METRICS_PROM_FILE):
+        self.series = {}  # (name, label key) -> _Series
+        self.counters = {}  # (name, label key) -> value
+        self.engine = {}  # (op, status, label key) -> {"count", "seconds", "max", "sent", "recv"}
+        self.recent = deque(maxlen=recent)
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.started = time.time()
+        self._flushed = 0.0
+        self._lock = threading.Lock()
+
+    # -- recording --
+    @contextmanager
+    def span(self, name, **labels):
+        span = Span(name, {k: v for k, v in labels.items() if v is not None})
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.seconds = time.perf_counter() - start
+            self._record(span)
+
+    def timed(self, name, **labels):
+        """Decorator: a span per call; the result's length is recorded as its count."""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels) as span:
+                    result = fn(*args, **kwargs)
+                    try:
+                        span.count = len(result)
+                    except TypeError:  # no len() (type slot only, never a proxy's __getattr__)
+                        pass
+                    return result
+            return wrapper
+        return decorate
+
+    def observe(self, name, seconds, count=0, nbytes=0, error=None, **labels):
+        """Record a phase timed by the caller."""
+        span = Span(name, {k: v for k, v in labels.items() if v is not None})
+        span.seconds, span.count, span.nbytes, span.error = seconds, count, nbytes, error
+        self._record(span)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_engine(self, stats, **labels):
+        """Merge the engine's per-request statistics (dicts parsed from METRIC= lines)."""
+        label_key = _label_key(labels)
+        with self._lock:
+            for stat in stats:
+                key = (stat.get("op"), stat.get("status"), label_key)
+                total = self.engine.setdefault(key, {"count": 0, "seconds": 0.0, "max": 0.0, "sent": 0, "recv": 0})
+                total["count"] += stat.get("count", 0)
+                total["seconds"] += stat.get("seconds", 0.0)
+                total["max"] = max(total["max"], stat.get("max", 0.0))
+                total["sent"] += stat.get("sent", 0)
+                total["recv"] += stat.get("recv", 0)
+
+    def _record(self, span):
+        key = (span.name, _label_key(span.labels))
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series()
+            series.add(span.seconds, span.count, span.nbytes, span.error)
+            self.recent.append(span)
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(span.as_dict(), default=str) + "\n")
+            except OSError as e:
+                print(f"Could not append to {self.jsonl_path}: {e}")
+        if self.prom_path and time.time() - self._flushed > PROM_FLUSH_SECONDS:
+            self._flushed = time.time()
+            self.write_prometheus(self.prom_path)
+
+    def reset(self):
+        with self._lock:
+            self.series.clear()
+            self.counters.clear()
+            self.engine.clear()
+            self.recent.clear()
+            self.started = time.time()
+
+    # -- export --
+    def rows(self):
+        """One summary row per span series, slowest total first."""
+        with self._lock:
+            items = [(name, labels, s) for (name, labels), s in self.series.items()]
+        rows = []
+        for name, labels, s in items:
+            rows.append({
+                "Span": name,
+                "Labels": ", ".join(f"{k}={v}" for k, v in labels),
+                "Calls": s.calls,
+                "Errors": s.errors,
+                "Total s": round(s.seconds, 3),
+                "Mean ms": round(s.seconds / s.calls * 1000, 1) if s.calls else 0,
+                "p95 ≤ ms": round(s.quantile(0.95) * 1000, 1),
+                "Max ms": round(s.max * 1000, 1),
+                "Items": s.count,
+                "MB": round(s.nbytes / 1024 ** 2, 2),
+            })
+        return sorted(rows, key=lambda r: r["Total s"], reverse=True)
+
+    def counter_rows(self):
+        with self._lock:
+            items = list(self.counters.items())
+        return sorted(
+            ({"Event": name, "Labels": ", ".join(f"{k}={v}" for k, v in labels), "Count": value}
+             for (name, labels), value in items),
+            key=lambda r: (r["Event"], r["Labels"]),
+        )
+
+    def engine_rows(self):
+        with self._lock:
+            items = list(self.engine.items())
+        rows = []
+        for (op, status, labels), total in items:
+            rows.append({
+                "Request": op,
+                "Status": "" if status is None else status,
+                "Labels": ", ".join(f"{k}={v}" for k, v in labels),
+                "Count": total["count"],
+                "Mean ms": round(total["seconds"] / total["count"] * 1000, 1) if total["count"] else 0,
+                "Max ms": round(total["max"] * 1000, 1),
+                "Sent MB": round(total["sent"] / 1024 ** 2, 2),
+                "Received MB": round(total["recv"] / 1024 ** 2, 2),
+            })
+        return sorted(rows, key=lambda r: r["Count"], reverse=True)
+
+    def prometheus_text(self):
+        """All series in the Prometheus text exposition format."""
+        with self._lock:
+            series = list(self.series.items())
+            counters = list(self.counters.items())
+            engine = list(self.engine.items())
+        lines = [
+            "# HELP dc_span_seconds Duration of instrumented collection phases.",
+            "# TYPE dc_span_seconds histogram",
+        ]
+        for (name, labels), s in series:
+            pairs = [("span", name)] + list(labels)
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), s.buckets):
+                cumulative += n
+                lines.append(f"dc_span_seconds_bucket{_prom_labels(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"dc_span_seconds_sum{_prom_labels(pairs)} {s.seconds:.6f}")
+            lines.append(f"dc_span_seconds_count{_prom_labels(pairs)} {s.calls}")
+        for metric, attr, help_text in (
+            ("dc_span_items_total", "count", "Items (rows, files, commands) handled by a phase."),
+            ("dc_span_bytes_total", "nbytes", "Bytes handled by a phase."),
+            ("dc_span_errors_total", "errors", "Phases that raised."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (name, labels), s in series:
+                pairs = [("span", name)] + list(labels)
+                lines.append(f"{metric}{_prom_labels(pairs)} {getattr(s, attr)}")
+        lines += ["# HELP dc_events_total Counted events.", "# TYPE dc_events_total counter"]
+        for (name, labels), value in counters:
+            pairs = [("event", name)] + list(labels)
+            lines.append(f"dc_events_total{_prom_labels(pairs)} {value}")
+        for metric, field, help_text in (
+            ("dc_engine_requests_total", "count", "Graph requests made by the storage-unit engine."),
+            ("dc_engine_request_seconds_total", "seconds", "Time spent in engine Graph requests."),
+            ("dc_engine_sent_bytes_total", "sent", "Request bytes sent by the engine."),
+            ("dc_engine_received_bytes_total", "recv", "Response bytes received by the engine."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (op, status, labels), total in engine:
+                # Engine phases (stat, hash, ...) have no HTTP status
+                pairs = [("op", op)] + ([("status", status)] if status is not None else []) + list(labels)
+                lines.append(f"{metric}{_prom_labels(pairs)} {total[field]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        tmp = f"{path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not write {path}: {e}")
+
+    def json_lines(self):
+        """The recent spans, one JSON object per line."""
+        with self._lock:
+            spans = list(self.recent)
+        return "".join(json.dumps(span.as_dict(), default=str) + "\n" for span in spans)
+
+
+metrics = MetricsRegistry()
+
+
+# -----------------------
+# UI
+# -----------------------
+def show_diagnostics_panel():
+    """Where collection time went since the server started (or the last reset)."""
+    with st.expander("🩺 Diagnostics"):
+        st.caption(f"Since {time.strftime('%Y-%m-%d %H:%M', time.localtime(metrics.started))}")
+        rows = metrics.rows()
+        if rows:
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        else:
+            st.caption("No timings recorded yet.")
+        counter_rows = metrics.counter_rows()
+        if counter_rows:
+            st.markdown("**Cache hits and misses**")
+            st.dataframe(pd.DataFrame(counter_rows), hide_index=True, use_container_width=True)
+        engine_rows = metrics.engine_rows()
+        if engine_rows:
+            st.markdown("**Storage-unit Graph requests**")
+            st.dataframe(pd.DataFrame(engine_rows), hide_index=True, use_container_width=True)
+        col1, col2, col3 = st.columns(3)
+        col1.download_button("Prometheus", metrics.prometheus_text(), file_name="data_collection.prom",
+                             mime="text/plain")
+        col2.download_button("JSON lines", metrics.json_lines(), file_name="data_collection_spans.jsonl",
+                             mime="application/x-ndjson")
+        if col3.button("Reset"):
+            metrics.reset()
@@ -0,0 +1,235 @@
+# remote_manifest.py
+
+import bisect
+import shlex
+import traceback
+from collections import namedtuple
+
+from metrics import metrics
+from ssh_pool import run_concurrently
+
+REMOTE_FILE_SELECT = "/home/kniti/storage_agent/file_select.py"
+
+ManifestEntry = namedtuple("ManifestEntry", ["path", "size", "mtime"])
+
+
+class RemoteManifest:
+    """
+    In-memory listing of remote files (path, size, mtime).
+    Built once per selection and shared by the size summary, ETA and upload loop.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = list(entries or [])
+        self._by_path = {e.path: e for e in self.entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, path):
+        return path in self._by_path
+
+    @property
+    def paths(self):
+        return [e.path for e in self.entries]
+
+    @property
+    def total_bytes(self):
+        return sum(e.size for e in self.entries)
+
+    def size_of(self, path, default=0):
+        entry = self._by_path.get(path)
+        return entry.size if entry else default
+
+    def get(self, path):
+        return self._by_path.get(path)
+
+    def filter(self, predicate):
+        """Return a new manifest holding only the entries accepted by predicate(entry)."""
+        return RemoteManifest(e for e in self.entries if predicate(e))
+
+    @classmethod
+    def parse(cls, text):
+        """Parse `find -printf '%p\\t%s\\t%T@\\n'` output into a manifest."""
+        entries = []
+        for line in text.splitlines():
+            parts = line.rsplit("\t", 2)
+            if len(parts) != 3:
+                continue
+            path, size, mtime = parts
+            try:
+                entries.append(ManifestEntry(path, int(size), float(mtime)))
+            except ValueError:
+                continue
+        return cls(entries)
+
+
+def find_command(roots, name_pattern=None, maxdepth=None):
+    """`find` listing path/size/mtime of every regular file under roots."""
+    if isinstance(roots, str):
+        roots = [roots]
+    cmd = "find " + " ".join(shlex.quote(r) for r in roots)
+    if maxdepth is not None:
+        cmd += f" -maxdepth {int(maxdepth)}"
+    cmd += " -type f"
+    if name_pattern:
+        cmd += f" -name {shlex.quote(name_pattern)}"
+    return cmd + " -printf '%p\\t%s\\t%T@\\n' 2>/dev/null"
+
+
+def build_remote_manifest(ssh_client, roots, name_pattern=None, maxdepth=None):
+    """
+    List every regular file under the given remote roots with a single `find`.
+    Returns a RemoteManifest (empty on failure).
+    """
+    if isinstance(roots, str):
+        roots = [roots]
+    if not roots:
+        return RemoteManifest()
+
+    try:
+        with metrics.span("manifest.find") as span:
+            stdin, stdout, stderr = ssh_client.exec_command(find_command(roots, name_pattern, maxdepth))
+            output = stdout.read().decode("utf-8", errors="ignore")
+            manifest = RemoteManifest.parse(output)
+            span.count, span.nbytes = len(manifest), manifest.total_bytes
+        return manifest
+    except Exception as e:
+        print(f"Error building remote manifest: {e}")
+        traceback.print_exc()
+        return RemoteManifest()
+
+
+def build_remote_manifests(ssh_client, roots_by_key, name_pattern=None, maxdepth=None):
+    """
+    {key: RemoteManifest} for {key: roots}, with the `find`s running
+    concurrently over the one SSH transport (ssh_pool.run_concurrently).
+    A listing that fails or times out yields an empty manifest.
+    """
+    commands = {key: find_command(roots, name_pattern, maxdepth) for key, roots in roots_by_key.items() if roots}
+    manifests = {key: RemoteManifest() for key in roots_by_key}
+    try:
+        with metrics.span("manifest.find_many", roots=len(commands)) as span:
+            for result in run_concurrently(ssh_client, commands):
+                if result.error:
+                    print(f"Listing {result.key} failed: {result.error}")
+                    continue
+                manifests[result.key] = RemoteManifest.parse(result.stdout)
+                span.count += len(manifests[result.key])
+    except Exception as e:
+        print(f"Error building remote manifests: {e}")
+        traceback.print_exc()
+    return manifests
+
+
+class DoffSummary:
+    """
+    Per-doff file counts and bytes of a folder selection (from file_select.py).
+    Prefix sums make the totals of any doff range two bisects.
+    """
+
+    def __init__(self, rows, undoffed=(0, 0)):
+        rows = sorted(rows)
+        self.doffs = [r[0] for r in rows]
+        self.files = [r[1] for r in rows]
+        self.bytes = [r[2] for r in rows]
+        self.undoffed = undoffed
+        self._files_upto = [0]
+        self._bytes_upto = [0]
+        for files, nbytes in zip(self.files, self.bytes):
+            self._files_upto.append(self._files_upto[-1] + files)
+            self._bytes_upto.append(self._bytes_upto[-1] + nbytes)
+
+    def __len__(self):
+        return len(self.doffs)
+
+    @property
+    def first(self):
+        return self.doffs[0] if self.doffs else 0
+
+    @property
+    def last(self):
+        return self.doffs[-1] if self.doffs else 0
+
+    def totals(self, min_doff, max_doff):
+        """(files, bytes) with min_doff <= doff <= max_doff."""
+        lo = bisect.bisect_left(self.doffs, min_doff)
+        hi = bisect.bisect_right(self.doffs, max_doff)
+        if lo >= hi:
+            return 0, 0
+        return self._files_upto[hi] - self._files_upto[lo], self._bytes_upto[hi] - self._bytes_upto[lo]
+
+    @classmethod
+    def parse(cls, text):
+        rows, undoffed = [], (0, 0)
+        for line in text.splitlines():
+            parts = line.split("\t")
+            try:
+                if parts[0] == "DOFF" and len(parts) == 4:
+                    rows.append((int(parts[1]), int(parts[2]), int(parts[3])))
+                elif parts[0] == "NODOFF" and len(parts) == 3:
+                    undoffed = (int(parts[1]), int(parts[2]))
+            except ValueError:
+                continue
+        return cls(rows, undoffed)
+
+
+def _file_select(ssh_client, command, date_dir, cameras=(), defects=(), exts=(), doff_range=None, flags=""):
+    """Run storage_agent/file_select.py; returns its stdout, or None on failure."""
+    cmd = f"python3 {REMOTE_FILE_SELECT} {command} {shlex.quote(date_dir)}"
+    cmd += "".join(f" --camera {shlex.quote(c)}" for c in cameras)
+    cmd += "".join(f" --defect {shlex.quote(d)}" for d in defects or ())
+    cmd += "".join(f" --ext {shlex.quote(e)}" for e in exts or ())
+    if doff_range:
+        cmd += f" --doff {int(doff_range[0])} {int(doff_range[1])}"
+    if flags:
+        cmd += f" {flags}"
+    try:
+        with metrics.span(f"file_select.{command}") as span:
+            stdin, stdout, stderr = ssh_client.exec_command(cmd)
+            output = stdout.read().decode("utf-8", errors="ignore")
+            span.count = output.count("\n")
+        if stdout.channel.recv_exit_status() != 0:
+            print(f"file_select.py {command} failed: {stderr.read().decode(errors='ignore').strip()}")
+            return None
+        return output
+    except Exception as e:
+        print(f"Error running file_select.py {command}: {e}")
+        traceback.print_exc()
+        return None
+
+
+def fetch_folder_tree(ssh_client, date_dir, defects=False):
+    """
+    {camera: [defect types]} of a roll/date folder in one remote call.
+    Returns {} when the folder does not exist, None on failure.
+    """
+    output = _file_select(ssh_client, "tree", date_dir, flags="--defects" if defects else "")
+    if output is None:
+        return None
+    tree = {}
+    for line in output.splitlines():
+        parts = line.split("\t")
+        if parts[0] == "CAMERA" and len(parts) == 2:
+            tree.setdefault(parts[1], [])
+        elif parts[0] == "DEFECT" and len(parts) == 3:
+            tree.setdefault(parts[1], []).append(parts[2])
+    return tree
+
+
+def fetch_doff_summary(ssh_client, date_dir, cameras, defects=None, exts=None):
+    """
+    Per-doff histogram of the selection, computed on the storage unit from its
+    doff indexes (refreshed incrementally on every call). None on failure.
+    """
+    output = _file_select(ssh_client, "summary", date_dir, cameras, defects, exts)
+    return None if output is None else DoffSummary.parse(output)
+
+
+def build_doff_manifest(ssh_client, date_dir, cameras, min_doff, max_doff, defects=None, exts=None):
+    """RemoteManifest of the selected files whose doff is in [min_doff, max_doff]."""
+    output = _file_select(ssh_client, "list", date_dir, cameras, defects, exts, (min_doff, max_doff))
+    return RemoteManifest.parse(output or "")
@@ -0,0 +1,267 @@
+# remote_upload.py
+
+import hashlib
+import json
+import os
+import shlex
+import time
+import traceback
+
+from metrics import metrics
+
+REMOTE_SCRIPT = "/home/kniti/upload_to_onedrive.sh"
+REMOTE_AGENT_DIR = "/home/kniti/storage_agent"
+REMOTE_ENGINE = f"{REMOTE_AGENT_DIR}/graph_upload.py"
+REMOTE_SYNC_AGENT = f"{REMOTE_AGENT_DIR}/sync_agent.py"
+REMOTE_MANIFEST_DIR = "/home/kniti/onedrive_upload_manifests"
+REMOTE_BANDWIDTH_SCHEDULE = "/home/kniti/onedrive_upload_state/bandwidth.json"
+LOCAL_AGENT_DIR = os.path.join(os.path.dirname(__file__), "storage_agent")
+
+
+@metrics.timed("agent.install")
+def install_storage_agent(ssh_client, local_dir=LOCAL_AGENT_DIR):
+    """
+    Ship the Python upload engine (storage_agent/*.py) to a storage unit.
+    One remote md5sum decides which files are stale; only those are copied.
+    Returns the names of the files that were updated.
+    """
+    local_files = sorted(f for f in os.listdir(local_dir) if f.endswith(".py"))
+    remote_paths = " ".join(shlex.quote(f"{REMOTE_AGENT_DIR}/{f}") for f in local_files)
+    stdin, stdout, stderr = ssh_client.exec_command(
+        f"mkdir -p {shlex.quote(REMOTE_AGENT_DIR)} && md5sum {remote_paths} 2>/dev/null"
+    )
+    remote_md5 = {}
+    for line in stdout.read().decode().splitlines():
+        digest, _, path = line.partition("  ")
+        remote_md5[os.path.basename(path)] = digest
+
+    stale = []
+    for name in local_files:
+        with open(os.path.join(local_dir, name), "rb") as f:
+            if hashlib.md5(f.read()).hexdigest() != remote_md5.get(name):
+                stale.append(name)
+
+    if stale:
+        sftp = ssh_client.open_sftp()
+        try:
+            for name in stale:
+                sftp.put(os.path.join(local_dir, name), f"{REMOTE_AGENT_DIR}/{name}")
+        finally:
+            sftp.close()
+    return stale
+
+
+# -----------------------
+# Background sync agent (storage_agent/sync_agent.py)
+# -----------------------
+def _key_values(text):
+    values = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            values[key.strip().lower()] = value.strip()
+    return values
+
+
+def sync_agent_command(*args):
+    return f"python3 {REMOTE_SYNC_AGENT} " + " ".join(shlex.quote(str(a)) for a in args)
+
+
+def sync_check_command(mill_name, machine_name, folder, journal):
+    """Command printing TOTAL/SYNCED/PENDING/PENDING_BYTES of a folder (parse with parse_sync_check)."""
+    return sync_agent_command("check", mill_name, machine_name, folder, "--journal", journal)
+
+
+def parse_sync_check(text):
+    values = _key_values(text)
+    try:
+        return {k: int(values[k]) for k in ("total", "synced", "pending", "pending_bytes")}
+    except (KeyError, ValueError):
+        return None
+
+
+def sync_agent_status(ssh_client):
+    """{"running": pid (0 = stopped), ...state fields} of the unit's sync agent, or None."""
+    try:
+        stdin, stdout, stderr = ssh_client.exec_command(sync_agent_command("status"))
+        values = _key_values(stdout.read().decode("utf-8", errors="ignore"))
+        values["running"] = int(values.get("running") or 0)
+        return values
+    except Exception as e:
+        print(f"Could not read sync agent status: {e}")
+        return None
+
+
+def start_sync_agent(ssh_client, mill_name, machine_name, max_mbps, workers=2):
+    """Start the sync agent unless it already runs; returns its pid (0 on failure)."""
+    stdin, stdout, stderr = ssh_client.exec_command(sync_agent_command(
+        "start", mill_name, machine_name, "--max-mbps", float(max_mbps), "--workers", int(workers)
+    ))
+    return int(_key_values(stdout.read().decode("utf-8", errors="ignore")).get("running") or 0)
+
+
+def stop_sync_agent(ssh_client):
+    stdin, stdout, stderr = ssh_client.exec_command(sync_agent_command("stop"))
+    stdout.channel.recv_exit_status()
+
+
+# -----------------------
+# Bandwidth schedule (storage_agent/bandwidth.py)
+# -----------------------
+def write_bandwidth_schedule(ssh_client, schedule):
+    """Replace the unit's bandwidth.json; running uploads pick it up within seconds."""
+    directory = os.path.dirname(REMOTE_BANDWIDTH_SCHEDULE)
+    tmp = f"{REMOTE_BANDWIDTH_SCHEDULE}.tmp"
+    sftp = ssh_client.open_sftp()
+    try:
+        try:
+            sftp.mkdir(directory)
+        except IOError:
+            pass  # already exists
+        with sftp.file(tmp, "w") as f:
+            f.write(json.dumps(schedule))
+        sftp.posix_rename(tmp, REMOTE_BANDWIDTH_SCHEDULE)
+    finally:
+        sftp.close()
+
+
+class BatchUploader:
+    """
+    Upload many storage-unit files with a single remote upload run.
+    The path list is written to a remote manifest, so the OAuth token and the
+    mill/machine folders are resolved once per batch instead of once per file.
+    By default the Python Graph engine (storage_agent/graph_upload.py) runs the
+    batch; use_engine=False falls back to upload_to_onedrive.sh.
+    """
+
+    def __init__(self, ssh_client, use_engine=True, workers=4):
+        self.ssh_client = ssh_client
+        self.use_engine = use_engine
+        self.workers = workers
+
+    def _command(self, mill_name, machine_name, remote_manifest, journal=None, sync=False,
+                 archive=None, shard_mb=0, transform=None):
+        if self.use_engine or archive:
+            cmd = (
+                f"python3 {REMOTE_ENGINE} {shlex.quote(str(mill_name))} {shlex.quote(str(machine_name))} "
+                f"--manifest {shlex.quote(remote_manifest)} --workers {int(self.workers)}"
+            )
+            if journal:
+                cmd += f" --journal {shlex.quote(str(journal))}"
+            if sync:
+                cmd += " --sync"
+            if archive:
+                cmd += f" --archive {shlex.quote(str(archive))} --shard-mb {float(shard_mb)}"
+            elif transform:
+                cmd += f" --jpeg-quality {int(transform['quality'])} --max-dim {int(transform.get('max_dim') or 0)}"
+                if transform.get("grayscale"):
+                    cmd += " --grayscale"
+            return cmd
+        return (
+            f"bash {REMOTE_SCRIPT} {shlex.quote(str(mill_name))} {shlex.quote(str(machine_name))} "
+            f"--manifest {shlex.quote(remote_manifest)}"
+        )
+
+    def _write_manifest(self, paths):
+        name = f"manifest_{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}.txt"
+        remote_manifest = f"{REMOTE_MANIFEST_DIR}/{name}"
+
+        sftp = self.ssh_client.open_sftp()
+        try:
+            try:
+                sftp.mkdir(REMOTE_MANIFEST_DIR)
+            except IOError:
+                pass  # already exists
+            with sftp.file(remote_manifest, "w") as f:
+                f.set_pipelined(True)
+                f.write("\n".join(paths) + "\n")
+        finally:
+            sftp.close()
+        return remote_manifest
+
+    def _iter_lines(self, channel):
+        """Yield stdout lines from a running remote command until it exits."""
+        buffer = ""
+        while True:
+            if channel.recv_ready():
+                buffer += channel.recv(65536).decode("utf-8", errors="ignore")
+                while "\n" in buffer:
+                    line, buffer = buffer.split("\n", 1)
+                    line = line.strip()
+                    if line:
+                        yield line
+                continue
+            if channel.exit_status_ready() and not channel.recv_ready():
+                break
+            time.sleep(0.2)
+        if buffer.strip():
+            yield buffer.strip()
+
+    def upload_files(self, paths, mill_name, machine_name, progress_callback=None, journal=None, sync=False,
+                     archive=None, shard_mb=0, transform=None):
+        """
+        Upload all paths in one batch.
+        progress_callback(done, total, path, outcome) is called as each file finishes,
+        with outcome "uploaded", "skipped" or "failed".
+        With a journal name (e.g. the roll name) files already uploaded unchanged are
+        skipped on the storage unit and reported under "skipped"; sync=True also skips
+        files whose identical copy (size + quickXorHash) is already in OneDrive.
+        With archive=<name> the files are streamed as a tar split into shard_mb shards
+        under <mill>/<machine>/archives instead of being uploaded one by one.
+        transform={"quality", "max_dim", "grayscale"} re-encodes JPEGs on the storage
+        unit first (into a separate reduced_* tree); the bytes before and after are
+        returned as "transform_bytes": (in, out).
+        The engine's request statistics (METRIC= lines) are returned under "metrics".
+        Returns {"uploaded": [...], "skipped": [...], "failed": [...], "exit_status": int}.
+        """
+        result = {"uploaded": [], "skipped": [], "failed": [], "exit_status": None, "transform_bytes": None,
+                  "metrics": []}
+        paths = [p for p in paths if p]
+        if not paths:
+            result["exit_status"] = 0
+            return result
+
+        remote_manifest = None
+        try:
+            remote_manifest = self._write_manifest(paths)
+            stdin, stdout, stderr = self.ssh_client.exec_command(
+                self._command(mill_name, machine_name, remote_manifest, journal=journal, sync=sync,
+                              archive=archive, shard_mb=shard_mb, transform=transform)
+            )
+            transform_bytes = {}
+
+            total = len(paths)
+            outcomes = {"UPLOADED": "uploaded", "SKIPPED": "skipped", "FAILED": "failed"}
+            for line in self._iter_lines(stdout.channel):
+                key, _, value = line.partition("=")
+                if key == "TOTAL_FILES":
+                    total = int(value) if value.isdigit() else total
+                elif key in ("TRANSFORM_BYTES_IN", "TRANSFORM_BYTES_OUT") and value.isdigit():
+                    transform_bytes[key] = int(value)
+                elif key == "METRIC":
+                    try:
+                        result["metrics"].append(json.loads(value))
+                    except ValueError:
+                        pass
+                elif key in outcomes:
+                    result[outcomes[key]].append(value)
+                    if progress_callback:
+                        done = len(result["uploaded"]) + len(result["skipped"]) + len(result["failed"])
+                        progress_callback(done, total, value, outcomes[key])
+
+            if len(transform_bytes) == 2:
+                result["transform_bytes"] = (
+                    transform_bytes["TRANSFORM_BYTES_IN"], transform_bytes["TRANSFORM_BYTES_OUT"]
+                )
+            result["exit_status"] = stdout.channel.recv_exit_status()
+        except Exception as e:
+            print(f"Batch upload failed: {e}")
+            traceback.print_exc()
+            result["exit_status"] = -1
+        finally:
+            if remote_manifest:
+                try:
+                    self.ssh_client.exec_command(f"rm -f {shlex.quote(remote_manifest)}")
+                except Exception:
+                    pass
+        return result
@@ -0,0 +1,365 @@
+# ssh_pool.py
+
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+import paramiko
+import streamlit as st
+
+from metrics import metrics
+
+SSH_USER = "supernova"
+SSH_PASSWORD = "Charlemagne@1"
+CORECONFIG_PATH = "/home/kniti/projects/knit-i/config/coreconfig.ini"
+
+KEEPALIVE_SECONDS = 30
+PROBE_INTERVAL = 30  # seconds between liveness probes of an idle-looking transport
+PROBE_TIMEOUT = 5
+IDLE_TIMEOUT = 15 * 60  # close sessions nobody used for this long
+MAX_CHANNELS_PER_HOST = 8  # stays below OpenSSH's default MaxSessions (10)
+MAX_CONCURRENT_COMMANDS = 6  # run_concurrently default; leaves channels for uploads
+COMMAND_TIMEOUT = 60
+COMMAND_POLL = 0.02
+
+
+# -----------------------
+# Plain connections (no st.* calls: also used from worker threads)
+# -----------------------
+def connect_machine(ip, username=SSH_USER, password=SSH_PASSWORD, timeout=15):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(hostname=ip, username=username, password=password, timeout=timeout,
+                   look_for_keys=False, allow_agent=False)
+    return client
+
+
+def read_storage_ip(machine_client):
+    """storage_ip from the machine's coreconfig.ini, or None."""
+    stdin, stdout, stderr = machine_client.exec_command(f"cat {CORECONFIG_PATH}")
+    match = re.search(r"storage_ip\s*=\s*([0-9.]+)", stdout.read().decode())
+    return match.group(1) if match else None
+
+
+def connect_storage(machine_client, storage_ip, username=SSH_USER, password=SSH_PASSWORD, timeout=15):
+    """Storage-unit SSH tunnelled through the machine (jump host)."""
+    channel = machine_client.get_transport().open_channel(
+        "direct-tcpip", (storage_ip, 22), ("127.0.0.1", 0)
+    )
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(hostname=storage_ip, username=username, password=password, sock=channel,
+                   timeout=timeout, look_for_keys=False, allow_agent=False)
+    return client
+
+
+# -----------------------
+# Pool
+# -----------------------
+class _Session:
+    def __init__(self, key, connect):
+        self.key = key
+        self.connect = connect  # () -> paramiko.SSHClient
+        self.client = None
+        self.lock = threading.Lock()
+        self.channels = []
+        self.channels_changed = threading.Condition()
+        self.last_used = time.time()
+        self.last_probe = 0.0
+
+    def close(self):
+        if self.client:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        self.client = None
+
+
+class PooledSSHClient:
+    """
+    Stand-in for paramiko.SSHClient backed by a pooled session.
+    Every call resolves a healthy connection (reconnecting the jump chain if the
+    transport dropped), and exec_command/open_sftp wait while the host already
+    has MAX_CHANNELS_PER_HOST channels open. close() leaves the shared session
+    open for the next user.
+    """
+
+    def __init__(self, pool, key):
+        self._pool = pool
+        self._key = key
+
+    @property
+    def host(self):
+        return self._key[-1]
+
+    @property
+    def machine_ip(self):
+        return self._key[1]
+
+    def _open_channel(self, opener, block=True):
+        session = self._pool.session(self._key)
+        with session.channels_changed:
+            while True:
+                session.channels = [c for c in session.channels if not c.closed]
+                if len(session.channels) < self._pool.max_channels:
+                    break
+                if not block:
+                    return None
+                session.channels_changed.wait(timeout=0.2)
+            result, channel = opener(self._pool.client(self._key))
+            session.channels.append(channel)
+        return result
+
+    def exec_command(self, command, **kwargs):
+        def opener(client):
+            streams = client.exec_command(command, **kwargs)
+            return streams, streams[1].channel
+        return self._open_channel(opener)
+
+    def open_sftp(self):
+        def opener(client):
+            sftp = client.open_sftp()
+            return sftp, sftp.get_channel()
+        return self._open_channel(opener)
+
+    def open_session(self, timeout=None, block=True):
+        """Raw session channel under the host's channel cap; None if full and not block."""
+        def opener(client):
+            channel = client.get_transport().open_session(timeout=timeout)
+            return channel, channel
+        return self._open_channel(opener, block)
+
+    def get_transport(self):
+        return self._pool.client(self._key).get_transport()
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._pool.client(self._key), name)
+
+
+class SSHPool:
+    """
+    Process-wide SSH sessions keyed by ("machine", ip) and ("storage", machine ip,
+    storage ip). Transports send keepalives, are probed before reuse when they
+    have been quiet, and are transparently reconnected (storage sessions through
+    a fresh machine session if needed). Transports idle for IDLE_TIMEOUT are
+    closed and reopened on demand.
+    """
+
+    def __init__(self, max_channels=MAX_CHANNELS_PER_HOST):
+        self.max_channels = max_channels
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _register(self, key, connect):
+        with self._lock:
+            self._evict_idle()
+            if key not in self._sessions:
+                self._sessions[key] = _Session(key, connect)
+            else:
+                self._sessions[key].connect = connect
+            return self._sessions[key]
+
+    def _evict_idle(self):
+        # Only the transport is closed; the entry keeps its connect() so a
+        # PooledSSHClient held in a browser session reconnects on next use.
+        # A machine session also carries the tunnels of its storage sessions,
+        # so it stays open while any of them is busy or recently used.
+        now = time.time()
+        for key, session in self._sessions.items():
+            if not session.client or not self._idle(session, now):
+                continue
+            if key[0] == "machine" and any(
+                    other[0] == "storage" and other[1] == key[1] and not self._idle(tunnelled, now)
+                    for other, tunnelled in self._sessions.items()):
+                continue
+            session.close()
+
+    @staticmethod
+    def _idle(session, now):
+        return now - session.last_used > IDLE_TIMEOUT and not any(not c.closed for c in session.channels)
+
+    def session(self, key):
+        with self._lock:
+            return self._sessions[key]
+
+    def _healthy(self, session):
+        transport = session.client.get_transport() if session.client else None
+        if transport is None or not transport.is_active():
+            return False
+        if time.time() - session.last_probe < PROBE_INTERVAL:
+            return True
+        try:
+            with metrics.span("ssh.probe", hop=session.key[0]):
+                channel = transport.open_session(timeout=PROBE_TIMEOUT)
+                channel.settimeout(PROBE_TIMEOUT)
+                channel.exec_command("true")
+                channel.recv_exit_status()
+                channel.close()
+        except Exception:
+            return False
+        session.last_probe = time.time()
+        return True
+
+    def client(self, key):
+        """Healthy paramiko client for key, (re)connecting when needed."""
+        session = self.session(key)
+        with session.lock:
+            if not self._healthy(session):
+                if session.client:
+                    print(f"SSH session {key} dropped, reconnecting")
+                session.close()
+                with metrics.span("ssh.connect", hop=key[0]):
+                    client = session.connect()
+                client.get_transport().set_keepalive(KEEPALIVE_SECONDS)
+                session.client = client
+                session.channels = []
+                session.last_probe = time.time()
+            session.last_used = time.time()
+        if key[0] == "storage":
+            # The tunnel lives on the machine transport: keep that from idling out
+            self.session(("machine", key[1])).last_used = time.time()
+        return session.client
+
+    def machine(self, ip, username=SSH_USER, password=SSH_PASSWORD, timeout=15):
+        key = ("machine", ip)
+        self._register(key, lambda: connect_machine(ip, username, password, timeout))
+        self.client(key)
+        return PooledSSHClient(self, key)
+
+    def storage(self, machine_ip, storage_ip, username=SSH_USER, password=SSH_PASSWORD, timeout=15):
+        key = ("storage", machine_ip, storage_ip)
+        with self._lock:
+            known = ("machine", machine_ip) in self._sessions
+        if not known:
+            self.machine(machine_ip, username, password, timeout)
+
+        def connect():
+            # Re-resolve the machine hop so a dropped jump host is reconnected too
+            machine = self.client(("machine", machine_ip))
+            return connect_storage(machine, storage_ip, username, password, timeout)
+
+        self._register(key, connect)
+        self.client(key)
+        return PooledSSHClient(self, key)
+
+    def close_all(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# -----------------------
+# Concurrent commands over one transport
+# -----------------------
+class CommandResult(namedtuple("CommandResult", ["key", "command", "exit_status", "stdout", "stderr", "error"])):
+    @property
+    def ok(self):
+        return self.error is None and self.exit_status == 0
+
+
+class _RunningCommand:
+    def __init__(self, key, command, channel):
+        self.key = key
+        self.command = command
+        self.channel = channel
+        self.started = time.time()
+        self.out = []
+        self.err = []
+
+    def drain(self):
+        """Read whatever has arrived; True if anything was read."""
+        progressed = False
+        while self.channel.recv_ready():
+            self.out.append(self.channel.recv(65536))
+            progressed = True
+        while self.channel.recv_stderr_ready():
+            self.err.append(self.channel.recv_stderr(65536))
+            progressed = True
+        return progressed
+
+    def result(self, exit_status=None, error=None):
+        self.channel.close()
+        stdout = b"".join(self.out)
+        metrics.observe("ssh.command", time.time() - self.started, nbytes=len(stdout),
+                        error=error or (f"exit {exit_status}" if exit_status else None))
+        return CommandResult(
+            self.key, self.command, exit_status,
+            stdout.decode("utf-8", errors="ignore"),
+            b"".join(self.err).decode("utf-8", errors="ignore"),
+            error,
+        )
+
+
+def _try_open_session(ssh_client, timeout):
+    if isinstance(ssh_client, PooledSSHClient):
+        return ssh_client.open_session(timeout=timeout, block=False)
+    return ssh_client.get_transport().open_session(timeout=timeout)
+
+
+def run_concurrently(ssh_client, commands, max_channels=MAX_CONCURRENT_COMMANDS, timeout=COMMAND_TIMEOUT):
+    """
+    Run several remote commands at once over the client's single transport and
+    yield a CommandResult per command as each one completes.
+    commands is {key: command} or a list of commands (the key is then the
+    command). At most max_channels run at a time (and never more than the
+    pool's per-host cap); a command still running after timeout seconds is
+    closed and reported with error="timeout". The channels are multiplexed from
+    the calling thread, so no worker threads are involved.
+    """
+    if not isinstance(commands, dict):
+        commands = {command: command for command in commands}
+    pending = deque(commands.items())
+    running = []
+    waiting_since = None
+
+    while pending or running:
+        # Start commands while there are free channels
+        while pending and len(running) < max_channels:
+            key, command = pending[0]
+            try:
+                channel = _try_open_session(ssh_client, COMMAND_TIMEOUT)
+            except Exception as e:
+                if running:
+                    channel = None  # server refused another channel: retry when one finishes
+                else:
+                    pending.popleft()
+                    yield CommandResult(key, command, None, "", "", f"could not open channel: {e}")
+                    continue
+            if channel is None:
+                waiting_since = waiting_since or time.time()
+                if not running and time.time() - waiting_since > timeout:
+                    pending.popleft()
+                    yield CommandResult(key, command, None, "", "", "timeout waiting for a free channel")
+                    continue
+                break
+            waiting_since = None
+            pending.popleft()
+            channel.exec_command(command)
+            running.append(_RunningCommand(key, command, channel))
+
+        progressed = False
+        for cmd in list(running):
+            if cmd.drain():
+                progressed = True
+            if cmd.channel.exit_status_ready():
+                cmd.drain()
+                running.remove(cmd)
+                progressed = True
+                yield cmd.result(cmd.channel.recv_exit_status())
+            elif time.time() - cmd.started > timeout:
+                running.remove(cmd)
+                progressed = True
+                yield cmd.result(error="timeout")
+        if not progressed:
+            time.sleep(COMMAND_POLL)
+
+
+@st.cache_resource
+def get_ssh_pool():
+    return SSHPool()
@@ -0,0 +1,192 @@
+# archive_stream.py
+#
+# Stream a tar archive of many small files straight into OneDrive upload
+# sessions, split into fixed-size shards (name.tar.000, name.tar.001, ...).
+# Nothing is written to the storage unit's disk: the tar bytes are produced in
+# memory and pushed chunk by chunk.
+#
+# The tar size is computed exactly before streaming (header + padded data per
+# member, end blocks, record padding), so every shard's length is known up front
+# as upload sessions require. Shards are plain byte ranges of one tar stream;
+# restore with `cat name.tar.* | tar -x`.
+
+import hashlib
+import os
+import tarfile
+
+from graph_client import GraphError, log
+from upload_session import DEFAULT_CHUNK_SIZE, align_chunk_size, put_chunk
+
+TAR_FORMAT = tarfile.GNU_FORMAT
+TAR_ENCODING = "utf-8"
+BLOCKSIZE = tarfile.BLOCKSIZE
+RECORDSIZE = tarfile.RECORDSIZE
+
+
+def build_members(paths, arcname_for):
+    """Stat every path and build its TarInfo; returns [(path, tarinfo)] (missing files dropped)."""
+    members = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            log(f"❌ Path not found: {path}")
+            continue
+        info = tarfile.TarInfo(arcname_for(path))
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        members.append((path, info))
+    return members
+
+
+def archive_layout(members):
+    """
+    Exact layout of the tar stream tarfile will write for these members.
+    Returns (total_size, end_offsets) where end_offsets[i] is the stream offset
+    just past member i's data.
+    """
+    offset = 0
+    ends = []
+    for _, info in members:
+        offset += len(info.tobuf(TAR_FORMAT, TAR_ENCODING, "surrogateescape"))
+        offset += -(-info.size // BLOCKSIZE) * BLOCKSIZE
+        ends.append(offset)
+    total = offset + 2 * BLOCKSIZE
+    return -(-total // RECORDSIZE) * RECORDSIZE, ends
+
+
+def archive_fingerprint(members):
+    """Identifies the archive content, so completed shards can be recognised on a rerun."""
+    digest = hashlib.sha1()
+    for _, info in members:
+        digest.update(f"{info.name}\0{info.size}\0{info.mtime}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def shard_names(archive_name, shard_count):
+    if shard_count == 1:
+        return [f"{archive_name}.tar"]
+    return [f"{archive_name}.tar.{k:03d}" for k in range(shard_count)]
+
+
+class ShardedSessionWriter:
+    """
+    File-like sink for tarfile: cuts the stream into shards and uploads each one
+    through its own upload session, chunk by chunk. Shards listed in skip_shards
+    (already uploaded on an earlier run) are consumed without being sent.
+    """
+
+    def __init__(self, client, remote_dir, names, total_size, shard_size,
+                 chunk_size=DEFAULT_CHUNK_SIZE, skip_shards=(), on_shard_done=None):
+        self.client = client
+        self.remote_dir = remote_dir
+        self.names = names
+        self.total_size = total_size
+        self.shard_size = shard_size
+        self.chunk_size = align_chunk_size(chunk_size)
+        self.skip_shards = set(skip_shards)
+        self.on_shard_done = on_shard_done
+
+        self.position = 0  # absolute offset in the tar stream
+        self.shard = 0
+        self.upload_url = None
+        self._buffer = bytearray()
+
+    def _shard_bounds(self):
+        start = self.shard * self.shard_size
+        return start, min(start + self.shard_size, self.total_size)
+
+    def _send(self, piece):
+        start, end = self._shard_bounds()
+        offset = self.position - start
+        length = end - start
+
+        if self.shard not in self.skip_shards:
+            if self.upload_url is None:
+                self.upload_url = self.client.create_upload_session(self.remote_dir, self.names[self.shard])
+            status, _, data = put_chunk(self.client, self.upload_url, bytes(piece), offset, length)
+            last = offset + len(piece) == length
+            if not (200 <= status < 300) or (last and status not in (200, 201)):
+                raise GraphError(status, data)
+
+        self.position += len(piece)
+        if self.position == end:
+            if self.on_shard_done:
+                self.on_shard_done(self.shard, length, self.shard in self.skip_shards)
+            self.shard += 1
+            self.upload_url = None
+
+    def _drain(self, final=False):
+        while self._buffer and self.position < self.total_size:
+            _, end = self._shard_bounds()
+            size = min(self.chunk_size, end - self.position)
+            if len(self._buffer) < size and not final:
+                return
+            piece = self._buffer[:size]
+            del self._buffer[:size]
+            self._send(piece)
+
+    def write(self, data):
+        self._buffer += data
+        self._drain()
+        return len(data)
+
+    def close(self):
+        self._drain(final=True)
+        if self.position != self.total_size or self._buffer:
+            raise GraphError(0, f"archive size mismatch: wrote {self.position + len(self._buffer)} "
+                                f"of {self.total_size} bytes (files changed while archiving?)".encode())
+
+
+def upload_archive(client, members, remote_dir, archive_name, shard_size,
+                   chunk_size=DEFAULT_CHUNK_SIZE, journal=None, on_file_done=None):
+    """
+    Stream members as one tar into remote_dir/archive_name.tar[.NNN] shards.
+    Completed shards are recorded in the journal (if any) and skipped on a rerun
+    of the same file set. on_file_done(path) fires once the shard holding the
+    file's last byte is acknowledged. Returns the list of shard names.
+    """
+    total, ends = archive_layout(members)
+    shard_size = shard_size if shard_size and shard_size > 0 else total
+    shard_size = align_chunk_size(shard_size) if shard_size < total else total
+    shard_count = max(1, -(-total // shard_size))
+    names = shard_names(archive_name, shard_count)
+    fingerprint = archive_fingerprint(members)
+
+    def shard_key(k):
+        return f"archive:{fingerprint}:{names[k]}"
+
+    skip = set()
+    if journal:
+        done = journal.completed()
+        skip = {k for k in range(shard_count) if shard_key(k) in done}
+
+    log(f"ARCHIVE_BYTES={total}")
+    log(f"📦 Streaming {len(members)} files as {shard_count} shard(s) of ≤{shard_size / 1024 ** 2:.0f} MB → {remote_dir}")
+    if skip:
+        log(f"⏭️ {len(skip)} shard(s) already uploaded earlier")
+
+    reported = {"count": 0}
+
+    def shard_done(k, length, skipped):
+        if not skipped:
+            log(f"✅ Uploaded shard {names[k]} ({length} bytes)")
+            if journal:
+                journal.record(shard_key(k), length, 0, f"{remote_dir}/{names[k]}")
+        log(f"SHARD={k + 1}/{shard_count}")
+        shard_end = min((k + 1) * shard_size, total)
+        while reported["count"] < len(members) and ends[reported["count"]] <= shard_end:
+            if on_file_done:
+                on_file_done(members[reported["count"]][0])
+            reported["count"] += 1
+
+    writer = ShardedSessionWriter(client, remote_dir, names, total, shard_size, chunk_size,
+                                  skip_shards=skip, on_shard_done=shard_done)
+    with tarfile.open(fileobj=writer, mode="w|", format=TAR_FORMAT,
+                      encoding=TAR_ENCODING, errors="surrogateescape") as tar:
+        for path, info in members:
+            with open(path, "rb") as f:
+                tar.addfile(info, f)
+    writer.close()
+    return names
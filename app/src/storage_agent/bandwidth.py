@@ -0,0 +1,119 @@
+# bandwidth.py
+#
+# Upload bandwidth schedule of a storage unit, kept in
+# ~/onedrive_upload_state/bandwidth.json and written by the app (the unit's
+# share of its mill link). During a shift uploads are held to shift_mbps so
+# they do not compete with live inspection traffic; inside the off-shift
+# windows the rate ramps linearly from shift_mbps up to offshift_mbps over
+# ramp_minutes. 0 means unlimited.
+#
+#   {"shift_mbps": 2, "offshift_mbps": 20, "windows": ["22:00-06:00"], "ramp_minutes": 15}
+#
+# Windows are local times of the mill and may wrap past midnight;
+# "00:00-24:00" is the whole day and a window like "22:00-22:00" is empty.
+# A window never lowers the rate: with an unlimited shift rate, or an
+# off-shift rate below the shift rate, uploads keep the shift rate in it.
+# concurrency.SharedRateLimiter applies the schedule to the upload processes.
+# Standard library only and no sibling imports: the app imports this module
+# too (storage_agent.bandwidth) to place deferred uploads in the next window.
+
+import datetime
+import json
+import os
+
+SCHEDULE_PATH = os.path.expanduser("~/onedrive_upload_state/bandwidth.json")
+MB = 1024 * 1024
+
+
+def parse_window(text):
+    """"22:00-06:00" -> (start, end) in minutes after midnight (end 24:00 is 1440)."""
+    start, _, end = text.partition("-")
+
+    def minutes(value):
+        hours, _, mins = value.strip().partition(":")
+        total = int(hours) * 60 + int(mins or 0)
+        if not 0 <= total <= 24 * 60:
+            raise ValueError(f"invalid time {value!r}")
+        return total
+
+    return minutes(start) % (24 * 60), minutes(end)
+
+
+def window_length(start, end):
+    """Minutes from start to end, wrapping past midnight; 0 when start == end."""
+    return (end - start) % (24 * 60) if end != 24 * 60 else end - start
+
+
+class RateSchedule:
+    def __init__(self, shift_mbps=0, offshift_mbps=0, windows=(), ramp_minutes=0):
+        self.shift_mbps = float(shift_mbps or 0)
+        self.offshift_mbps = float(offshift_mbps or 0)
+        self.windows = [w if isinstance(w, tuple) else parse_window(w) for w in windows or ()]
+        self.ramp_minutes = float(ramp_minutes or 0)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("shift_mbps"), data.get("offshift_mbps"), data.get("windows"), data.get("ramp_minutes"))
+
+    def to_dict(self):
+        return {
+            "shift_mbps": self.shift_mbps,
+            "offshift_mbps": self.offshift_mbps,
+            "windows": [f"{s // 60:02d}:{s % 60:02d}-{e // 60:02d}:{e % 60:02d}" for s, e in self.windows],
+            "ramp_minutes": self.ramp_minutes,
+        }
+
+    @classmethod
+    def load(cls, path=SCHEDULE_PATH):
+        """Schedule from path; an unlimited one when the file is missing or unreadable."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError, AttributeError):
+            return cls()
+
+    def save(self, path=SCHEDULE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    def minutes_into_window(self, now):
+        """Minutes since the current off-shift window opened, or None during a shift."""
+        minute = now.hour * 60 + now.minute + now.second / 60
+        for start, end in self.windows:
+            length = window_length(start, end)
+            into = (minute - start) % (24 * 60)
+            if into < length:
+                return into
+        return None
+
+    def rate_at(self, now=None):
+        """
+        Allowed upload rate in bytes/s at now (a datetime); 0 = unlimited.
+        In a window the rate ramps from shift_mbps up to offshift_mbps, but
+        never below shift_mbps: an unlimited shift stays unlimited, and an
+        unlimited off-shift rate applies as soon as the window opens.
+        """
+        into = self.minutes_into_window(now or datetime.datetime.now())
+        if into is None or not self.shift_mbps:
+            return self.shift_mbps * MB
+        if not self.offshift_mbps:
+            return 0
+        offshift = max(self.offshift_mbps, self.shift_mbps)
+        if into >= self.ramp_minutes:
+            return offshift * MB
+        fraction = into / self.ramp_minutes
+        return (self.shift_mbps + (offshift - self.shift_mbps) * fraction) * MB
+
+    def next_window(self, now=None):
+        """Start of the off-shift window in effect or coming next; None without windows."""
+        now = now or datetime.datetime.now()
+        into = self.minutes_into_window(now)
+        if into is not None:
+            return now - datetime.timedelta(minutes=into)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        starts = [midnight + datetime.timedelta(days=day, minutes=start)
+                  for day in (0, 1) for start, end in self.windows if window_length(start, end)]
+        return min((s for s in starts if s > now), default=None)
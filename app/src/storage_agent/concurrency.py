@@ -0,0 +1,256 @@
+# concurrency.py
+#
+# Adaptive upload concurrency for the storage-unit engine.
+# Workers ask for a slot before each upload. Every window the controller
+# compares achieved throughput with the previous window: while adding a worker
+# keeps improving throughput it adds another, and when the extra worker did not
+# help it steps back. HTTP 429/503 halves the limit and pauses every worker
+# until Retry-After has passed.
+#
+# TokenBucket caps the byte rate; SharedRateLimiter drives it from the unit's
+# bandwidth schedule, shared by every upload process on the unit.
+
+import datetime
+import email.utils
+import os
+import threading
+import time
+
+from bandwidth import SCHEDULE_PATH, RateSchedule
+from graph_client import GraphError, log
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+DEFAULT_RETRY_AFTER = 5.0
+PROBE_AFTER_FLAT_WINDOWS = 6
+REGISTRY_DIR = os.path.expanduser("~/onedrive_upload_state/bandwidth")
+
+
+class RetryableError(GraphError):
+    """A transient upload failure; the file should be requeued."""
+
+    def __init__(self, status, retry_after=None, body=b""):
+        super().__init__(status, body)
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(headers, default=DEFAULT_RETRY_AFTER):
+    """Parse a Retry-After header (delta-seconds or HTTP date)."""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class AdaptiveConcurrency:
+    def __init__(self, initial=4, minimum=1, maximum=16, window=10.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.window = window
+
+        self.active = 0
+        self.pause_until = 0.0
+        self._cond = threading.Condition()
+        self._window_start = time.time()
+        self._window_bytes = 0
+        self._window_throttled = False
+        self._last_rate = None
+        self._last_change = 0
+        self._flat_windows = 0
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self.pause_until - time.time()
+                if wait <= 0 and self.active < self.limit:
+                    self.active += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else 1.0)
+
+    def release(self, nbytes=0):
+        with self._cond:
+            self.active -= 1
+            self._window_bytes += nbytes
+            self._adjust()
+            self._cond.notify_all()
+
+    def throttled(self, retry_after):
+        """Back off after HTTP 429/503: halve the limit and pause all workers."""
+        with self._cond:
+            now = time.time()
+            if not self._window_throttled:
+                new_limit = max(self.minimum, self.limit // 2)
+                if new_limit != self.limit:
+                    log(f"🐢 Throttled by OneDrive, workers {self.limit} → {new_limit}, pausing {retry_after:.0f}s")
+                self.limit = new_limit
+            self._window_throttled = True
+            self.pause_until = max(self.pause_until, now + retry_after)
+            self._cond.notify_all()
+
+    def _adjust(self):
+        now = time.time()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+
+        rate = self._window_bytes / elapsed
+        previous = self._last_rate
+        old_limit = self.limit
+
+        if self._window_throttled:
+            self._flat_windows = 0  # already reduced in throttled()
+        elif previous is None or rate > previous * 1.05:
+            # More workers are still paying off: add one.
+            self.limit = min(self.maximum, self.limit + 1)
+            self._flat_windows = 0
+        elif rate < previous * 0.95 and self._last_change > 0:
+            # The last added worker made things worse: take it back.
+            self.limit = max(self.minimum, self.limit - 1)
+            self._flat_windows = 0
+        else:
+            # Flat: hold, but probe upwards again now and then.
+            self._flat_windows += 1
+            if self._flat_windows >= PROBE_AFTER_FLAT_WINDOWS:
+                self.limit = min(self.maximum, self.limit + 1)
+                self._flat_windows = 0
+
+        self._last_change = self.limit - old_limit
+        if self.limit != old_limit:
+            log(f"⚙️ Workers {old_limit} → {self.limit} ({rate / 1024 ** 2:.2f} MB/s)")
+
+        self._last_rate = rate
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_throttled = False
+
+
+class TokenBucket:
+    """
+    Byte-rate limit shared by every worker: consume(n) returns once n bytes fit
+    under rate (bytes/s) with up to burst bytes of credit. Callers take their
+    bytes up front and sleep off the debt, so a file larger than the burst is
+    still sent, just followed by a longer pause. rate <= 0 disables the limit.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate or 0)
+        self.burst = float(burst if burst is not None else self.rate)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate (and burst) without losing the credit or debt already accrued."""
+        with self._lock:
+            now = self.clock()
+            if self.rate > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.rate = float(rate or 0)
+            self.burst = float(burst if burst is not None else self.rate)
+            self.tokens = min(self.tokens, self.burst)
+
+
+class SharedRateLimiter(TokenBucket):
+    """
+    Byte-rate limit of one upload process that follows the unit's bandwidth
+    schedule (bandwidth.py) and splits it between every process on the unit
+    that is currently uploading: engine runs started by the app and the sync
+    agent each take an equal share. cap (bytes/s) bounds this process on top.
+    Uploading processes heartbeat a file named by their pid under registry;
+    rate and share are re-evaluated every REFRESH_SECONDS.
+    """
+
+    REFRESH_SECONDS = 5
+    ACTIVE_SECONDS = 30  # a process that uploaded this recently counts as sharing
+    MIN_BURST = 1024 * 1024
+
+    def __init__(self, cap=0, schedule_path=SCHEDULE_PATH, registry=REGISTRY_DIR,
+                 clock=time.monotonic, sleep=time.sleep, now=datetime.datetime.now):
+        super().__init__(0, clock=clock, sleep=sleep)
+        self.cap = float(cap or 0)
+        self.schedule_path = schedule_path
+        self.registry = registry
+        self.now = now
+        self.schedule = None
+        self.sharing = 1
+        self._schedule_mtime = None
+        self._refreshed = None
+        self._refresh_lock = threading.Lock()
+        self._marker = os.path.join(registry, str(os.getpid()))
+        os.makedirs(registry, exist_ok=True)
+
+    def _active_processes(self):
+        count = 0
+        for name in os.listdir(self.registry):
+            path = os.path.join(self.registry, name)
+            try:
+                os.kill(int(name), 0)
+                active = time.time() - os.path.getmtime(path) < self.ACTIVE_SECONDS
+            except (ValueError, ProcessLookupError):
+                active = False
+                try:
+                    os.remove(path)  # left behind by a process that is gone
+                except OSError:
+                    pass
+            except OSError:
+                active = False
+            count += active
+        return max(1, count)
+
+    def refresh(self):
+        try:
+            mtime = os.path.getmtime(self.schedule_path)
+        except OSError:
+            mtime = None
+        if self.schedule is None or mtime != self._schedule_mtime:
+            self.schedule = RateSchedule.load(self.schedule_path)
+            self._schedule_mtime = mtime
+        with open(self._marker, "w"):
+            pass  # heartbeat: this process is uploading
+        self.sharing = self._active_processes()
+        unit_rate = self.schedule.rate_at(self.now())
+        rate = unit_rate / self.sharing if unit_rate > 0 else 0
+        if self.cap > 0:
+            rate = min(rate, self.cap) if rate > 0 else self.cap
+        if rate != self.rate:
+            self.set_rate(rate, max(rate, self.MIN_BURST) if rate > 0 else 0)
+        self._refreshed = self.clock()
+
+    def consume(self, amount):
+        due = self._refreshed is None or self.clock() - self._refreshed >= self.REFRESH_SECONDS
+        if due and self._refresh_lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self._refresh_lock.release()
+        return super().consume(amount)
+
+    def close(self):
+        try:
+            os.remove(self._marker)
+        except OSError:
+            pass
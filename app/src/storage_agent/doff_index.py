@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# doff_index.py
+#
+# Per-folder index of image/label files by doff id, kept on the storage unit.
+# One index per root folder (roll/date/camera, or a defect label folder) is
+# stored under ~/onedrive_upload_state/doff_index. A refresh re-lists only the
+# directories whose mtime changed since the last run (files added or removed)
+# or that are still being written to; every other directory is reused as is.
+#
+# The entries are kept sorted by doff, with a table of (doff, offset, files,
+# bytes) on top, so a doff range is two bisects and a slice.
+# file_select.py is the command-line entry point used by the app.
+
+import bisect
+import fnmatch
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+INDEX_DIR = os.path.expanduser("~/onedrive_upload_state/doff_index")
+INDEX_VERSION = 1
+HOT_SECONDS = 120  # directories modified this recently are always re-listed
+
+DoffEntry = namedtuple("DoffEntry", ["doff", "path", "size", "mtime"])
+
+
+def normalize_exts(exts):
+    """("jpg", ".PNG") -> (".jpg", ".png"); None or empty means every extension."""
+    exts = tuple(sorted({"." + e.strip().lower().lstrip(".") for e in exts or () if e.strip()}))
+    return exts or None
+
+
+def has_ext(path, exts):
+    return exts is None or os.path.splitext(path)[1].lower() in exts
+
+
+def parse_doff(name):
+    """Doff id of a file name like <roll>_<cam>_<x>_<doff>_..., or None."""
+    parts = os.path.basename(name).split("_")
+    if len(parts) < 4:
+        return None
+    try:
+        return int(parts[3])
+    except ValueError:
+        return None
+
+
+class DoffIndex:
+    """
+    Index of the regular files under root, optionally limited to names matching
+    name_pattern and to maxdepth levels (as with find).
+    """
+
+    def __init__(self, root, name_pattern=None, maxdepth=None, index_dir=INDEX_DIR):
+        self.root = os.path.abspath(root)
+        self.name_pattern = name_pattern
+        self.maxdepth = maxdepth
+        key = json.dumps([self.root, name_pattern, maxdepth])
+        self.path = os.path.join(index_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+        self.dirs = {}  # dir -> {"mtime": ns, "files": [[name, size, mtime, doff]], "subdirs": [names]}
+        self.rescanned = 0
+        self.entries = []  # DoffEntry sorted by (doff, path); files without a doff excluded
+        self.table = []  # (doff, offset into entries, files, bytes)
+        self.keys = []  # doff column of table, for bisect
+        self.undoffed = []  # DoffEntry (doff None) of files without a parsable doff
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION or data.get("root") != self.root:
+            return {}
+        return data.get("dirs", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "root": self.root, "dirs": self.dirs}, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _list_dir(self, path):
+        files, subdirs = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    if self.name_pattern and not fnmatch.fnmatch(entry.name, self.name_pattern):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    files.append([entry.name, st.st_size, st.st_mtime, parse_doff(entry.name)])
+        return files, subdirs
+
+    def refresh(self):
+        """Bring the index up to date with the folder; returns self."""
+        previous = self._load()
+        now = time.time()
+        self.dirs = {}
+        self.rescanned = 0
+        stack = [(self.root, 1)]  # (directory, depth of its files)
+        while stack:
+            path, depth = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            old = previous.get(path)
+            if old and old["mtime"] == mtime_ns and now - mtime_ns / 1e9 > HOT_SECONDS:
+                files, subdirs = old["files"], old["subdirs"]
+            else:
+                try:
+                    files, subdirs = self._list_dir(path)
+                except OSError:
+                    continue
+                self.rescanned += 1
+            if self.maxdepth is not None and depth > self.maxdepth:
+                files = []
+            self.dirs[path] = {"mtime": mtime_ns, "files": files, "subdirs": subdirs}
+            if self.maxdepth is None or depth < self.maxdepth:
+                stack.extend((os.path.join(path, name), depth + 1) for name in subdirs)
+
+        if self.rescanned or set(previous) != set(self.dirs):
+            self._save()
+        self._build()
+        return self
+
+    def _build(self):
+        entries = []
+        undoffed = []
+        for path, info in self.dirs.items():
+            for name, size, mtime, doff in info["files"]:
+                entry = DoffEntry(doff, os.path.join(path, name), size, mtime)
+                (undoffed if doff is None else entries).append(entry)
+        entries.sort()
+        self.entries = entries
+        self.undoffed = undoffed
+
+        table = []
+        for offset, entry in enumerate(entries):
+            if table and table[-1][0] == entry.doff:
+                doff, start, files, nbytes = table[-1]
+                table[-1] = (doff, start, files + 1, nbytes + entry.size)
+            else:
+                table.append((entry.doff, offset, 1, entry.size))
+        self.table = table
+        self.keys = [row[0] for row in table]
+
+    def range(self, min_doff=None, max_doff=None):
+        """Entries with min_doff <= doff <= max_doff (None = unbounded)."""
+        lo = 0 if min_doff is None else bisect.bisect_left(self.keys, min_doff)
+        hi = len(self.keys) if max_doff is None else bisect.bisect_right(self.keys, max_doff)
+        if lo >= hi:
+            return []
+        start = self.table[lo][1]
+        end = self.table[hi - 1][1] + self.table[hi - 1][2]
+        return self.entries[start:end]
+
+    def select(self, min_doff=None, max_doff=None, exts=None):
+        """range() limited to the given extensions (see normalize_exts)."""
+        entries = self.range(min_doff, max_doff)
+        if exts is None:
+            return entries
+        return [e for e in entries if has_ext(e.path, exts)]
+
+
+def merged_table(indexes, exts=None):
+    """Per-doff (files, bytes) over several indexes, sorted by doff."""
+    totals = {}
+
+    def add(doff, files, nbytes):
+        prev = totals.get(doff, (0, 0))
+        totals[doff] = (prev[0] + files, prev[1] + nbytes)
+
+    for index in indexes:
+        if exts is None:
+            for doff, _, files, nbytes in index.table:
+                add(doff, files, nbytes)
+        else:
+            for entry in index.select(exts=exts):
+                add(entry.doff, 1, entry.size)
+    return sorted((doff, files, nbytes) for doff, (files, nbytes) in totals.items())
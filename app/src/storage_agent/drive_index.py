@@ -0,0 +1,117 @@
+# drive_index.py
+#
+# Snapshot of what already exists under a OneDrive folder, used by the engine's
+# --sync mode to upload only new or changed files.
+# The folder tree is listed once with paged delta calls; drives that do not
+# support delta on a sub-folder fall back to a paged children walk.
+
+import posixpath
+import urllib.parse
+
+from graph_client import GraphError, log
+
+SELECT = "id,name,size,file,folder,deleted,parentReference"
+
+
+class DriveIndex:
+    def __init__(self, client):
+        self.client = client
+        self.files = {}  # remote path -> (size, quickXorHash or None)
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, remote_path):
+        return self.files.get(remote_path.strip("/"))
+
+    def _add(self, parent_path, item):
+        if "file" not in item or "deleted" in item:
+            return
+        hashes = item["file"].get("hashes") or {}
+        path = posixpath.join(parent_path, item["name"]).strip("/")
+        self.files[path] = (item.get("size"), hashes.get("quickXorHash"))
+
+    @staticmethod
+    def _parent_ref_path(item):
+        # parentReference.path looks like "/drives/<id>/root:/Mill/Machine/roll" when present
+        path = (item.get("parentReference") or {}).get("path")
+        if path is None:
+            return None
+        _, _, rel = path.partition("root:")
+        return urllib.parse.unquote(rel).strip("/")
+
+    def _pages(self, url):
+        while url:
+            status, body = self.client.get_json(url)
+            if status != 200:
+                raise GraphError(status, str(body).encode())
+            yield body.get("value", [])
+            url = body.get("@odata.nextLink")
+
+    def _load_delta(self, folder, folder_id):
+        # Business drives omit parentReference.path in delta results, so paths are
+        # rebuilt from parent ids relative to the listed folder.
+        folders = {}
+        files = []
+        url = f"{self.client.item_path(folder)}:/delta?$select={SELECT}"
+        for items in self._pages(url):
+            for item in items:
+                if "deleted" in item or item.get("id") == folder_id:
+                    continue
+                parent_id = (item.get("parentReference") or {}).get("id")
+                if "folder" in item:
+                    folders[item["id"]] = (parent_id, item["name"])
+                else:
+                    files.append((parent_id, item))
+
+        resolved = {folder_id: folder}
+
+        def resolve(item_id):
+            if item_id in resolved:
+                return resolved[item_id]
+            parent_id, name = folders.get(item_id, (None, None))
+            if name is None or parent_id is None:
+                return None
+            parent = resolve(parent_id)
+            resolved[item_id] = posixpath.join(parent, name) if parent is not None else None
+            return resolved[item_id]
+
+        for parent_id, item in files:
+            parent = self._parent_ref_path(item)
+            if parent is None:
+                parent = resolve(parent_id)
+            if parent is not None:
+                self._add(parent, item)
+
+    def _load_children(self, folder):
+        pending = [(folder, f"{self.client.item_path(folder)}:/children?$top=999&$select={SELECT}")]
+        while pending:
+            path, url = pending.pop()
+            for items in self._pages(url):
+                for item in items:
+                    if "folder" in item:
+                        child = posixpath.join(path, item["name"])
+                        pending.append((child, f"/v1.0/drives/{self.client.drive_id}/items/{item['id']}"
+                                               f"/children?$top=999&$select={SELECT}"))
+                    else:
+                        self._add(path, item)
+
+    def load(self, folder):
+        """List every file under folder (a drive path such as "Mill/Machine/roll")."""
+        folder = folder.strip("/")
+        self.files = {}
+        status, item = self.client.get_json(self.client.item_path(folder), op="get")
+        if status == 404:
+            log(f"ℹ️ Destination folder {folder} does not exist yet")
+            return self
+        if status != 200:
+            raise GraphError(status, str(item).encode())
+
+        try:
+            self._load_delta(folder, item["id"])
+        except GraphError as e:
+            log(f"ℹ️ Delta listing unavailable (HTTP {e.status}), walking children")
+            self.files = {}
+            self._load_children(folder)
+        log(f"📋 {len(self.files)} files already in OneDrive under {folder}")
+        return self
@@ -0,0 +1,82 @@
+# engine_metrics.py
+#
+# Request and phase timings of the upload engine on the storage unit.
+# Every Graph request (graph_client.ConnectionPool) is recorded with its kind,
+# HTTP status, latency and bytes sent/received. The kind (op) is named by the
+# GraphClient call that sends it, not guessed from the URL: a resumable
+# session's uploadUrl looks like an item path. Engine phases (stat, hash,
+# re-encode, journal, listing) are timed the same way. The totals per
+# (op, status) are printed at the end of a run as
+#   METRIC={"op": "put", "status": 201, "count": 12, "seconds": 3.2, "max": 0.9, "sent": ..., "recv": ...}
+# for the app's diagnostics panel, and with open() every request is also
+# appended to a JSON-lines file next to the run's log.
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode("utf-8"))
+    return 0
+
+
+class EngineMetrics:
+    def __init__(self):
+        self.totals = {}  # (op, status) -> [count, seconds, max, sent, recv]
+        self._file = None
+        self._lock = threading.Lock()
+
+    def open(self, path):
+        """Also append every observation to path as a JSON line."""
+        self._file = open(path, "a", encoding="utf-8")
+
+    def observe(self, op, seconds, status=None, sent=0, recv=0):
+        with self._lock:
+            total = self.totals.get((op, status))
+            if total is None:
+                total = self.totals[(op, status)] = [0, 0.0, 0.0, 0, 0]
+            total[0] += 1
+            total[1] += seconds
+            total[2] = max(total[2], seconds)
+            total[3] += sent
+            total[4] += recv
+            if self._file:
+                self._file.write(json.dumps({
+                    "ts": round(time.time(), 3), "op": op, "status": status,
+                    "ms": round(seconds * 1000, 2), "sent": sent, "recv": recv,
+                }) + "\n")
+
+    def request(self, op, body, seconds, status=None, recv=0):
+        self.observe(op, seconds, status, _body_size(body), recv)
+
+    @contextmanager
+    def timed(self, op):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(op, time.perf_counter() - start)
+
+    def lines(self):
+        """METRIC= protocol lines, one per (op, status)."""
+        with self._lock:
+            if self._file:
+                self._file.flush()
+            items = sorted(self.totals.items(), key=lambda item: (item[0][0], str(item[0][1])))
+        return [
+            "METRIC=" + json.dumps({
+                "op": op, "status": status, "count": count, "seconds": round(seconds, 6),
+                "max": round(longest, 6), "sent": sent, "recv": recv,
+            })
+            for (op, status), (count, seconds, longest, sent, recv) in items
+        ]
+
+
+metrics = EngineMetrics()
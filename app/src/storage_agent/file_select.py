@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# file_select.py
+#
+# Storage-side file selection for the doff-based collection flows.
+# The app sends the whole selection (cameras, defect types, extensions, doff
+# range) and only the answer crosses the jump tunnel: the folder tree, per-doff
+# counts, totals, or the matching paths. Listings come from the incremental
+# doff indexes (doff_index.py), so repeated queries do not walk the disk again.
+#
+#   python3 file_select.py tree DATE_DIR [--defects]
+#   python3 file_select.py summary DATE_DIR SELECTION
+#   python3 file_select.py counts DATE_DIR SELECTION [--doff MIN MAX]
+#   python3 file_select.py list DATE_DIR SELECTION [--doff MIN MAX]
+#
+# SELECTION is --camera CAM... [--defect TYPE...] [--ext EXT...]. Without
+# --defect the camera folders are searched (FDA images); with it, the label
+# folders CAM/defect/labels/TYPE (MDD, files directly inside).
+#
+# Output lines:
+#   tree     MISSING | CAMERA<TAB>cam | DEFECT<TAB>cam<TAB>type
+#   summary  DOFF<TAB>doff<TAB>files<TAB>bytes, NODOFF<TAB>files<TAB>bytes
+#   counts   FILES=<n>, BYTES=<n>
+#   list     path<TAB>size<TAB>mtime (as find -printf '%p\t%s\t%T@\n')
+
+import argparse
+import heapq
+import os
+import sys
+
+from doff_index import DoffIndex, has_ext, merged_table, normalize_exts
+
+DEFECT_LABELS = os.path.join("defect", "labels")
+
+
+def _subdirs(path):
+    try:
+        with os.scandir(path) as it:
+            return sorted(e.name for e in it if e.is_dir(follow_symlinks=False))
+    except OSError:
+        return []
+
+
+def folder_tree(date_dir, defects=False):
+    """{camera: [defect types]} of a roll/date folder, or None if it does not exist."""
+    if not os.path.isdir(date_dir):
+        return None
+    tree = {}
+    for cam in _subdirs(date_dir):
+        tree[cam] = _subdirs(os.path.join(date_dir, cam, DEFECT_LABELS)) if defects else []
+    return tree
+
+
+def selection_indexes(date_dir, cameras, defects=None):
+    """Refreshed DoffIndex per searched folder."""
+    if defects:
+        roots = [os.path.join(date_dir, cam, DEFECT_LABELS, d) for cam in cameras for d in defects]
+        maxdepth = 1
+    else:
+        roots = [os.path.join(date_dir, cam) for cam in cameras]
+        maxdepth = None
+    return [DoffIndex(root, maxdepth=maxdepth).refresh() for root in roots]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Select storage-unit files by camera, defect, extension and doff")
+    parser.add_argument("command", choices=["tree", "summary", "counts", "list"])
+    parser.add_argument("date_dir")
+    parser.add_argument("--defects", action="store_true", help="tree: include defect types per camera")
+    parser.add_argument("--camera", action="append", default=[])
+    parser.add_argument("--defect", action="append", default=[])
+    parser.add_argument("--ext", action="append", default=[])
+    parser.add_argument("--doff", nargs=2, type=int, metavar=("MIN", "MAX"))
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    if args.command == "tree":
+        tree = folder_tree(args.date_dir, args.defects)
+        if tree is None:
+            out.write("MISSING\n")
+            return 0
+        for cam, defect_types in tree.items():
+            out.write(f"CAMERA\t{cam}\n")
+            for defect in defect_types:
+                out.write(f"DEFECT\t{cam}\t{defect}\n")
+        return 0
+
+    exts = normalize_exts(args.ext)
+    indexes = selection_indexes(args.date_dir, args.camera, args.defect)
+    min_doff, max_doff = args.doff or (None, None)
+
+    if args.command == "summary":
+        for doff, files, nbytes in merged_table(indexes, exts):
+            out.write(f"DOFF\t{doff}\t{files}\t{nbytes}\n")
+        undoffed = [e for index in indexes for e in index.undoffed if has_ext(e.path, exts)]
+        out.write(f"NODOFF\t{len(undoffed)}\t{sum(e.size for e in undoffed)}\n")
+    elif args.command == "counts":
+        files = nbytes = 0
+        for index in indexes:
+            for entry in index.select(min_doff, max_doff, exts):
+                files += 1
+                nbytes += entry.size
+        out.write(f"FILES={files}\nBYTES={nbytes}\n")
+    else:
+        for entry in heapq.merge(*(index.select(min_doff, max_doff, exts) for index in indexes)):
+            out.write(f"{entry.path}\t{entry.size}\t{entry.mtime}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
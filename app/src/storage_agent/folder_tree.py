@@ -0,0 +1,131 @@
+# folder_tree.py
+#
+# Create every destination folder of an upload job once, before any file is
+# sent, and keep the folder ids on the client for the rest of the job. Uploads
+# then address their parent by id (/items/{id}:/{name}:/content), so workers
+# never look up or implicitly create folders, and parallel workers no longer
+# race to create the same new folder.
+#
+# Lookups and creations go through JSON $batch, 20 requests per call: one round
+# of GETs for every folder not yet cached, then one round of POSTs per tree
+# level for the folders that are missing.
+
+import posixpath
+import time
+
+from concurrency import DEFAULT_RETRY_AFTER, THROTTLE_STATUSES, retry_after_seconds
+from graph_client import GraphError, log, quote_path
+
+BATCH_LIMIT = 20
+BATCH_RETRIES = 5
+
+
+def ancestors(path):
+    """"a/b/c" -> ["a", "a/b", "a/b/c"]."""
+    parts = [p for p in path.strip("/").split("/") if p]
+    return ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+class FolderTree:
+    def __init__(self, client):
+        self.client = client
+
+    def _run_batch(self, requests):
+        """
+        Send requests through $batch in groups of BATCH_LIMIT; returns
+        {request id: (status, body)}. Throttled requests are retried after Retry-After.
+        """
+        by_id = {r["id"]: r for r in requests}
+        results = {}
+        pending = list(requests)
+        for attempt in range(BATCH_RETRIES + 1):
+            throttled = []
+            wait = 0.0
+            for start in range(0, len(pending), BATCH_LIMIT):
+                group = pending[start:start + BATCH_LIMIT]
+                status, headers, body = self.client.batch(group)
+                if status in THROTTLE_STATUSES:
+                    throttled.extend(group)
+                    wait = max(wait, retry_after_seconds(headers))
+                    continue
+                if status != 200:
+                    raise GraphError(status, str(body).encode())
+                for response in body.get("responses", []):
+                    if response.get("status") in THROTTLE_STATUSES and attempt < BATCH_RETRIES:
+                        throttled.append(by_id[response["id"]])
+                        wait = max(wait, retry_after_seconds(response.get("headers")))
+                    else:
+                        results[response["id"]] = (response.get("status"), response.get("body") or {})
+            if not throttled:
+                return results
+            self.client.note_throttle(wait or DEFAULT_RETRY_AFTER)
+            time.sleep(wait or DEFAULT_RETRY_AFTER)
+            pending = throttled
+        raise GraphError(429, b"folder batch still throttled after retries")
+
+    def _lookup(self, paths):
+        """Cache the ids of the given folders that exist; returns the ones that do not."""
+        drive = f"/drives/{self.client.drive_id}"
+        requests = [
+            {"id": str(i), "method": "GET", "url": f"{drive}/root:/{quote_path(path)}?$select=id,folder"}
+            for i, path in enumerate(paths)
+        ]
+        results = self._run_batch(requests)
+        missing = []
+        for i, path in enumerate(paths):
+            status, body = results.get(str(i), (None, {}))
+            if status == 200:
+                if "folder" not in body:
+                    raise GraphError(409, f"{path} exists in OneDrive but is not a folder".encode())
+                self.client.folder_ids[path] = body["id"]
+            elif status == 404:
+                missing.append(path)
+            else:
+                raise GraphError(status or 0, f"folder lookup failed for {path}: {body}".encode())
+        return missing
+
+    def _create(self, paths):
+        """Create folders whose parents are already cached; returns the ones that already existed."""
+        drive = f"/drives/{self.client.drive_id}"
+        requests = []
+        for i, path in enumerate(paths):
+            parent, name = posixpath.split(path)
+            requests.append({
+                "id": str(i),
+                "method": "POST",
+                "url": f"{drive}/items/{self.client.folder_ids[parent]}/children",
+                "body": {"name": name, "folder": {}, "@microsoft.graph.conflictBehavior": "fail"},
+                "headers": {"Content-Type": "application/json"},
+            })
+        results = self._run_batch(requests)
+        conflicts = []
+        for i, path in enumerate(paths):
+            status, body = results.get(str(i), (None, {}))
+            if status in (200, 201):
+                self.client.folder_ids[path] = body["id"]
+            elif status == 409:
+                conflicts.append(path)  # created meanwhile by another job
+            else:
+                raise GraphError(status or 0, f"could not create folder {path}: {body}".encode())
+        return conflicts
+
+    def prepare(self, remote_dirs):
+        """Make sure every folder in remote_dirs (and their parents) exists and is cached."""
+        wanted = set()
+        for remote_dir in remote_dirs:
+            wanted.update(ancestors(remote_dir))
+        unknown = sorted(p for p in wanted if p not in self.client.folder_ids)
+        if not unknown:
+            return 0
+
+        missing = self._lookup(unknown)
+        created = 0
+        for depth in sorted({p.count("/") for p in missing}):
+            level = [p for p in missing if p.count("/") == depth]
+            conflicts = self._create(level)
+            created += len(level) - len(conflicts)
+            if conflicts and self._lookup(conflicts):
+                raise GraphError(409, f"folders vanished while creating: {conflicts}".encode())
+
+        log(f"📂 {len(wanted)} destination folders ready ({created} created, {len(unknown) - len(missing)} existing)")
+        return created
@@ -0,0 +1,271 @@
+# graph_client.py
+#
+# Microsoft Graph / OneDrive client used by the storage-unit upload engine.
+# Standard library only.
+
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from engine_metrics import metrics
+from token_cache import TokenCache
+
+##########################################
+# CONFIG
+##########################################
+TENANT_ID = os.environ.get("ONEDRIVE_TENANT_ID", "{tenant_id}")
+CLIENT_ID = os.environ.get("ONEDRIVE_CLIENT_ID", "{Client_id}")
+CLIENT_SECRET = os.environ.get("ONEDRIVE_CLIENT_SECRET", "{Client_Secret}")
+DRIVE_ID = os.environ.get("ONEDRIVE_DRIVE_ID", "{Drive_id}")
+
+GRAPH_URL = os.environ.get("GRAPH_URL", "https://graph.microsoft.com")
+LOGIN_URL = os.environ.get("LOGIN_URL", "https://login.microsoftonline.com")
+
+_print_lock = threading.Lock()
+_log_file = None
+
+
+def open_log(path):
+    """Mirror every log() line into path (appending)."""
+    global _log_file
+    _log_file = open(path, "a", encoding="utf-8")
+
+
+def log(message):
+    """Thread-safe line output to stdout (read by the Streamlit side) and the log file."""
+    with _print_lock:
+        print(message, flush=True)
+        if _log_file:
+            _log_file.write(message + "\n")
+            _log_file.flush()
+
+
+class GraphError(Exception):
+    def __init__(self, status, body=b""):
+        super().__init__(f"HTTP {status}: {body[:200]!r}")
+        self.status = status
+        self.body = body
+
+
+##########################################
+# HTTP
+##########################################
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections to one host, one per worker thread.
+    Connections are reused across requests and reopened after a transport error.
+    """
+
+    def __init__(self, base_url, timeout=120):
+        parts = urllib.parse.urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def request(self, method, path, body=None, headers=None, op=None):
+        """
+        Send one request; returns (status, headers, body). Retries once on a stale connection;
+        a second failure is raised as an OSError, malformed responses included.
+        Every attempt is timed into engine_metrics under op (the method when not given).
+        """
+        op = op or method.lower()
+        path = self.prefix + path
+        for attempt in range(2):
+            conn = self._connection()
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+                metrics.request(op, body, time.perf_counter() - start, resp.status, len(data))
+                if (resp.getheader("Connection") or "").lower() == "close":
+                    self.reset()
+                return resp.status, resp.headers, data
+            except (http.client.HTTPException, OSError) as e:
+                metrics.request(op, body, time.perf_counter() - start, "error")
+                self.reset()
+                if attempt:
+                    if isinstance(e, OSError):
+                        raise
+                    # IncompleteRead, BadStatusLine, ...: a transport failure like any other
+                    raise ConnectionError(f"{method} {path}: {e!r}") from e
+                if hasattr(body, "seek"):
+                    body.seek(0)
+
+
+def quote_path(path):
+    """URL-encode a drive path in-process (replaces the per-file python3 -c call)."""
+    return urllib.parse.quote(path.strip("/"), safe="/")
+
+
+##########################################
+# GRAPH CLIENT
+##########################################
+class GraphClient:
+    def __init__(self, drive_id=DRIVE_ID):
+        self.drive_id = drive_id
+        self.graph = ConnectionPool(GRAPH_URL)
+        self.login = ConnectionPool(LOGIN_URL)
+        self.access_token = None
+        self.tokens = TokenCache(self._request_token, f"{LOGIN_URL}/{TENANT_ID}/{CLIENT_ID}")
+        self.throttle_listener = None  # callable(retry_after_seconds), set by the engine
+        self.folder_ids = {"": "root"}  # drive path -> folder id, filled by ensure_folder / folder_tree
+        self._url_pools = {}
+        self._url_pools_lock = threading.Lock()
+
+    def pool_for_url(self, url):
+        """Return (pool, path) for an absolute URL such as an upload session's uploadUrl."""
+        parts = urllib.parse.urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._url_pools_lock:
+            pool = self._url_pools.get(origin)
+            if pool is None:
+                pool = self._url_pools[origin] = ConnectionPool(origin)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        return pool, path
+
+    def _request_token(self):
+        """Log in with the client credentials; returns (token, expires_in)."""
+        log("🔑 Fetching access token...")
+        body = urllib.parse.urlencode({
+            "client_id": CLIENT_ID,
+            "scope": "https://graph.microsoft.com/.default",
+            "client_secret": CLIENT_SECRET,
+            "grant_type": "client_credentials",
+        })
+        status, _, data = self.login.request(
+            "POST", f"/{TENANT_ID}/oauth2/v2.0/token", body=body,
+            headers={"Content-Type": "application/x-www-form-urlencoded"}, op="token",
+        )
+        payload = json.loads(data or b"{}") if status == 200 else {}
+        token = payload.get("access_token")
+        if not token:
+            raise GraphError(status, data)
+        return token, payload.get("expires_in", 3600)
+
+    def fetch_token(self):
+        """Return a valid token from the shared cache (token_cache.py), logging in only when needed."""
+        self.access_token = self.tokens.get()
+        return self.access_token
+
+    def _headers(self, extra=None):
+        headers = {"Authorization": f"Bearer {self.fetch_token()}"}
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def _authorized(self, pool, method, path, body=None, headers=None, op=None):
+        """Send with the cached token; on 401 refresh it once and resend."""
+        sent = self._headers(headers)
+        response = pool.request(method, path, body=body, headers=sent, op=op)
+        if response[0] == 401:
+            self.access_token = self.tokens.get(rejected=sent["Authorization"][len("Bearer "):])
+            if hasattr(body, "seek"):
+                body.seek(0)
+            response = pool.request(method, path, body=body, headers=self._headers(headers), op=op)
+        return response
+
+    def request(self, method, path, body=None, headers=None, op=None):
+        return self._authorized(self.graph, method, path, body=body, headers=headers, op=op)
+
+    def item_path(self, remote_path):
+        return f"/v1.0/drives/{self.drive_id}/root:/{quote_path(remote_path)}"
+
+    def child_path(self, remote_dir, name):
+        """Graph path of remote_dir/name, addressed through the cached folder id when known."""
+        parent_id = self.folder_ids.get(remote_dir.strip("/"))
+        if parent_id is None:
+            return self.item_path(f"{remote_dir}/{name}")
+        return f"/v1.0/drives/{self.drive_id}/items/{parent_id}:/{quote_path(name)}"
+
+    def ensure_folder(self, parent_path, name):
+        """Return the id of parent_path/name, creating it if missing."""
+        full = f"{parent_path}/{name}".strip("/")
+        if full in self.folder_ids:
+            return self.folder_ids[full]
+        status, _, data = self.request("GET", self.item_path(full))
+        if status == 200:
+            log(f"ℹ️ Folder exists: {full}")
+            self.folder_ids[full] = json.loads(data).get("id")
+            return self.folder_ids[full]
+
+        log(f"📂 Creating folder: {full}")
+        parent = f"{self.item_path(parent_path)}:/children" if parent_path.strip("/") \
+            else f"/v1.0/drives/{self.drive_id}/root/children"
+        payload = json.dumps({"name": name, "folder": {}, "@microsoft.graph.conflictBehavior": "replace"})
+        status, _, data = self.request("POST", parent, body=payload, headers={"Content-Type": "application/json"},
+                                       op="folder")
+        if status not in (200, 201):
+            raise GraphError(status, data)
+        self.folder_ids[full] = json.loads(data).get("id")
+        return self.folder_ids[full]
+
+    def batch(self, requests):
+        """POST up to 20 requests as one JSON $batch; returns (status, headers, parsed body)."""
+        payload = json.dumps({"requests": requests})
+        status, headers, data = self.request(
+            "POST", "/v1.0/$batch", body=payload, headers={"Content-Type": "application/json"}, op="batch",
+        )
+        try:
+            return status, headers, json.loads(data or b"{}")
+        except ValueError:
+            return status, headers, {}
+
+    def note_throttle(self, retry_after):
+        if self.throttle_listener:
+            self.throttle_listener(retry_after)
+
+    def put_content(self, remote_dir, name, body):
+        """Simple upload (PUT .../content); returns (status, response headers)."""
+        path = f"{self.child_path(remote_dir, name)}:/content"
+        status, headers, _ = self.request(
+            "PUT", path, body=body, headers={"Content-Type": "application/octet-stream"}, op="put",
+        )
+        return status, headers
+
+    def create_upload_session(self, remote_dir, name):
+        """Start a Graph upload session for remote_dir/name; returns its uploadUrl."""
+        path = f"{self.child_path(remote_dir, name)}:/createUploadSession"
+        payload = json.dumps({"item": {"@microsoft.graph.conflictBehavior": "replace"}})
+        status, _, data = self.request("POST", path, body=payload, headers={"Content-Type": "application/json"},
+                                       op="session")
+        if status != 200:
+            raise GraphError(status, data)
+        return json.loads(data)["uploadUrl"]
+
+    def session_request(self, upload_url, method, body=None, headers=None, op="chunk"):
+        """Call a pre-authenticated uploadUrl (Graph rejects an Authorization header there)."""
+        pool, path = self.pool_for_url(upload_url)
+        return pool.request(method, path, body=body, headers=headers or {}, op=op)
+
+    def get_json(self, path_or_url, op="list"):
+        """GET a Graph path or an absolute @odata.nextLink; returns (status, parsed body)."""
+        if path_or_url.startswith(("http://", "https://")):
+            pool, path = self.pool_for_url(path_or_url)
+            status, _, data = self._authorized(pool, "GET", path, op=op)
+        else:
+            status, _, data = self.request("GET", path_or_url, op=op)
+        try:
+            return status, json.loads(data or b"{}")
+        except ValueError:
+            return status, {}
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+# graph_upload.py
+#
+# OneDrive (Microsoft Graph) upload engine that runs on the storage unit.
+# Shipped next to upload_to_onedrive.sh by MachineManager.copy_upload_script and
+# speaks the same stdout protocol (TOTAL_FILES= / UPLOADED= / FAILED= lines).
+#
+# Usage:
+#   python3 graph_upload.py <mill> <machine> <file-or-folder>
+#   python3 graph_upload.py <mill> <machine> --manifest <file> [--workers N]
+#
+# Files above --large-file-mb go through resumable upload sessions in
+# --chunk-size-mb chunks (see upload_session.py).
+#
+# With --journal <name> (normally the roll name) completed files are recorded in
+# an SQLite journal and skipped on reruns while their size and mtime are unchanged
+# (see upload_journal.py). Skipped files are reported as SKIPPED=<path>.
+#
+# --sync lists the destination tree once (drive_index.py) and also skips files
+# whose size and quickXorHash already match the copy in OneDrive.
+#
+# --archive <name> [--shard-mb N] streams the files as one tar, split into
+# N MB shards, into <mill>/<machine>/archives/ instead of uploading them one by
+# one (see archive_stream.py).
+#
+# Destination folders are created up front in $batch calls and their ids cached,
+# so uploads address their parent folder by id (folder_tree.py).
+#
+# Concurrency adapts between --min-workers and --max-workers, starting at
+# --workers (concurrency.py): throughput is measured per window and workers are
+# added while that keeps paying off. HTTP 429/503 halve the worker count and
+# pause uploads for Retry-After; transient failures are requeued up to --retries
+# times before a file is reported FAILED. The byte rate follows the unit's
+# bandwidth schedule (bandwidth.py: shift cap, off-shift windows with a ramp),
+# shared with the other upload processes on the unit; --max-mbps caps this run
+# on top of that.
+#
+# --jpeg-quality / --max-dim / --grayscale re-encode JPEGs in a process pool
+# before upload (image_transform.py) into <mill>/<machine>/reduced_q<Q>[...],
+# a separate tree and journal from the full-resolution copies; the bytes saved
+# are reported as TRANSFORM_BYTES_IN= / TRANSFORM_BYTES_OUT= lines.
+#
+# Request latency, status and bytes per request kind, and the time spent in
+# stat / hash / re-encode / journal / listing, are printed as METRIC= lines at
+# the end of a run; every request is also logged to upload_<ts>.requests.jsonl
+# (engine_metrics.py).
+#
+# GRAPH_URL and LOGIN_URL may point at a local mock server (http:// is accepted):
+# app/tests/fake_graph.py fakes the endpoints used here and backs the engine's
+# end-to-end tests (app/tests/test_graph_upload.py).
+# Only the Python standard library is used; the storage unit has nothing else.
+
+import argparse
+import os
+import posixpath
+import queue
+import random
+import sys
+import threading
+import time
+
+from archive_stream import build_members, upload_archive
+from concurrency import (
+    DEFAULT_RETRY_AFTER, RETRYABLE_STATUSES, THROTTLE_STATUSES,
+    AdaptiveConcurrency, RetryableError, SharedRateLimiter, retry_after_seconds,
+)
+from drive_index import DriveIndex
+from engine_metrics import metrics
+from folder_tree import FolderTree
+from graph_client import GraphClient, GraphError, log, open_log
+from image_transform import DEFAULT_QUALITY, ImageTransformer, ScratchArea, TransformSpec
+from quickxor import QuickXorHash, file_quickxor
+from upload_journal import UploadJournal
+from upload_session import DEFAULT_CHUNK_SIZE, LARGE_FILE_THRESHOLD, ResumableUpload
+
+DATA_BASE = "/home/kniti/projects/knit-i/knitting-core/data"
+IMAGES_BASE = "/home/kniti/projects/knit-i/knitting-core/images"
+LOG_DIR = os.path.expanduser("~/onedrive_upload_logs")
+
+DEFAULT_WORKERS = 4
+MIN_WORKERS = 1
+MAX_WORKERS = 16
+DEFAULT_RETRIES = 5
+
+
+##########################################
+# UPLOAD ENGINE
+##########################################
+def relative_remote_dir(local_path, root_path, base_folder=None):
+    """Mirror a storage-unit path under <mill>/<machine> the same way upload_to_onedrive.sh does."""
+    if base_folder:
+        rel = os.path.relpath(local_path, base_folder)
+    elif local_path.startswith(DATA_BASE + "/"):
+        rel = local_path[len(DATA_BASE) + 1:]
+    elif local_path.startswith(IMAGES_BASE + "/"):
+        rel = local_path[len(IMAGES_BASE) + 1:]
+    else:
+        rel = os.path.basename(local_path)
+    rel_dir = os.path.dirname(rel)
+    return f"{root_path}/{rel_dir}" if rel_dir else root_path
+
+
+class UploadEngine:
+    def __init__(self, client, root_path, workers=DEFAULT_WORKERS, base_folder=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, large_file_threshold=LARGE_FILE_THRESHOLD,
+                 journal=None, sync=False, min_workers=MIN_WORKERS, max_workers=MAX_WORKERS,
+                 retries=DEFAULT_RETRIES, rate_limiter=None, transformer=None):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.transformer = transformer
+        self.root_path = root_path
+        self.limiter = AdaptiveConcurrency(workers, min_workers, max_workers)
+        self.retries = max(0, retries)
+        client.throttle_listener = self.limiter.throttled
+        self.base_folder = base_folder
+        self.large_file_threshold = large_file_threshold
+        self.resumable = ResumableUpload(client, chunk_size=chunk_size)
+        self.journal = journal
+        self.sync = sync
+        self.drive_index = None
+        self.uploaded = []
+        self.skipped = []
+        self.failed = []
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._all_done = threading.Event()
+
+    def remote_path_for(self, local_path):
+        remote_dir = relative_remote_dir(local_path, self.root_path, self.base_folder)
+        return f"{remote_dir}/{os.path.basename(local_path)}"
+
+    def _already_in_drive(self, local_path, size, remote_path, data=None):
+        """True when OneDrive already holds an identical copy (size + quickXorHash)."""
+        if not self.drive_index:
+            return False
+        remote = self.drive_index.get(remote_path)
+        if not remote or remote[0] != size or not remote[1]:
+            return False
+        with metrics.timed("hash"):
+            if data is not None:
+                h = QuickXorHash()
+                h.update(data)
+                return h.b64digest() == remote[1]
+            return file_quickxor(local_path) == remote[1]
+
+    def upload_one(self, local_path):
+        """
+        Upload one file; returns ("uploaded" | "skipped" | "failed", bytes sent).
+        The bytes sent are those of the re-encoded copy when one replaced the file.
+        """
+        if not os.path.isfile(local_path):
+            log(f"❌ Path not found: {local_path}")
+            return "failed", 0
+
+        with metrics.timed("stat"):
+            stat = os.stat(local_path)
+        remote_dir = relative_remote_dir(local_path, self.root_path, self.base_folder)
+        name = os.path.basename(local_path)
+        # Re-encoded bytes replace the file contents; the journal keeps the original's stat
+        data = None
+        if self.transformer:
+            with metrics.timed("transform"):
+                data = self.transformer.transform(local_path)
+        size = stat.st_size if data is None else len(data)
+
+        if self._already_in_drive(local_path, size, f"{remote_dir}/{name}", data):
+            if self.journal:
+                self.journal.record(local_path, stat.st_size, stat.st_mtime, f"{remote_dir}/{name}")
+            return "skipped", 0
+
+        if self.rate_limiter:
+            self.rate_limiter.consume(size)
+        log(f"⬆️ Uploading {name} → {remote_dir}")
+        headers = None
+        if data is not None and size > self.large_file_threshold:
+            with self.transformer.scratch.spill(data, name) as scratch_path:
+                status = self.resumable.upload(scratch_path, remote_dir, name)
+        elif data is not None:
+            status, headers = self.client.put_content(remote_dir, name, data)
+        elif size > self.large_file_threshold:
+            status = self.resumable.upload(local_path, remote_dir, name)
+        else:
+            with open(local_path, "rb") as f:
+                status, headers = self.client.put_content(remote_dir, name, f.read())
+
+        if status in RETRYABLE_STATUSES:
+            retry_after = retry_after_seconds(headers) if status in THROTTLE_STATUSES else None
+            raise RetryableError(status, retry_after)
+        if 200 <= status < 300:
+            log(f"✅ Uploaded {name} successfully")
+            if self.journal:
+                self.journal.record(local_path, stat.st_size, stat.st_mtime, f"{remote_dir}/{name}")
+            return "uploaded", size
+        log(f"❌ Failed to upload {name} (HTTP {status})")
+        return "failed", 0
+
+    def _attempt(self, local_path):
+        """One upload attempt inside a concurrency slot."""
+        self.limiter.acquire()
+        nbytes = 0
+        try:
+            outcome, nbytes = self.upload_one(local_path)
+            return outcome
+        finally:
+            self.limiter.release(nbytes)
+
+    def _retry_later(self, jobs, local_path, attempt, error):
+        status = getattr(error, "status", None)
+        if status in THROTTLE_STATUSES:
+            delay = getattr(error, "retry_after", None) or DEFAULT_RETRY_AFTER
+            self.limiter.throttled(delay)
+        else:
+            delay = min(60, 2 ** attempt) + random.uniform(0, 1)
+        reason = f"HTTP {status}" if status else str(error)
+        log(f"🔁 {os.path.basename(local_path)}: {reason}, retry {attempt + 1}/{self.retries} in {delay:.0f}s")
+        timer = threading.Timer(delay, jobs.put, args=((local_path, attempt + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def _finish(self, local_path, outcome):
+        with self._lock:
+            getattr(self, outcome).append(local_path)
+            self._outstanding -= 1
+            if self._outstanding == 0:
+                self._all_done.set()
+        log(f"{outcome.upper()}={local_path}")
+
+    def _worker(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            local_path, attempt = job
+            try:
+                outcome = self._attempt(local_path)
+            except (GraphError, OSError) as e:
+                transient = isinstance(e, OSError) or e.status in RETRYABLE_STATUSES
+                if transient and attempt < self.retries:
+                    self._retry_later(jobs, local_path, attempt, e)
+                    continue
+                log(f"❌ Failed to upload {local_path}: {e}")
+                outcome = "failed"
+            except Exception as e:
+                log(f"❌ Failed to upload {local_path}: {e}")
+                outcome = "failed"
+            self._finish(local_path, outcome)
+
+    def load_drive_index(self, paths):
+        """List the smallest destination subtree covering all paths, once."""
+        remote_dirs = {posixpath.dirname(self.remote_path_for(p)) for p in paths}
+        if not remote_dirs:
+            return
+        self.drive_index = DriveIndex(self.client).load(posixpath.commonpath(sorted(remote_dirs)))
+
+    def run(self, paths):
+        paths = [p for p in paths if p]
+        log(f"TOTAL_FILES={len(paths)}")
+
+        if self.journal:
+            with metrics.timed("journal"):
+                paths, self.skipped = self.journal.pending(paths, self.remote_path_for)
+            if self.skipped:
+                log(f"⏭️ {len(self.skipped)} files already uploaded (journal '{self.journal.name}')")
+                for p in self.skipped:
+                    log(f"SKIPPED={p}")
+
+        if self.sync and paths:
+            try:
+                with metrics.timed("drive_index"):
+                    self.load_drive_index(paths)
+            except (GraphError, OSError) as e:
+                log(f"⚠️ Could not list OneDrive contents, uploading everything: {e}")
+
+        if paths:
+            try:
+                with metrics.timed("folders"):
+                    FolderTree(self.client).prepare({posixpath.dirname(self.remote_path_for(p)) for p in paths})
+            except (GraphError, OSError) as e:
+                log(f"⚠️ Could not pre-create folders, uploading by path: {e}")
+
+        limiter = self.limiter
+        log(f"🔹 Uploading {len(paths)} files (workers={limiter.limit}, "
+            f"adaptive {limiter.minimum}-{limiter.maximum})...")
+
+        jobs = queue.Queue()
+        threads = [threading.Thread(target=self._worker, args=(jobs,), daemon=True)
+                   for _ in range(min(limiter.maximum, max(1, len(paths))))]
+        for t in threads:
+            t.start()
+        self._outstanding = len(paths)
+        if not paths:
+            self._all_done.set()
+        for p in paths:
+            jobs.put((p, 0))
+        # Retries are requeued by timers, so wait for every file to settle
+        # before stopping the workers.
+        self._all_done.wait()
+        for _ in threads:
+            jobs.put(None)
+        for t in threads:
+            t.join()
+
+        if self.transformer:
+            self.transformer.report()
+        log(f"FAILED_COUNT={len(self.failed)}")
+        return not self.failed
+
+
+def run_archive(client, engine, paths, archive_name, shard_size, chunk_size):
+    """Upload paths as a sharded tar stream; emits the same per-file protocol lines."""
+    root_prefix = engine.root_path + "/"
+    members = build_members(paths, lambda p: engine.remote_path_for(p)[len(root_prefix):])
+    missing = set(paths) - {path for path, _ in members}
+    log(f"TOTAL_FILES={len(paths)}")
+    for path in missing:
+        log(f"FAILED={path}")
+
+    archive_dir = f"{engine.root_path}/archives"
+    try:
+        FolderTree(client).prepare([archive_dir])
+    except (GraphError, OSError) as e:
+        log(f"⚠️ Could not pre-create {archive_dir}, uploading by path: {e}")
+
+    done = set()
+
+    def file_done(path):
+        done.add(path)
+        log(f"UPLOADED={path}")
+
+    try:
+        upload_archive(
+            client, members, archive_dir, archive_name, shard_size,
+            chunk_size=chunk_size, journal=engine.journal, on_file_done=file_done,
+        )
+    except (GraphError, OSError) as e:
+        log(f"❌ Archive upload failed: {e}")
+        for path, _ in members:
+            if path not in done:
+                log(f"FAILED={path}")
+        log(f"FAILED_COUNT={len(paths) - len(done)}")
+        return False
+
+    log(f"FAILED_COUNT={len(missing)}")
+    return not missing
+
+
+##########################################
+# MAIN
+##########################################
+def read_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def list_folder(folder):
+    paths = []
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            paths.append(os.path.join(dirpath, name))
+    return paths
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload storage-unit files to OneDrive")
+    parser.add_argument("mill")
+    parser.add_argument("machine")
+    parser.add_argument("path", nargs="?", help="file or folder to upload")
+    parser.add_argument("--manifest", help="file with one absolute path per line")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="initial number of parallel uploads")
+    parser.add_argument("--min-workers", type=int, default=MIN_WORKERS)
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help="requeue a file this many times after throttling or transient errors")
+    parser.add_argument("--max-mbps", type=float, default=0, help="upload byte-rate cap in MB/s (0 = unlimited)")
+    parser.add_argument("--journal", help="upload journal name (e.g. the roll name); enables skip-on-rerun")
+    parser.add_argument("--reset-journal", action="store_true", help="forget completed files before uploading")
+    parser.add_argument("--sync", action="store_true", help="skip files already identical in OneDrive")
+    parser.add_argument("--archive", help="stream the files as a tar archive with this name")
+    parser.add_argument("--shard-mb", type=float, default=0, help="archive shard size (0 = single archive)")
+    parser.add_argument("--chunk-size-mb", type=float, default=DEFAULT_CHUNK_SIZE / (1024 * 1024),
+                        help="upload session chunk size (rounded down to a multiple of 320 KiB)")
+    parser.add_argument("--large-file-mb", type=float, default=LARGE_FILE_THRESHOLD / (1024 * 1024),
+                        help="files above this size use resumable upload sessions")
+    parser.add_argument("--jpeg-quality", type=int, help=f"re-encode JPEGs at this quality (default {DEFAULT_QUALITY} "
+                                                         "when --max-dim or --grayscale is given)")
+    parser.add_argument("--max-dim", type=int, default=0, help="downscale JPEGs to at most this many pixels per side")
+    parser.add_argument("--grayscale", action="store_true", help="re-encode JPEGs as grayscale")
+    parser.add_argument("--transform-workers", type=int, default=0,
+                        help="processes re-encoding images (0 = CPU count - 1, at most 4)")
+    parser.add_argument("--scratch-mb", type=float, default=512,
+                        help="disk space for re-encoded files that need an upload session")
+    return parser.parse_args(argv)
+
+
+def transform_spec(args):
+    """TransformSpec from the command line, or None when images are uploaded as they are."""
+    if args.jpeg_quality is None and not args.max_dim and not args.grayscale:
+        return None
+    quality = max(1, min(95, args.jpeg_quality or DEFAULT_QUALITY))
+    return TransformSpec(quality, max(0, args.max_dim), args.grayscale)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.manifest and not args.path:
+        log("❌ Either a path or --manifest is required")
+        return 2
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    run_name = f"upload_{time.strftime('%Y%m%d_%H%M%S')}"
+    open_log(os.path.join(LOG_DIR, f"{run_name}.log"))
+    metrics.open(os.path.join(LOG_DIR, f"{run_name}.requests.jsonl"))
+
+    log("=============================")
+    log("📤 OneDrive Upload Started")
+    log(f"Mill: {args.mill}")
+    log(f"Machine: {args.machine}")
+    log(f"Source: {args.manifest or args.path}")
+    log("=============================")
+
+    base_folder = None
+    if args.manifest:
+        paths = read_manifest(args.manifest)
+    elif os.path.isdir(args.path):
+        paths = list_folder(args.path)
+        base_folder = args.path
+    elif os.path.isfile(args.path):
+        paths = [args.path]
+    else:
+        log(f"❌ Path not found: {args.path}")
+        return 1
+
+    spec = transform_spec(args)
+    if spec and args.archive:
+        log("⚠️ Image re-encoding is not applied to archives, streaming the originals")
+        spec = None
+    root_path = f"{args.mill}/{args.machine}"
+
+    client = GraphClient()
+    try:
+        client.fetch_token()
+        log("🔹 Ensuring root folders...")
+        client.ensure_folder("", args.mill)
+        client.ensure_folder(args.mill, args.machine)
+        if spec:
+            client.ensure_folder(root_path, spec.folder)
+            root_path = f"{root_path}/{spec.folder}"
+    except (GraphError, OSError) as e:
+        log(f"❌ Failed to prepare upload: {e}")
+        return 1
+
+    journal = None
+    if args.journal:
+        # Reduced copies are tracked apart, so they never mark the originals as uploaded
+        journal = UploadJournal(f"{args.journal}@{spec.folder}" if spec else args.journal)
+        if args.reset_journal:
+            journal.reset()
+
+    rate_limiter = SharedRateLimiter(args.max_mbps * 1024 * 1024)
+    transformer = None
+    if spec:
+        transformer = ImageTransformer(spec, workers=args.transform_workers or None,
+                                       scratch=ScratchArea(max_bytes=int(args.scratch_mb * 1024 * 1024)))
+    engine = UploadEngine(
+        client, root_path, workers=args.workers, base_folder=base_folder,
+        chunk_size=int(args.chunk_size_mb * 1024 * 1024),
+        large_file_threshold=int(args.large_file_mb * 1024 * 1024),
+        journal=journal,
+        sync=args.sync,
+        min_workers=args.min_workers,
+        max_workers=args.max_workers,
+        retries=args.retries,
+        rate_limiter=rate_limiter,
+        transformer=transformer,
+    )
+    try:
+        if args.archive:
+            ok = run_archive(client, engine, paths, args.archive,
+                             int(args.shard_mb * 1024 * 1024), int(args.chunk_size_mb * 1024 * 1024))
+        else:
+            ok = engine.run(paths)
+    finally:
+        rate_limiter.close()
+        if transformer:
+            transformer.close()
+        for line in metrics.lines():
+            log(line)
+
+    log("=============================")
+    if ok:
+        log("📤 OneDrive Upload Completed!")
+        return 0
+    log(f"❌ Some of the {len(paths)} files failed to upload")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# image_transform.py
+#
+# Optional re-encoding of FDA frames before upload (graph_upload.py
+# --jpeg-quality / --max-dim / --grayscale). JPEGs are downscaled to a maximum
+# dimension, optionally converted to grayscale and re-encoded at the given
+# quality in a process pool, so the CPU work runs beside the upload threads.
+# The result is handed to the uploader in memory; only a result too large for a
+# single PUT is spilled to a bounded scratch folder for an upload session.
+#
+# Pillow is used when it is installed on the storage unit, ImageMagick's
+# `convert` otherwise. With neither, the originals are uploaded unchanged.
+
+import io
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from graph_client import log
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+SCRATCH_DIR = os.path.expanduser("~/onedrive_upload_state/transform_scratch")
+DEFAULT_SCRATCH_BYTES = 512 * 1024 * 1024
+DEFAULT_QUALITY = 85
+TRANSFORM_EXTENSIONS = (".jpg", ".jpeg")
+CONVERT_TIMEOUT = 120
+
+
+class TransformSpec(namedtuple("TransformSpec", ["quality", "max_dim", "grayscale"])):
+    @property
+    def folder(self):
+        """Remote folder of this variant, next to the full-resolution tree."""
+        name = f"reduced_q{self.quality}"
+        if self.max_dim:
+            name += f"_{self.max_dim}px"
+        if self.grayscale:
+            name += "_gray"
+        return name
+
+
+def available_backend():
+    if Image is not None:
+        return "pillow"
+    if shutil.which("convert"):
+        return "convert"
+    return None
+
+
+def _transform_pillow(path, spec):
+    resample = getattr(Image, "Resampling", Image).LANCZOS
+    with Image.open(path) as img:
+        if spec.max_dim:
+            # Lets libjpeg decode at a reduced scale instead of full resolution
+            img.draft("L" if spec.grayscale else "RGB", (spec.max_dim, spec.max_dim))
+        if spec.grayscale:
+            img = img.convert("L")
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if spec.max_dim and max(img.size) > spec.max_dim:
+            img.thumbnail((spec.max_dim, spec.max_dim), resample)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=spec.quality, optimize=True)
+    return out.getvalue()
+
+
+def _transform_convert(path, spec):
+    cmd = ["convert", path]
+    if spec.max_dim:
+        cmd += ["-resize", f"{spec.max_dim}x{spec.max_dim}>"]
+    if spec.grayscale:
+        cmd += ["-colorspace", "Gray"]
+    cmd += ["-strip", "-quality", str(spec.quality), "jpg:-"]
+    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          check=True, timeout=CONVERT_TIMEOUT).stdout
+
+
+def transform_image(path, spec, backend):
+    """Re-encoded JPEG bytes of path (runs in a pool process)."""
+    if backend == "pillow":
+        return _transform_pillow(path, spec)
+    return _transform_convert(path, spec)
+
+
+class ScratchArea:
+    """
+    Spill folder for transformed files that need an upload session.
+    Holders reserve their size first and wait while the folder would grow past
+    max_bytes, so the disk use stays bounded however many uploads run.
+    """
+
+    def __init__(self, directory=SCRATCH_DIR, max_bytes=DEFAULT_SCRATCH_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._changed = threading.Condition()
+        os.makedirs(directory, exist_ok=True)
+        self._remove_stale()
+
+    def _remove_stale(self):
+        """Drop files left behind by runs that were killed (named <pid>_...)."""
+        for name in os.listdir(self.directory):
+            pid = name.split("_", 1)[0]
+            if not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            except PermissionError:
+                pass
+
+    @contextmanager
+    def spill(self, data, name):
+        """Path of a scratch file holding data, removed when the block exits."""
+        with self._changed:
+            # A file larger than the whole area still goes through, on its own
+            while self.used and self.used + len(data) > self.max_bytes:
+                self._changed.wait()
+            self.used += len(data)
+        path = os.path.join(self.directory, f"{os.getpid()}_{threading.get_ident()}_{name}")
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+            yield path
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._changed:
+                self.used -= len(data)
+                self._changed.notify_all()
+
+
+class ImageTransformer:
+    """
+    Process pool re-encoding images for UploadEngine.
+    transform(path) returns the bytes to upload instead of the file, or None
+    when the original should be uploaded (not a JPEG, no backend, an error, or
+    the re-encoded copy would not be smaller). Bytes in/out are kept per path
+    (a retried file counts once) for report().
+    """
+
+    def __init__(self, spec, workers=None, scratch=None):
+        self.spec = spec
+        self.backend = available_backend()
+        self.scratch = scratch or ScratchArea()
+        self.pool = None
+        if self.backend:
+            workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+            # forkserver: the upload threads are already running when workers start
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+            )
+            self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        else:
+            log("⚠️ Neither Pillow nor ImageMagick is available, uploading original images")
+        self.sizes = {}  # path -> (original bytes, uploaded bytes)
+        self._lock = threading.Lock()
+
+    def transform(self, path):
+        if not self.pool or not path.lower().endswith(TRANSFORM_EXTENSIONS):
+            return None
+        size = os.path.getsize(path)
+        try:
+            data = self.pool.submit(transform_image, path, self.spec, self.backend).result()
+        except Exception as e:
+            log(f"⚠️ Could not re-encode {os.path.basename(path)}, uploading the original: {e}")
+            data = None
+        if data is not None and len(data) >= size:
+            data = None
+        with self._lock:
+            self.sizes[path] = (size, size if data is None else len(data))
+        return data
+
+    def report(self):
+        """Protocol lines with the bytes saved (TRANSFORM_BYTES_IN= / TRANSFORM_BYTES_OUT=)."""
+        with self._lock:
+            sizes = list(self.sizes.values())
+        if not sizes:
+            return
+        bytes_in = sum(s[0] for s in sizes)
+        bytes_out = sum(s[1] for s in sizes)
+        reduced = sum(1 for s in sizes if s[1] < s[0])
+        saved = 1 - bytes_out / bytes_in if bytes_in else 0
+        log(f"🗜️ Re-encoded {reduced}/{len(sizes)} images ({self.spec.folder}): "
+            f"{bytes_in / 1024 ** 2:.1f} MB → {bytes_out / 1024 ** 2:.1f} MB ({saved:.0%} saved)")
+        log(f"TRANSFORM_BYTES_IN={bytes_in}")
+        log(f"TRANSFORM_BYTES_OUT={bytes_out}")
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
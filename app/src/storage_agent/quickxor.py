@@ -0,0 +1,79 @@
+# quickxor.py
+#
+# OneDrive quickXorHash, used to compare local files with drive items.
+# Each input byte is XORed into a 160-bit state at bit offset (i * 11) mod 160
+# (wrapping around), then the total length is XORed into the last 8 bytes.
+#
+# Since 11 and 160 are coprime, the offset of byte i only depends on i mod 160,
+# so bytes are first XOR-folded into 160 slots with big-int arithmetic and the
+# rotation is applied once per slot at the end.
+
+import base64
+
+WIDTH_BITS = 160
+WIDTH_BYTES = WIDTH_BITS // 8
+SHIFT = 11
+BLOCK = 160  # bytes per fold block; one byte per slot
+READ_SIZE = BLOCK * 8192
+
+_MASK = (1 << WIDTH_BITS) - 1
+
+
+def _fold(data):
+    """XOR all BLOCK-sized blocks of data (len(data) % BLOCK == 0) together."""
+    blocks = len(data) // BLOCK
+    bits = blocks * BLOCK * 8
+    value = int.from_bytes(data, "little")
+    extra = 0
+    while blocks > 1:
+        if blocks % 2:
+            blocks -= 1
+            bits -= BLOCK * 8
+            extra ^= value >> bits
+            value &= (1 << bits) - 1
+        bits //= 2
+        blocks //= 2
+        value = (value >> bits) ^ (value & ((1 << bits) - 1))
+    return value ^ extra
+
+
+class QuickXorHash:
+    def __init__(self):
+        self._slots = 0  # BLOCK bytes, little-endian, slot j = XOR of bytes at i % BLOCK == j
+        self.length = 0
+
+    def update(self, data):
+        if not data:
+            return
+        start = self.length % BLOCK
+        padded = bytes(start) + bytes(data)
+        padded += bytes(-len(padded) % BLOCK)
+        self._slots ^= _fold(padded)
+        self.length += len(data)
+
+    def digest(self):
+        state = 0
+        slots = self._slots.to_bytes(BLOCK, "little")
+        for j, byte in enumerate(slots):
+            if byte:
+                value = byte << ((j * SHIFT) % WIDTH_BITS)
+                state ^= (value & _MASK) | (value >> WIDTH_BITS)
+        out = bytearray(state.to_bytes(WIDTH_BYTES, "little"))
+        for i, byte in enumerate(self.length.to_bytes(8, "little")):
+            out[WIDTH_BYTES - 8 + i] ^= byte
+        return bytes(out)
+
+    def b64digest(self):
+        return base64.b64encode(self.digest()).decode("ascii")
+
+
+def file_quickxor(path):
+    """Base64 quickXorHash of a local file, as reported by Graph in file.hashes."""
+    h = QuickXorHash()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.b64digest()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+# sync_agent.py
+#
+# Background sync of new machine data to OneDrive, running on the storage unit.
+# Watches knitting-core/images and knitting-core/data with inotify, batches the
+# files that finish writing per roll/date/camera, and uploads each batch with
+# the regular engine (graph_upload.UploadEngine) under a byte-rate cap and the
+# unit's bandwidth schedule (shared with app-started uploads). Uploads
+# are recorded in the same per-roll journal the app uses (journal = roll name),
+# so collecting a roll from the app afterwards only confirms that every file is
+# already synced.
+#
+# A periodic rescan of the recent date folders catches what inotify missed
+# (queue overflow, watch limit, failed uploads, files written while stopped).
+# It runs a date folder at a time between inotify reads, so events keep flowing.
+#
+#   python3 sync_agent.py start <mill> <machine> [--max-mbps 2] [--workers 2]
+#   python3 sync_agent.py stop | status
+#   python3 sync_agent.py run <mill> <machine> ...     (foreground)
+#   python3 sync_agent.py check <mill> <machine> <folder> --journal <roll>
+#
+# status prints RUNNING=<pid or 0> and the agent's state as KEY=value lines;
+# check prints TOTAL= / SYNCED= / PENDING= / PENDING_BYTES= for a folder.
+
+import argparse
+import ctypes
+import ctypes.util
+import datetime
+import errno
+import json
+import os
+import queue
+import select
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from concurrency import SharedRateLimiter
+from graph_client import GraphClient, GraphError, log, open_log
+from graph_upload import DATA_BASE, IMAGES_BASE, LOG_DIR, UploadEngine, list_folder, relative_remote_dir
+from upload_journal import UploadJournal
+
+STATE_DIR = os.path.expanduser("~/onedrive_upload_state")
+PID_PATH = os.path.join(STATE_DIR, "sync_agent.pid")
+STATUS_PATH = os.path.join(STATE_DIR, "sync_agent.json")
+WATCH_BASES = (IMAGES_BASE, DATA_BASE)
+
+DEFAULT_MAX_MBPS = 2.0
+DEFAULT_WORKERS = 2
+BATCH_FILES = 200  # upload a batch once it holds this many files...
+BATCH_SECONDS = 30  # ...or its oldest file has waited this long
+RECENT_DAYS = 2  # date folders watched and rescanned
+RESCAN_SECONDS = 30 * 60
+SETTLE_SECONDS = 10  # files found by a scan wait until unmodified this long (still being written)
+STATUS_SECONDS = 10
+
+# inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal inotify binding (ctypes, no third-party packages on the storage unit)."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}  # watch descriptor -> directory
+        self.watched = set()
+
+    def add_watch(self, path):
+        if path in self.watched:
+            return True
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                log(f"⚠️ inotify watch limit reached, {path} is covered by rescans only")
+            return False
+        self.paths[wd] = path
+        self.watched.add(path)
+        return True
+
+    def read(self, timeout):
+        """[(directory, name, mask)] of the events within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 1024 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            raw = buf[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+            offset += EVENT_HEADER.size + length
+            name = os.fsdecode(raw.split(b"\0", 1)[0])
+            if mask & IN_IGNORED:
+                self.watched.discard(self.paths.pop(wd, None))
+                continue
+            events.append((self.paths.get(wd), name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def batch_key(path):
+    """(base, roll, date, camera) of a data file, or None outside the watched layout."""
+    for base in WATCH_BASES:
+        if path.startswith(base + "/"):
+            parts = path[len(base) + 1:].split("/")
+            if len(parts) >= 4:
+                return (base, parts[0], parts[1], parts[2])
+    return None
+
+
+def recent_dates(days=RECENT_DAYS):
+    today = datetime.date.today()
+    return {(today - datetime.timedelta(days=n)).isoformat() for n in range(days)}
+
+
+def remote_path_for(root_path, local_path):
+    """Destination of local_path, as UploadEngine.remote_path_for computes it."""
+    return f"{relative_remote_dir(local_path, root_path)}/{os.path.basename(local_path)}"
+
+
+class SyncAgent:
+    def __init__(self, mill, machine, max_mbps=DEFAULT_MAX_MBPS, workers=DEFAULT_WORKERS,
+                 batch_files=BATCH_FILES, batch_seconds=BATCH_SECONDS, recent_days=RECENT_DAYS,
+                 rescan_seconds=RESCAN_SECONDS):
+        self.mill = mill
+        self.machine = machine
+        self.root_path = f"{mill}/{machine}"
+        self.workers = max(1, workers)
+        self.batch_files = batch_files
+        self.batch_seconds = batch_seconds
+        self.recent_days = recent_days
+        self.rescan_seconds = rescan_seconds
+        self.bucket = SharedRateLimiter(max_mbps * 1024 * 1024)
+        self.client = GraphClient()
+        self.inotify = Inotify()
+        self.batches = {}  # batch key -> {"paths": set, "since": time}
+        self.settling = set()  # files found in new folders, batched once unmodified for SETTLE_SECONDS
+        self.uploads = queue.Queue()
+        self.journals = {}
+        self._journals_lock = threading.Lock()
+        self.stop = threading.Event()
+        self.stats = {"uploaded": 0, "skipped": 0, "failed": 0, "batches": 0,
+                      "last_batch_at": None, "last_event_at": None, "started_at": time.time()}
+
+    # -- journal (same names and remote paths as the app's uploads) --
+    def journal(self, roll):
+        with self._journals_lock:
+            if roll not in self.journals:
+                self.journals[roll] = UploadJournal(roll)
+            return self.journals[roll]
+
+    # -- watching --
+    def watch_tree(self, path, enqueue=False):
+        """
+        Watch path and its subdirectories; with enqueue, queue files already
+        inside once they have settled (writers may still have them open).
+        """
+        for dirpath, dirnames, filenames in os.walk(path):
+            self.inotify.add_watch(dirpath)
+            if enqueue:
+                self.settling.update(os.path.join(dirpath, name) for name in filenames)
+
+    def watch_recent(self):
+        """Watch the bases, every roll folder and the recent date folders."""
+        dates = recent_dates(self.recent_days)
+        for base in WATCH_BASES:
+            if not os.path.isdir(base) or not self.inotify.add_watch(base):
+                continue
+            for roll in os.scandir(base):
+                if not roll.is_dir(follow_symlinks=False):
+                    continue
+                self.inotify.add_watch(roll.path)
+                for date in dates:
+                    date_dir = os.path.join(roll.path, date)
+                    if os.path.isdir(date_dir):
+                        self.watch_tree(date_dir)
+
+    def handle_event(self, directory, name, mask):
+        if directory is None:
+            return
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # Files can land before the watch is in place: pick them up too
+                self.watch_tree(path, enqueue=True)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self.add_file(path)
+
+    # -- batching --
+    def add_file(self, path):
+        self.settling.discard(path)
+        key = batch_key(path)
+        if key is None:
+            return
+        batch = self.batches.setdefault(key, {"paths": set(), "since": time.time()})
+        batch["paths"].add(path)
+        self.stats["last_event_at"] = time.time()
+
+    def settle_due(self):
+        """Batch the settling files nobody has modified for SETTLE_SECONDS."""
+        settled = time.time() - SETTLE_SECONDS
+        for path in list(self.settling):
+            try:
+                if os.path.getmtime(path) <= settled:
+                    self.add_file(path)
+            except OSError:
+                self.settling.discard(path)
+
+    def flush_due(self):
+        now = time.time()
+        for key in list(self.batches):
+            batch = self.batches[key]
+            if len(batch["paths"]) >= self.batch_files or now - batch["since"] >= self.batch_seconds:
+                del self.batches[key]
+                self.uploads.put((key, sorted(batch["paths"])))
+
+    def rescan(self):
+        """Queue unjournaled files of the recent date folders (catch-up)."""
+        for _ in self.rescan_steps():
+            pass
+
+    def rescan_steps(self):
+        """rescan as a generator that yields after each date folder."""
+        settled = time.time() - SETTLE_SECONDS
+        found = 0
+        for base in WATCH_BASES:
+            if not os.path.isdir(base):
+                continue
+            for roll in os.scandir(base):
+                if not roll.is_dir(follow_symlinks=False):
+                    continue
+                for date in recent_dates(self.recent_days):
+                    date_dir = os.path.join(roll.path, date)
+                    if not os.path.isdir(date_dir):
+                        continue
+                    yield
+                    paths = []
+                    for path in list_folder(date_dir):
+                        try:
+                            if os.path.getmtime(path) <= settled:
+                                paths.append(path)
+                        except OSError:
+                            continue
+                    pending, _ = self.journal(roll.name).pending(
+                        paths, lambda p: remote_path_for(self.root_path, p)
+                    )
+                    for path in pending:
+                        self.add_file(path)
+                    found += len(pending)
+        if found:
+            log(f"🔎 Rescan queued {found} unsynced files")
+        self.watch_recent()
+
+    # -- uploading --
+    def upload_batch(self, key, paths):
+        base, roll, date, camera = key
+        engine = UploadEngine(
+            self.client, self.root_path, workers=self.workers, min_workers=1, max_workers=self.workers,
+            journal=self.journal(roll), rate_limiter=self.bucket,
+        )
+        log(f"📦 Batch {roll}/{date}/{camera}: {len(paths)} files")
+        try:
+            engine.run(paths)
+        except (GraphError, OSError) as e:
+            log(f"❌ Batch {roll}/{date}/{camera} failed: {e}")
+            return
+        self.stats["uploaded"] += len(engine.uploaded)
+        self.stats["skipped"] += len(engine.skipped)
+        self.stats["failed"] += len(engine.failed)
+        self.stats["batches"] += 1
+        self.stats["last_batch_at"] = time.time()
+
+    def uploader(self):
+        while not self.stop.is_set():
+            try:
+                key, paths = self.uploads.get(timeout=1)
+            except queue.Empty:
+                continue
+            self.upload_batch(key, paths)
+
+    def write_status(self):
+        status = dict(self.stats, pid=os.getpid(), mill=self.mill, machine=self.machine,
+                      queued_files=sum(len(b["paths"]) for b in self.batches.values()),
+                      settling_files=len(self.settling),
+                      queued_batches=self.uploads.qsize(), watches=len(self.inotify.watched),
+                      rate_mbps=round(self.bucket.rate / 1024 ** 2, 2))
+        tmp = f"{STATUS_PATH}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(status, f)
+        os.replace(tmp, STATUS_PATH)
+
+    def run(self):
+        self.client.fetch_token()
+        self.client.ensure_folder("", self.mill)
+        self.client.ensure_folder(self.mill, self.machine)
+
+        self.watch_recent()
+        log(f"👀 Watching {len(self.inotify.watched)} folders for {self.root_path}")
+        threading.Thread(target=self.uploader, daemon=True).start()
+        scan = self.rescan_steps()
+        last_rescan = last_status = time.time()
+
+        while not self.stop.is_set():
+            # While a rescan is in progress, poll instead of blocking between its steps
+            for directory, name, mask in self.inotify.read(timeout=0 if scan else 1.0):
+                if mask & IN_Q_OVERFLOW:
+                    log("⚠️ inotify queue overflow, rescanning")
+                    scan = self.rescan_steps()
+                    last_rescan = time.time()
+                    continue
+                self.handle_event(directory, name, mask)
+            if scan and next(scan, StopIteration) is StopIteration:
+                scan = None
+            self.settle_due()
+            self.flush_due()
+            now = time.time()
+            if scan is None and now - last_rescan >= self.rescan_seconds:
+                scan = self.rescan_steps()
+                last_rescan = now
+            if now - last_status >= STATUS_SECONDS:
+                self.write_status()
+                last_status = now
+
+        # Queued files are not journaled yet; the startup rescan picks them up
+        self.write_status()
+        self.inotify.close()
+
+
+def synced_counts(root_path, folder, journal_name):
+    """(total, synced, pending, pending_bytes) of the files under folder."""
+    paths = list_folder(folder)
+    journal = UploadJournal(journal_name)
+    try:
+        pending, synced = journal.pending(paths, lambda p: remote_path_for(root_path, p))
+    finally:
+        journal.close()
+    pending_bytes = 0
+    for path in pending:
+        try:
+            pending_bytes += os.path.getsize(path)
+        except OSError:
+            pass
+    return len(paths), len(synced), len(pending), pending_bytes
+
+
+def running_pid():
+    try:
+        with open(PID_PATH, encoding="utf-8") as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return pid
+    except (OSError, ValueError):
+        return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Continuous OneDrive sync of new machine data")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("run", "start"):
+        p = sub.add_parser(name)
+        p.add_argument("mill")
+        p.add_argument("machine")
+        p.add_argument("--max-mbps", type=float, default=DEFAULT_MAX_MBPS, help="upload rate cap (0 = unlimited)")
+        p.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+        p.add_argument("--batch-files", type=int, default=BATCH_FILES)
+        p.add_argument("--batch-seconds", type=float, default=BATCH_SECONDS)
+        p.add_argument("--recent-days", type=int, default=RECENT_DAYS)
+        p.add_argument("--rescan-minutes", type=float, default=RESCAN_SECONDS / 60)
+    sub.add_parser("stop")
+    sub.add_parser("status")
+    p = sub.add_parser("check")
+    p.add_argument("mill")
+    p.add_argument("machine")
+    p.add_argument("folder")
+    p.add_argument("--journal", required=True, help="journal name (the roll name)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parse_args(argv)
+    os.makedirs(STATE_DIR, exist_ok=True)
+
+    if args.command == "status":
+        pid = running_pid()
+        print(f"RUNNING={pid}")
+        try:
+            with open(STATUS_PATH, encoding="utf-8") as f:
+                for key, value in json.load(f).items():
+                    print(f"{key.upper()}={value}")
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    if args.command == "stop":
+        pid = running_pid()
+        if pid:
+            os.kill(pid, signal.SIGTERM)
+        print(f"STOPPED={pid}")
+        return 0
+
+    if args.command == "check":
+        total, synced, pending, pending_bytes = synced_counts(
+            f"{args.mill}/{args.machine}", args.folder, args.journal
+        )
+        print(f"TOTAL={total}\nSYNCED={synced}\nPENDING={pending}\nPENDING_BYTES={pending_bytes}")
+        return 0
+
+    if args.command == "start":
+        pid = running_pid()
+        if not pid:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            with open(os.path.join(LOG_DIR, "sync_agent.out"), "a") as out:
+                pid = subprocess.Popen(
+                    # Same options as this call: argv is ["start", mill, machine, ...]
+                    [sys.executable, os.path.abspath(__file__), "run"] + argv[1:],
+                    stdout=out, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True,
+                ).pid
+        print(f"RUNNING={pid}")
+        return 0
+
+    # run
+    if running_pid() not in (0, os.getpid()):
+        log("❌ Sync agent already running")
+        return 1
+    with open(PID_PATH, "w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+    os.makedirs(LOG_DIR, exist_ok=True)
+    open_log(os.path.join(LOG_DIR, f"sync_agent_{time.strftime('%Y%m%d')}.log"))
+
+    agent = SyncAgent(
+        args.mill, args.machine, max_mbps=args.max_mbps, workers=args.workers,
+        batch_files=args.batch_files, batch_seconds=args.batch_seconds,
+        recent_days=args.recent_days, rescan_seconds=args.rescan_minutes * 60,
+    )
+    signal.signal(signal.SIGTERM, lambda *_: agent.stop.set())
+    log(f"🔄 Sync agent started for {agent.root_path} (max {args.max_mbps} MB/s)")
+    try:
+        agent.run()
+    except (GraphError, OSError) as e:
+        log(f"❌ Sync agent stopped: {e}")
+        return 1
+    finally:
+        agent.bucket.close()
+        if running_pid() == os.getpid():
+            os.remove(PID_PATH)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# token_cache.py
+#
+# Client-credentials token cache shared by every upload job on the storage unit.
+# The token and its expiry live in ~/onedrive_upload_state/token.json. A token
+# is reused until REFRESH_MARGIN seconds before it expires; the refresh runs
+# under an exclusive fcntl lock, and whoever gets the lock first fetches the new
+# token while the others pick it up from the file instead of logging in again.
+#
+# upload_to_onedrive.sh calls this file directly and reads the token from stdout:
+#   python3 token_cache.py
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+TOKEN_PATH = os.path.expanduser("~/onedrive_upload_state/token.json")
+REFRESH_MARGIN = 300  # seconds before expiry
+
+
+class TokenCache:
+    """
+    fetch() must return (access_token, expires_in_seconds). owner identifies the
+    credentials (tenant + client id), so a cached token for other credentials is
+    never handed out.
+    """
+
+    def __init__(self, fetch, owner, path=TOKEN_PATH, margin=REFRESH_MARGIN):
+        self.fetch = fetch
+        self.owner = hashlib.sha1(owner.encode("utf-8")).hexdigest()
+        self.path = path
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._cached = None  # {"access_token", "expires_at", "owner"}
+
+    def _fresh(self, entry):
+        return (
+            entry is not None
+            and entry.get("owner") == self.owner
+            and entry.get("access_token")
+            and entry.get("expires_at", 0) - self.margin > time.time()
+        )
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, entry):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.path)
+
+    def get(self, rejected=None):
+        """
+        Return a valid token. Pass the token Graph just rejected (HTTP 401) as
+        rejected to force a refresh unless another worker already replaced it.
+        """
+        with self._lock:
+            entry = self._cached
+            if self._fresh(entry) and entry["access_token"] != rejected:
+                return entry["access_token"]
+
+            entry = self._read()
+            if self._fresh(entry) and entry["access_token"] != rejected:
+                self._cached = entry
+                return entry["access_token"]
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    # Another job may have refreshed while we waited for the lock.
+                    entry = self._read()
+                    if not (self._fresh(entry) and entry["access_token"] != rejected):
+                        token, expires_in = self.fetch()
+                        entry = {
+                            "access_token": token,
+                            "expires_at": time.time() + float(expires_in),
+                            "owner": self.owner,
+                        }
+                        self._write(entry)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            self._cached = entry
+            return entry["access_token"]
+
+
+def main():
+    from graph_client import GraphClient, GraphError
+
+    try:
+        # stdout carries only the token; progress lines go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            token = GraphClient().fetch_token()
+        print(token)
+    except (GraphError, OSError) as e:
+        print(f"❌ Failed to fetch access token: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
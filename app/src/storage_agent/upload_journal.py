@@ -0,0 +1,83 @@
+# upload_journal.py
+#
+# Durable record of completed uploads on the storage unit.
+# Rows are keyed by (journal, local path) and remember the size and mtime that
+# were uploaded, so a rerun of the same roll skips files that are unchanged
+# since their last successful upload and only resends the remainder.
+
+import os
+import sqlite3
+import threading
+import time
+
+JOURNAL_PATH = os.path.expanduser("~/onedrive_upload_state/journal.sqlite")
+
+
+class UploadJournal:
+    def __init__(self, name, path=JOURNAL_PATH):
+        self.name = name
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                journal     TEXT NOT NULL,
+                local_path  TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                mtime       REAL NOT NULL,
+                remote_path TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (journal, local_path)
+            )
+        """)
+        self.conn.commit()
+
+    def completed(self):
+        """Return {local_path: (size, mtime, remote_path)} for this journal."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT local_path, size, mtime, remote_path FROM uploads WHERE journal = ?",
+                (self.name,),
+            ).fetchall()
+        return {path: (size, mtime, remote) for path, size, mtime, remote in rows}
+
+    def pending(self, paths, remote_path_for):
+        """
+        Split paths into (pending, skipped).
+        A path is skipped when the journal holds the same size, mtime and destination.
+        """
+        done = self.completed()
+        pending, skipped = [], []
+        for path in paths:
+            entry = done.get(path)
+            if entry:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    pending.append(path)
+                    continue
+                if entry == (stat.st_size, stat.st_mtime, remote_path_for(path)):
+                    skipped.append(path)
+                    continue
+            pending.append(path)
+        return pending, skipped
+
+    def record(self, local_path, size, mtime, remote_path):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?, ?)",
+                (self.name, local_path, size, mtime, remote_path, time.time()),
+            )
+            self.conn.commit()
+
+    def reset(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM uploads WHERE journal = ?", (self.name,))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
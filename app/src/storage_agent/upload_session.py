@@ -0,0 +1,192 @@
+# upload_session.py
+#
+# Chunked, resumable uploads through Graph upload sessions.
+# The uploadUrl and the last acknowledged offset of every large file are kept in
+# a small JSON state file, so a transfer interrupted by a dropped uplink (or a
+# killed run) resumes from that offset on the next run instead of byte zero.
+
+import hashlib
+import json
+import os
+import time
+
+from concurrency import THROTTLE_STATUSES, retry_after_seconds
+from graph_client import GraphError, log
+
+SESSION_DIR = os.path.expanduser("~/onedrive_upload_state/sessions")
+
+# Graph requires chunk sizes to be a multiple of 320 KiB.
+CHUNK_ALIGN = 320 * 1024
+DEFAULT_CHUNK_SIZE = 32 * CHUNK_ALIGN  # 10 MiB
+LARGE_FILE_THRESHOLD = 4 * 1024 * 1024
+CHUNK_RETRIES = 3
+THROTTLE_RETRIES = 8
+RANGE_RETRIES = 3  # 416 resumes in a row before the session is given up
+
+
+def align_chunk_size(size):
+    return max(CHUNK_ALIGN, int(size) // CHUNK_ALIGN * CHUNK_ALIGN)
+
+
+def next_offset(data, fallback):
+    """First offset from a nextExpectedRanges response ("12345-" / "12345-67890")."""
+    try:
+        ranges = json.loads(data or b"{}").get("nextExpectedRanges") or []
+        return int(ranges[0].split("-", 1)[0]) if ranges else fallback
+    except (ValueError, AttributeError):
+        return fallback
+
+
+def put_chunk(client, upload_url, chunk, offset, size):
+    """
+    PUT one byte range of an upload session.
+    Transport errors are retried with backoff; 429/503 wait for Retry-After (the
+    session keeps its offset, so the same range is simply sent again).
+    """
+    headers = {
+        "Content-Length": str(len(chunk)),
+        "Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{size}",
+    }
+    failures = 0
+    throttles = 0
+    while True:
+        try:
+            response = client.session_request(upload_url, "PUT", body=chunk, headers=headers)
+        except OSError:
+            failures += 1
+            if failures >= CHUNK_RETRIES:
+                raise
+            time.sleep(2 ** failures)
+            continue
+
+        status, response_headers, _ = response
+        if status in THROTTLE_STATUSES and throttles < THROTTLE_RETRIES:
+            throttles += 1
+            wait = retry_after_seconds(response_headers)
+            client.note_throttle(wait)
+            time.sleep(wait)
+            continue
+        return response
+
+
+class SessionStore:
+    """One JSON state file per in-flight upload session."""
+
+    def __init__(self, directory=SESSION_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, local_path, remote_path):
+        key = hashlib.sha1(f"{local_path}\0{remote_path}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, local_path, remote_path):
+        try:
+            with open(self._path(local_path, remote_path), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, state):
+        path = self._path(state["local_path"], state["remote_path"])
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    def clear(self, local_path, remote_path):
+        try:
+            os.remove(self._path(local_path, remote_path))
+        except FileNotFoundError:
+            pass
+
+
+class ResumableUpload:
+    def __init__(self, client, store=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.client = client
+        self.store = store or SessionStore()
+        self.chunk_size = align_chunk_size(chunk_size)
+
+    def _resume_offset(self, state):
+        """
+        Ask Graph where an existing session stands. None if the session is gone, or
+        lists no ranges left to send (complete but never committed, or broken).
+        """
+        try:
+            status, _, data = self.client.session_request(state["upload_url"], "GET", op="resume")
+        except OSError:
+            return None
+        if status != 200:
+            return None
+        return next_offset(data, None)
+
+    def _start(self, local_path, remote_dir, name, size, mtime):
+        upload_url = self.client.create_upload_session(remote_dir, name)
+        state = {
+            "local_path": local_path,
+            "remote_path": f"{remote_dir}/{name}",
+            "upload_url": upload_url,
+            "size": size,
+            "mtime": mtime,
+            "offset": 0,
+            "created": time.time(),
+        }
+        self.store.save(state)
+        return state
+
+    def upload(self, local_path, remote_dir, name):
+        """Upload local_path in chunks; returns the final HTTP status."""
+        stat = os.stat(local_path)
+        size, mtime = stat.st_size, stat.st_mtime
+        remote_path = f"{remote_dir}/{name}"
+
+        state = self.store.load(local_path, remote_path)
+        offset = None
+        if state and state.get("size") == size and state.get("mtime") == mtime:
+            offset = self._resume_offset(state)
+            if offset is not None:
+                log(f"↩️ Resuming {name} at {offset}/{size} bytes")
+        if offset is None:
+            state = self._start(local_path, remote_dir, name, size, mtime)
+            offset = 0
+
+        restarted = False
+        range_errors = 0
+        with open(local_path, "rb") as f:
+            while True:
+                f.seek(offset)
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    raise GraphError(416, b"upload session expects bytes past end of file")
+
+                status, _, data = put_chunk(self.client, state["upload_url"], chunk, offset, size)
+
+                if status in (200, 201):
+                    self.store.clear(local_path, remote_path)
+                    return status
+                if status == 202:
+                    offset = next_offset(data, offset + len(chunk))
+                    state["offset"] = offset
+                    self.store.save(state)
+                    range_errors = 0
+                elif status == 416:
+                    # Graph already has some of this range; ask where to continue.
+                    # An offset that does not move means the session is stuck.
+                    range_errors += 1
+                    resumed = self._resume_offset(state)
+                    if resumed is not None and resumed != offset and range_errors <= RANGE_RETRIES:
+                        offset = resumed
+                    elif not restarted:
+                        state = self._start(local_path, remote_dir, name, size, mtime)
+                        offset = 0
+                        restarted = True
+                        range_errors = 0
+                    else:
+                        return status
+                elif status == 404 and not restarted:
+                    # Session expired server-side; start a new one once.
+                    state = self._start(local_path, remote_dir, name, size, mtime)
+                    offset = 0
+                    restarted = True
+                else:
+                    return status
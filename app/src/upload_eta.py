@@ -0,0 +1,136 @@
+# upload_eta.py
+
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Prior for storage units without upload history yet.
+DEFAULT_BYTES_PER_SEC = 5 * 1024 * 1024
+DEFAULT_SECONDS_PER_FILE = 0.05
+MIN_FIT_RUNS = 3
+EWMA_ALPHA = 0.3
+SAMPLE_SECONDS = 2.0
+LIVE_WARMUP_FILES = 50
+
+
+class ThroughputModel(namedtuple("ThroughputModel", ["seconds_per_file", "bytes_per_sec", "runs"])):
+    """
+    Upload time = files * seconds_per_file + bytes / bytes_per_sec.
+    seconds_per_file is the per-request overhead (round trips, folder and session
+    setup) that dominates batches of many small images; bytes_per_sec is the
+    effective uplink bandwidth of the storage unit.
+    """
+
+    def estimate(self, files, nbytes):
+        return files * self.seconds_per_file + nbytes / self.bytes_per_sec
+
+    def describe(self):
+        rate = f"{self.bytes_per_sec / 1024 ** 2:.1f} MB/s + {self.seconds_per_file * 1000:.0f} ms/file"
+        if not self.runs:
+            return f"no upload history for this unit yet, assuming {rate}"
+        return f"{rate}, measured over {self.runs} past uploads"
+
+
+DEFAULT_MODEL = ThroughputModel(DEFAULT_SECONDS_PER_FILE, DEFAULT_BYTES_PER_SEC, 0)
+
+
+def fit_throughput(history, mode=None):
+    """
+    Fit a ThroughputModel to past runs (dicts with files, bytes, seconds, mode).
+    Runs of the same mode are preferred when there are enough of them.
+    """
+    rows = [r for r in history or [] if r.get("files") and r.get("seconds") and r["seconds"] > 0]
+    same_mode = [r for r in rows if r.get("mode") == mode]
+    if mode and len(same_mode) >= MIN_FIT_RUNS:
+        rows = same_mode
+    if not rows:
+        return DEFAULT_MODEL
+
+    files = np.array([r["files"] for r in rows], dtype=float)
+    nbytes = np.array([r["bytes"] for r in rows], dtype=float)
+    seconds = np.array([r["seconds"] for r in rows], dtype=float)
+
+    if len(rows) >= MIN_FIT_RUNS:
+        # Least squares on seconds ~ files * a + bytes * b, columns scaled so the
+        # byte counts (1e9+) do not swamp the file counts.
+        X = np.column_stack([files, nbytes])
+        scale = np.linalg.norm(X, axis=0)
+        scale[scale == 0] = 1.0
+        coef, _, rank, _ = np.linalg.lstsq(X / scale, seconds, rcond=None)
+        per_file, per_byte = coef / scale
+        if rank == 2 and per_file >= 0 and per_byte > 0:
+            return ThroughputModel(float(per_file), float(1.0 / per_byte), len(rows))
+
+    # Too few or too similar runs to separate the two terms: keep the default
+    # per-file overhead and attribute the rest of the time to bandwidth.
+    transfer = np.maximum(seconds - files * DEFAULT_SECONDS_PER_FILE, 0.1 * seconds)
+    bytes_per_sec = float(nbytes.sum() / transfer.sum())
+    if bytes_per_sec <= 0:
+        bytes_per_sec = DEFAULT_BYTES_PER_SEC
+    return ThroughputModel(DEFAULT_SECONDS_PER_FILE, bytes_per_sec, len(rows))
+
+
+def load_throughput_model(fetcher, mill_name, machine_name, mode=None):
+    """Fit the model for one storage unit from the central upload history."""
+    return fit_throughput(fetcher.fetch_upload_throughput(mill_name, machine_name), mode)
+
+
+class LiveEta:
+    """
+    Remaining-time estimate during an upload.
+    Starts from the historical model and blends in an EWMA of how this run
+    actually compares to it (actual / predicted time per sample), trusting the
+    live rate more as files complete.
+    """
+
+    def __init__(self, model, total_files, total_bytes, clock=None):
+        self.model = model
+        self.clock = clock or time.time
+        self.remaining_files = total_files
+        self.remaining_bytes = total_bytes
+        self.done_files = 0
+        self.ratio = None
+        self._sample_start = self.clock()
+        self._sample_files = 0
+        self._sample_bytes = 0
+
+    def skip(self, nbytes):
+        """A file that will not be transferred (already uploaded)."""
+        self.remaining_files -= 1
+        self.remaining_bytes -= nbytes
+
+    def update(self, nbytes):
+        """A file finished transferring."""
+        self.skip(nbytes)
+        self.done_files += 1
+        self._sample_files += 1
+        self._sample_bytes += nbytes
+
+        now = self.clock()
+        elapsed = now - self._sample_start
+        if elapsed < SAMPLE_SECONDS:
+            return
+        predicted = self.model.estimate(self._sample_files, self._sample_bytes)
+        if predicted > 0:
+            sample = elapsed / predicted
+            self.ratio = sample if self.ratio is None else EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * self.ratio
+        self._sample_start = now
+        self._sample_files = 0
+        self._sample_bytes = 0
+
+    def remaining(self):
+        base = self.model.estimate(max(self.remaining_files, 0), max(self.remaining_bytes, 0))
+        if self.ratio is None:
+            return base
+        weight = min(1.0, self.done_files / LIVE_WARMUP_FILES)
+        return base * (weight * self.ratio + (1 - weight))
+
+
+def format_duration(seconds):
+    seconds = int(max(0, seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    return f"{minutes}m {secs}s"
@@ -0,0 +1,175 @@
+# upload_schedule.py
+
+import datetime
+import threading
+from contextlib import contextmanager
+
+import streamlit as st
+
+from db import Fetch_data
+from remote_upload import write_bandwidth_schedule
+from storage_agent.bandwidth import RateSchedule, window_length
+
+fetcher = Fetch_data()
+
+
+def _min_rate(*rates):
+    """Tightest of several MB/s limits, where 0 means unlimited."""
+    limited = [r for r in rates if r and r > 0]
+    return min(limited) if limited else 0
+
+
+def _windows(text):
+    return [w.strip() for w in (text or "").split(",") if w.strip()]
+
+
+class BandwidthManager:
+    """
+    Keeps uploads off the mill link while production needs it.
+    Each mill has a link budget (shift and off-shift MB/s, off-shift windows,
+    ramp) and each storage unit optional caps of its own, stored in
+    upload_bandwidth. While uploads run, the mill budget is split evenly between
+    the units that are uploading and every one of them gets its share written
+    to its bandwidth.json; the engine and sync agent on the unit apply it
+    (storage_agent/bandwidth.py), so a second unit starting or finishing
+    rebalances the others within seconds.
+    """
+
+    def __init__(self, settings=fetcher):
+        self.settings = settings
+        self._active = {}  # mill -> {machine: [ssh_client, uploads]}
+        self._lock = threading.Lock()
+
+    def schedule(self, mill_name, machine_name=None, sharing=1):
+        """RateSchedule of one unit when sharing units upload at once (the mill's without a machine)."""
+        rows = self.settings.fetch_bandwidth_settings(mill_name)
+        mill = rows.get("", {})
+        unit = rows.get(machine_name, {}) if machine_name else {}
+        sharing = max(1, sharing)
+        return RateSchedule(
+            _min_rate(unit.get("shift_mbps"), (mill.get("shift_mbps") or 0) / sharing),
+            _min_rate(unit.get("offshift_mbps"), (mill.get("offshift_mbps") or 0) / sharing),
+            _windows(mill.get("windows") or unit.get("windows")),
+            mill.get("ramp_minutes") or unit.get("ramp_minutes") or 0,
+        )
+
+    def next_window(self, mill_name, now=None):
+        """Start of the mill's current or next off-shift window, or None if it has none."""
+        try:
+            return self.schedule(mill_name).next_window(now)
+        except ValueError as e:
+            print(f"Invalid off-shift windows for {mill_name}: {e}")
+            return None
+
+    def refresh(self, mill_name):
+        """Write the current share to every unit of the mill that is uploading."""
+        with self._lock:
+            units = [(machine, entry[0]) for machine, entry in self._active.get(mill_name, {}).items()]
+        for machine_name, ssh_client in units:
+            try:
+                write_bandwidth_schedule(ssh_client, self.schedule(mill_name, machine_name, len(units)).to_dict())
+            except Exception as e:
+                print(f"Could not update the bandwidth schedule of {mill_name}/{machine_name}: {e}")
+
+    def acquire(self, mill_name, machine_name, ssh_client):
+        with self._lock:
+            units = self._active.setdefault(mill_name, {})
+            entry = units.setdefault(machine_name, [ssh_client, 0])
+            entry[0] = ssh_client
+            entry[1] += 1
+        self.refresh(mill_name)
+
+    def release(self, mill_name, machine_name):
+        finished = None
+        with self._lock:
+            units = self._active.get(mill_name, {})
+            entry = units.get(machine_name)
+            if entry:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    finished = units.pop(machine_name)[0]
+                    sharing = len(units) + 1
+        if finished is not None:
+            # The unit's sync agent keeps uploading: leave it a share next to the others
+            try:
+                write_bandwidth_schedule(finished, self.schedule(mill_name, machine_name, sharing).to_dict())
+            except Exception as e:
+                print(f"Could not update the bandwidth schedule of {mill_name}/{machine_name}: {e}")
+        self.refresh(mill_name)
+
+    @contextmanager
+    def shaped(self, mill_name, machine_name, ssh_client):
+        """Hold the unit's share of the mill link for the duration of an upload."""
+        self.acquire(mill_name, machine_name, ssh_client)
+        try:
+            yield
+        finally:
+            self.release(mill_name, machine_name)
+
+
+@st.cache_resource
+def get_bandwidth_manager():
+    return BandwidthManager()
+
+
+# -----------------------
+# UI
+# -----------------------
+def off_shift_option(mill_name, key="defer"):
+    """
+    "Defer to the off-shift window" checkbox; returns the epoch time the upload
+    may start at, or None to start right away.
+    """
+    start = get_bandwidth_manager().next_window(mill_name)
+    if start is None:
+        return None
+    now = datetime.datetime.now()
+    label = "now (off-shift window open)" if start <= now else start.strftime("%a %H:%M")
+    if not st.checkbox(f"🌙 Defer to the off-shift window (starts {label})", value=False, key=key):
+        return None
+    return max(start, now).timestamp()
+
+
+def bandwidth_settings(mill_name, machine_name):
+    """Edit the mill link budget and this unit's caps."""
+    rows = fetcher.fetch_bandwidth_settings(mill_name)
+    mill = rows.get("", {})
+    unit = rows.get(machine_name, {})
+    with st.expander("📶 Upload bandwidth"):
+        st.caption(
+            "During shifts uploads are held to the shift rate so inspection traffic keeps the link; "
+            "in the off-shift windows they ramp up to the off-shift rate. The mill budget is split "
+            "between the units uploading at the same time. 0 = unlimited."
+        )
+        col1, col2 = st.columns(2)
+        col1.markdown(f"**Mill link ({mill_name})**")
+        mill_shift = col1.number_input("Shift MB/s", min_value=0.0, step=0.5,
+                                       value=float(mill.get("shift_mbps") or 0), key="bw_mill_shift")
+        mill_offshift = col1.number_input("Off-shift MB/s", min_value=0.0, step=1.0,
+                                          value=float(mill.get("offshift_mbps") or 0), key="bw_mill_offshift")
+        windows = col1.text_input("Off-shift windows", value=mill.get("windows") or "",
+                                  placeholder="22:00-06:00, 13:00-13:30", key="bw_windows")
+        ramp = col1.number_input("Ramp-up (minutes)", min_value=0.0, step=5.0,
+                                 value=float(mill.get("ramp_minutes") or 0), key="bw_ramp")
+        col2.markdown(f"**Storage unit ({machine_name})**")
+        unit_shift = col2.number_input("Shift MB/s", min_value=0.0, step=0.5,
+                                       value=float(unit.get("shift_mbps") or 0), key="bw_unit_shift")
+        unit_offshift = col2.number_input("Off-shift MB/s", min_value=0.0, step=1.0,
+                                          value=float(unit.get("offshift_mbps") or 0), key="bw_unit_offshift")
+
+        if st.button("Save bandwidth limits"):
+            try:
+                parsed = RateSchedule(windows=_windows(windows)).windows
+            except ValueError:
+                st.error("⚠️ Windows must look like 22:00-06:00 (comma separated)")
+                return
+            if any(not window_length(start, end) for start, end in parsed):
+                st.error("⚠️ A window cannot start and end at the same time (use 00:00-24:00 for the whole day)")
+                return
+            saved = fetcher.save_bandwidth_settings(mill_name, "", mill_shift, mill_offshift, windows, ramp) \
+                and fetcher.save_bandwidth_settings(mill_name, machine_name, unit_shift, unit_offshift)
+            if saved:
+                get_bandwidth_manager().refresh(mill_name)
+                st.success("✅ Saved and applied to the uploads running on this mill")
+            else:
+                st.error("❌ Could not save the bandwidth limits")
@@ -14,6 +14,15 @@ MILL_NAME="$1"
 MACHINE_NAME="$2"
 LOCAL_FOLDER="$3"
 
+# Batch mode: upload_to_onedrive.sh <mill> <machine> --manifest <file>
+# <file> holds one absolute local path per line; token and root folders are resolved once.
+MANIFEST_FILE=""
+if [[ "$LOCAL_FOLDER" == "--manifest" ]]; then
+    MANIFEST_FILE="${4:-}"
+    LOCAL_FOLDER="$MANIFEST_FILE"
+fi
+PARALLEL_JOBS=4
+
 echo "🔍 Checking required packages..."
 
 REQUIRED_PACKAGES=(curl jq parallel python3)
@@ -44,6 +53,9 @@ fi
 ##########################################
 # BASE PATH DETECTION
 ##########################################
+DATA_BASE="/home/kniti/projects/knit-i/knitting-core/data"
+IMAGES_BASE="/home/kniti/projects/knit-i/knitting-core/images"
+
 if [[ "$LOCAL_FOLDER" == /home/kniti/projects/knit-i/knitting-core/data* ]]; then
     BASE_DATA="/home/kniti/projects/knit-i/knitting-core/data"
 elif [[ "$LOCAL_FOLDER" == /home/kniti/projects/knit-i/knitting-core/images* ]]; then
@@ -72,6 +84,7 @@ echo "📤 OneDrive Upload Started"
 echo "Mill: $MILL_NAME"
 echo "Machine: $MACHINE_NAME"
 echo "Local Folder: $LOCAL_FOLDER"
+[[ -n "$MANIFEST_FILE" ]] && echo "Mode: batch manifest"
 echo "Log File: $LOG_FILE"
 echo "============================="
 
@@ -102,9 +115,22 @@ url_encode() {
     python3 -c "import urllib.parse, sys; print(urllib.parse.quote(sys.argv[1]))" "$1"
 }
 
+TOKEN_CACHE="$HOME/storage_agent/token_cache.py"
+
 get_access_token() {
-    >&2 echo "🔑 Fetching access token..."
     local token
+    # Shared cache: reuses the token of other runs until shortly before it expires.
+    if [[ -f "$TOKEN_CACHE" ]]; then
+        token=$(ONEDRIVE_TENANT_ID="$TENANT_ID" ONEDRIVE_CLIENT_ID="$CLIENT_ID" \
+            ONEDRIVE_CLIENT_SECRET="$CLIENT_SECRET" ONEDRIVE_DRIVE_ID="$DRIVE_ID" \
+            python3 "$TOKEN_CACHE") || token=""
+        if [[ -n "$token" ]]; then
+            echo "$token"
+            return
+        fi
+    fi
+
+    >&2 echo "🔑 Fetching access token..."
     token=$(curl -s -X POST "https://login.microsoftonline.com/$TENANT_ID/oauth2/v2.0/token" \
         -d "client_id=$CLIENT_ID" \
         -d "scope=https://graph.microsoft.com/.default" \
@@ -168,12 +194,37 @@ upload_file() {
 
     if [[ "$http_status" -ge 200 && "$http_status" -lt 300 ]]; then
         echo "✅ Uploaded $file_name successfully"
+        echo "UPLOADED=$file_path"
     else
         echo "❌ Failed to upload $file_name (HTTP $http_status)"
+        echo "FAILED=$file_path"
         FAILED_UPLOADS+=("$file_path")
+        return 1
     fi
 }
 
+# Upload one absolute path from a batch manifest, mirroring its location under the data/images base.
+upload_manifest_entry() {
+    local file_path="$1"
+    local rel_path
+
+    if [[ ! -f "$file_path" ]]; then
+        echo "❌ Path not found: $file_path"
+        echo "FAILED=$file_path"
+        return 1
+    fi
+
+    if [[ "$file_path" == "$DATA_BASE"/* ]]; then
+        rel_path="${file_path#$DATA_BASE/}"
+    elif [[ "$file_path" == "$IMAGES_BASE"/* ]]; then
+        rel_path="${file_path#$IMAGES_BASE/}"
+    else
+        rel_path="$(basename "$file_path")"
+    fi
+
+    upload_file "$file_path" "$ROOT_PATH/$(dirname "$rel_path")"
+}
+
 ##########################################
 # MAIN SCRIPT
 ##########################################
@@ -188,8 +239,8 @@ ensure_folder "$MILL_NAME" "$MACHINE_NAME"
 # UPLOAD LOGIC
 ##########################################
 FAILED_LOG=$(mktemp)
-export ACCESS_TOKEN DRIVE_ID ROOT_PATH FAILED_LOG
-export -f url_encode upload_file
+export ACCESS_TOKEN DRIVE_ID ROOT_PATH FAILED_LOG DATA_BASE IMAGES_BASE
+export -f url_encode upload_file upload_manifest_entry
 
 # Calculate remote directory relative to base path
 if [[ -n "$BASE_DATA" ]]; then
@@ -199,8 +250,29 @@ else
     REMOTE_DIR="$ROOT_PATH"
 fi
 
+# Batch manifest
+if [[ -n "$MANIFEST_FILE" ]]; then
+    if ! command -v parallel >/dev/null 2>&1; then
+        echo "❌ GNU parallel not found. Install it: sudo apt install parallel -y"
+        exit 1
+    fi
+
+    TOTAL=$(grep -c . "$MANIFEST_FILE" || true)
+    echo "TOTAL_FILES=$TOTAL"
+    echo "🔹 Uploading $TOTAL files from manifest in parallel (jobs=$PARALLEL_JOBS)..."
+    grep . "$MANIFEST_FILE" | parallel -j $PARALLEL_JOBS --will-cite \
+        'upload_manifest_entry {} || echo {} >> "$FAILED_LOG"'
+
+    FAILED_COUNT=$(grep -c . "$FAILED_LOG" || true)
+    echo "FAILED_COUNT=$FAILED_COUNT"
+    if [[ "$FAILED_COUNT" -gt 0 ]]; then
+        rm -f "$FAILED_LOG"
+        echo "❌ $FAILED_COUNT of $TOTAL files failed to upload"
+        exit 1
+    fi
+
 # Single file
-if [[ -f "$LOCAL_FOLDER" ]]; then
+elif [[ -f "$LOCAL_FOLDER" ]]; then
     set +x  # Disable verbose output
     upload_file "$LOCAL_FOLDER" "$REMOTE_DIR"
 
@@ -212,7 +284,6 @@ elif [[ -d "$LOCAL_FOLDER" ]]; then
         exit 1
     fi
 
-    PARALLEL_JOBS=4  
     echo "🔹 Uploading files in directory $LOCAL_FOLDER in parallel (jobs=$PARALLEL_JOBS)..."
     set -x  # Enable verbose for debugging parallel uploads
     find . -type f | parallel -j $PARALLEL_JOBS --will-cite '
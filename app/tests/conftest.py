@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+# The storage agent's modules import each other as top-level modules, as they do on the unit
+sys.path[:0] = [SRC, os.path.join(SRC, "storage_agent")]
+
+# State paths (~/onedrive_upload_state, ~/onedrive_upload_logs) are resolved at import time
+os.environ["HOME"] = tempfile.mkdtemp(prefix="data_collection_tests_")
+
+from fake_graph import FakeGraph  # noqa: E402
+
+
+@pytest.fixture
+def fake_graph(monkeypatch):
+    """A running FakeGraph that new GraphClients log in to and upload to."""
+    import graph_client
+
+    fake = FakeGraph().start()
+    monkeypatch.setattr(graph_client, "GRAPH_URL", fake.url)
+    monkeypatch.setattr(graph_client, "LOGIN_URL", fake.url)
+    yield fake
+    fake.stop()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# fake_graph.py
+#
+# In-process fake of the Microsoft Graph endpoints the storage-unit upload
+# engine uses (storage_agent/), for tests and local runs:
+#   POST /{tenant}/oauth2/v2.0/token                     client-credentials login
+#   GET  /v1.0/drives/{d}/root:/{path}                   item lookup
+#   POST .../root/children, .../root:/{path}:/children,
+#        .../items/{id}/children                         folder creation
+#   PUT  .../root:/{path}:/content, .../items/{id}:/{name}:/content
+#   POST ...:/createUploadSession                        resumable sessions
+#   GET/PUT/DELETE {uploadUrl}                           session status / chunks / cancel
+#   GET  .../root:/{path}:/delta, ...:/children          listings (--sync)
+#   POST /v1.0/$batch                                    JSON batching
+#
+# Faults are injected per test: throttle() answers the next matching requests
+# with 429 + Retry-After, expire_tokens() makes every issued token answer 401,
+# and fail_chunks_after() breaks an upload session after n accepted chunks.
+# Chunks must be multiples of 320 KiB (except the last) as in Graph, and the
+# pre-authenticated uploadUrl rejects an Authorization header.
+#
+# Standalone, for a manual run of graph_upload.py:
+#   python3 app/tests/fake_graph.py --port 8765
+#   GRAPH_URL=http://127.0.0.1:8765 LOGIN_URL=http://127.0.0.1:8765 python3 graph_upload.py ...
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from quickxor_reference import quickxor_b64
+
+CHUNK_ALIGN = 320 * 1024
+PAGE_SIZE = 3  # small, so paging is exercised
+
+
+class FakeGraph:
+    def __init__(self, host="127.0.0.1", port=0, drive_id="{Drive_id}"):
+        self.drive_id = drive_id
+        self.files = {}  # drive path -> bytes
+        self.folders = {"": "root"}  # drive path -> id
+        self.sessions = {}  # session id -> {"path", "data"}
+        self.tokens = set()
+        self.requests = []  # (method, path, status, headers) of every request
+        self.token_requests = 0
+        self._throttles = []  # [method, path regex, remaining, retry_after]
+        self._chunk_budget = None
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # -- faults --
+    def throttle(self, method="PUT", path=".*", count=1, retry_after=1):
+        with self._lock:
+            self._throttles.append([method, re.compile(path), count, retry_after])
+
+    def expire_tokens(self):
+        with self._lock:
+            self.tokens.clear()
+
+    def fail_chunks_after(self, accepted):
+        """Answer 500 to every session chunk after the next `accepted` ones."""
+        with self._lock:
+            self._chunk_budget = accepted
+
+    def heal(self):
+        with self._lock:
+            self._chunk_budget = None
+            self._throttles.clear()
+
+    # -- inspection --
+    def calls(self, method=None, pattern=None):
+        with self._lock:
+            return [r for r in self.requests
+                    if (method is None or r[0] == method) and (pattern is None or re.search(pattern, r[1]))]
+
+    # -- Graph behaviour --
+    def _item(self, path):
+        name = path.rsplit("/", 1)[-1]
+        parent = path.rsplit("/", 1)[0] if "/" in path else ""
+        reference = {"id": self.folders.get(parent), "path": f"/drives/{self.drive_id}/root:/{parent}"}
+        if path in self.folders:
+            return {"id": self.folders[path], "name": name, "folder": {}, "parentReference": reference}
+        if path in self.files:
+            data = self.files[path]
+            return {"id": f"file-{path}", "name": name, "size": len(data), "parentReference": reference,
+                    "file": {"hashes": {"quickXorHash": quickxor_b64(data)}}}
+        return None
+
+    def _path_of(self, folder_id):
+        return next((p for p, i in self.folders.items() if i == folder_id), None)
+
+    def _create_folder(self, parent, body):
+        if parent not in self.folders:
+            return 404, {"error": {"code": "itemNotFound"}}, {}
+        path = f"{parent}/{body['name']}".strip("/")
+        if path in self.files:
+            return 409, {"error": {"code": "nameAlreadyExists"}}, {}
+        if path in self.folders:
+            if body.get("@microsoft.graph.conflictBehavior") == "fail":
+                return 409, {"error": {"code": "nameAlreadyExists"}}, {}
+        else:
+            self.folders[path] = f"folder-{next(self._ids)}"
+        return 201, self._item(path), {}
+
+    def _put(self, path, data):
+        if path.rsplit("/", 1)[0] not in self.folders and "/" in path:
+            return 404, {"error": {"code": "itemNotFound", "message": "parent missing"}}, {}
+        self.files[path] = bytes(data)
+        return 201, self._item(path), {}
+
+    def _listing(self, prefix, query, direct):
+        items = [self._item(p) for p in sorted(set(self.folders) | set(self.files))
+                 if p and p != prefix and p.startswith(f"{prefix}/" if prefix else "")
+                 and (not direct or p.rsplit("/", 1)[0] == prefix)]
+        page = int(urllib.parse.parse_qs(query).get("page", ["0"])[0])
+        body = {"value": items[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]}
+        if (page + 1) * PAGE_SIZE < len(items):
+            body["@odata.nextLink"] = f"{self.url}/v1.0/drives/{self.drive_id}/root:/{prefix}:/" \
+                                      f"{'children' if direct else 'delta'}?page={page + 1}"
+        return 200, body, {}
+
+    def _session_chunk(self, session_id, body, headers):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return 404, {"error": {"code": "itemNotFound"}}, {}
+        if self._chunk_budget is not None:
+            if self._chunk_budget <= 0:
+                return 500, {"error": {"code": "generalException"}}, {}
+            self._chunk_budget -= 1
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+)$", headers.get("Content-Range") or "")
+        if not match:
+            return 400, {"error": {"code": "invalidRange"}}, {}
+        start, end, total = map(int, match.groups())
+        if start != len(session["data"]):
+            return 416, {"error": {"code": "invalidRange"}}, {}
+        if end - start + 1 != len(body) or (end + 1 < total and len(body) % CHUNK_ALIGN):
+            return 400, {"error": {"code": "invalidRange", "message": "chunks must be 320 KiB multiples"}}, {}
+        session["data"] += body
+        if len(session["data"]) >= total:
+            del self.sessions[session_id]
+            return self._put(session["path"], session["data"])
+        return 202, {"nextExpectedRanges": [f"{len(session['data'])}-"]}, {}
+
+    def _route_graph(self, method, path, query, body, headers):
+        if path == "/v1.0/$batch" and method == "POST":
+            responses = []
+            for request in json.loads(body)["requests"]:
+                url = urllib.parse.urlsplit(request["url"])
+                sub_body = json.dumps(request["body"]).encode() if request.get("body") is not None else b""
+                status, payload, sub_headers = self._route_graph(
+                    request["method"], "/v1.0" + urllib.parse.unquote(url.path), url.query, sub_body,
+                    request.get("headers") or {},
+                )
+                responses.append({"id": request["id"], "status": status, "body": payload, "headers": sub_headers})
+            return 200, {"responses": responses}, {}
+
+        drive = f"/v1.0/drives/{self.drive_id}"
+        if not path.startswith(drive):
+            return 400, {"error": {"code": "invalidRequest", "message": f"unhandled {method} {path}"}}, {}
+        rest = path[len(drive):]
+        if rest == "/root/children" and method == "POST":
+            return self._create_folder("", json.loads(body))
+
+        match = re.match(r"/items/([^/:]+)(?:/children|:/(.+?):/(content|createUploadSession))$", rest)
+        if match:
+            parent = self._path_of(match.group(1))
+            if parent is None:
+                return 404, {"error": {"code": "itemNotFound"}}, {}
+            if match.group(2) is None:
+                return self._create_folder(parent, json.loads(body))
+            target = f"{parent}/{match.group(2)}".strip("/")
+            return self._put(target, body) if match.group(3) == "content" else self._start_session(target)
+
+        match = re.match(r"/root:/(.*?)(?::/(content|children|createUploadSession|delta))?$", rest)
+        if not match:
+            return 400, {"error": {"code": "invalidRequest", "message": f"unhandled {method} {path}"}}, {}
+        target, op = match.group(1).strip("/"), match.group(2)
+        if op is None and method == "GET":
+            item = self._item(target)
+            return (200, item, {}) if item else (404, {"error": {"code": "itemNotFound"}}, {})
+        if op == "content" and method == "PUT":
+            return self._put(target, body)
+        if op == "createUploadSession" and method == "POST":
+            return self._start_session(target)
+        if op == "children" and method == "POST":
+            return self._create_folder(target, json.loads(body))
+        if op in ("children", "delta") and method == "GET":
+            if target not in self.folders:
+                return 404, {"error": {"code": "itemNotFound"}}, {}
+            return self._listing(target, query, direct=op == "children")
+        return 400, {"error": {"code": "invalidRequest", "message": f"unhandled {method} {path}"}}, {}
+
+    def _start_session(self, path):
+        session_id = f"session{next(self._ids)}"
+        self.sessions[session_id] = {"path": path, "data": bytearray()}
+        # Shaped like a real uploadUrl: pre-authenticated, on the drive's own host
+        return 200, {"uploadUrl": f"{self.url}/_api/v2.0/drives/{self.drive_id}/items/{session_id}"
+                                  f"/uploadSession?guid={session_id}"}, {}
+
+    def handle(self, method, target, body, headers):
+        """Dispatch one HTTP request; returns (status, json body or None, headers)."""
+        url = urllib.parse.urlsplit(target)
+        path = urllib.parse.unquote(url.path)
+        with self._lock:
+            for throttle in self._throttles:
+                if throttle[2] > 0 and throttle[0] == method and throttle[1].search(path):
+                    throttle[2] -= 1
+                    return 429, {"error": {"code": "activityLimitReached"}}, {"Retry-After": str(throttle[3])}
+
+            if path.endswith("/oauth2/v2.0/token") and method == "POST":
+                self.token_requests += 1
+                token = f"token-{next(self._ids)}"
+                self.tokens.add(token)
+                return 200, {"access_token": token, "token_type": "Bearer", "expires_in": 3600}, {}
+
+            match = re.match(r"/_api/v2\.0/drives/[^/]+/items/([^/]+)/uploadSession$", path)
+            if match:
+                if headers.get("Authorization"):
+                    return 401, {"error": {"code": "unauthenticated"}}, {}
+                session_id = match.group(1)
+                if method == "GET":
+                    session = self.sessions.get(session_id)
+                    if session is None:
+                        return 404, {"error": {"code": "itemNotFound"}}, {}
+                    return 200, {"nextExpectedRanges": [f"{len(session['data'])}-"]}, {}
+                if method == "DELETE":
+                    self.sessions.pop(session_id, None)
+                    return 204, None, {}
+                return self._session_chunk(session_id, body, headers)
+
+            auth = headers.get("Authorization") or ""
+            if not auth.startswith("Bearer ") or auth[len("Bearer "):] not in self.tokens:
+                return 401, {"error": {"code": "InvalidAuthenticationToken"}}, {}
+            return self._route_graph(method, path, url.query, body, headers)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, payload, headers = fake.handle(self.command, self.path, body, self.headers)
+                with fake._lock:
+                    fake.requests.append((self.command, urllib.parse.unquote(self.path), status, dict(self.headers)))
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Microsoft Graph server for the upload engine")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    fake = FakeGraph(args.host, args.port)
+    print(f"Fake Graph listening on {fake.url}", flush=True)
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
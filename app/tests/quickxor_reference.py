@@ -0,0 +1,20 @@
+# quickxor_reference.py
+#
+# Reference quickXorHash for the tests: the straightforward bit-rotation
+# definition, slow but obviously right. storage_agent/quickxor.py is checked
+# against it, and fake_graph.py uses it for the hashes it reports.
+
+import base64
+
+
+def quickxor_b64(data):
+    """Reference quickXorHash (the straightforward bit-rotation definition)."""
+    value = 0
+    for i, byte in enumerate(data):
+        shift = (i * 11) % 160
+        shifted = byte << shift
+        value ^= (shifted & ((1 << 160) - 1)) | (shifted >> 160)
+    digest = bytearray(value.to_bytes(20, "little"))
+    for i, byte in enumerate(len(data).to_bytes(8, "little")):
+        digest[12 + i] ^= byte
+    return base64.b64encode(bytes(digest)).decode()
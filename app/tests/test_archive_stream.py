@@ -0,0 +1,48 @@
+import io
+import tarfile
+
+import pytest
+
+from archive_stream import TAR_ENCODING, TAR_FORMAT, archive_layout, build_members
+
+
+@pytest.fixture
+def members(tmp_path):
+    sizes = [0, 1, 511, 512, 513, 10240, 20000]
+    paths = []
+    for i, size in enumerate(sizes):
+        path = tmp_path / f"f{i}.bin"
+        path.write_bytes(bytes([i]) * size)
+        paths.append(str(path))
+    # A name past the 100-byte ustar limit needs a GNU longname header
+    long_name = tmp_path / ("x" * 150 + ".jpg")
+    long_name.write_bytes(b"long")
+    paths.append(str(long_name))
+    return build_members(paths, lambda p: "roll/2026-10-18/cam1/" + p.rsplit("/", 1)[1])
+
+
+def test_layout_matches_tarfile(members):
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w", format=TAR_FORMAT, encoding=TAR_ENCODING) as tar:
+        for path, info in members:
+            with open(path, "rb") as f:
+                tar.addfile(info, f)
+    total, ends = archive_layout(members)
+
+    assert total == len(out.getvalue())
+    out.seek(0)
+    with tarfile.open(fileobj=out, mode="r") as tar:
+        written = tar.getmembers()
+    assert [m.name for m in written] == [info.name for _, info in members]
+    assert ends == [m.offset_data + -(-m.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE for m in written]
+
+
+def test_missing_files_are_dropped(tmp_path):
+    present = tmp_path / "a"
+    present.write_bytes(b"a")
+    members = build_members([str(present), str(tmp_path / "gone")], lambda p: p)
+    assert [path for path, _ in members] == [str(present)]
+
+
+def test_empty_archive_is_one_record():
+    assert archive_layout([]) == (tarfile.RECORDSIZE, [])
@@ -0,0 +1,88 @@
+import datetime
+
+import pytest
+
+from bandwidth import MB, RateSchedule, parse_window
+
+
+def at(hour, minute=0, day=18):
+    return datetime.datetime(2026, 10, day, hour, minute)
+
+
+def test_parse_window():
+    assert parse_window("22:00-06:00") == (22 * 60, 6 * 60)
+    assert parse_window(" 13:30 - 14 ") == (13 * 60 + 30, 14 * 60)
+    assert parse_window("00:00-24:00") == (0, 24 * 60)
+    assert parse_window("24:00-06:00") == (0, 6 * 60)
+    with pytest.raises(ValueError):
+        parse_window("25:00-06:00")
+
+
+def test_round_trip():
+    schedule = RateSchedule(2, 20, ["22:00-06:00", "13:00-13:30"], 15)
+    assert RateSchedule.from_dict(schedule.to_dict()).to_dict() == schedule.to_dict()
+
+
+def test_missing_file_is_unlimited(tmp_path):
+    schedule = RateSchedule.load(str(tmp_path / "missing.json"))
+    assert schedule.rate_at(at(12)) == 0
+
+
+@pytest.mark.parametrize("now, expected", [
+    (at(12), 2 * MB),  # shift
+    (at(21, 59), 2 * MB),
+    (at(22), 20 * MB),  # window opens
+    (at(23, 30), 20 * MB),
+    (at(0), 20 * MB),  # past midnight, same window
+    (at(5, 59), 20 * MB),
+    (at(6), 2 * MB),  # window closed
+])
+def test_window_wrapping_midnight(now, expected):
+    assert RateSchedule(2, 20, ["22:00-06:00"]).rate_at(now) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("now, expected", [
+    (at(22), 2 * MB),
+    (at(22, 5), (2 + 18 / 3) * MB),
+    (at(22, 15), 20 * MB),
+    (at(3), 20 * MB),
+])
+def test_ramp_from_shift_rate(now, expected):
+    assert RateSchedule(2, 20, ["22:00-06:00"], ramp_minutes=15).rate_at(now) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("shift, offshift, now, expected", [
+    (0, 20, at(12), 0),  # unlimited shift...
+    (0, 20, at(23), 0),  # ...is not capped by the window
+    (0, 20, at(22, 5), 0),  # nor during its ramp
+    (2, 0, at(22), 0),  # unlimited off-shift applies as the window opens
+    (10, 5, at(12), 10 * MB),
+    (10, 5, at(23), 10 * MB),  # a lower off-shift rate does not lower the shift rate
+])
+def test_window_never_lowers_the_rate(shift, offshift, now, expected):
+    assert RateSchedule(shift, offshift, ["22:00-06:00"], ramp_minutes=15).rate_at(now) == expected
+
+
+@pytest.mark.parametrize("now", [at(21, 59), at(22), at(22, 1), at(3), at(12)])
+def test_window_with_equal_ends_is_empty(now):
+    schedule = RateSchedule(2, 20, ["22:00-22:00"])
+    assert schedule.minutes_into_window(now) is None
+    assert schedule.rate_at(now) == 2 * MB
+    assert schedule.next_window(now) is None
+
+
+@pytest.mark.parametrize("now", [at(0), at(12), at(23, 59)])
+def test_whole_day_window(now):
+    schedule = RateSchedule(2, 20, ["00:00-24:00"])
+    assert schedule.rate_at(now) == 20 * MB
+    assert schedule.to_dict()["windows"] == ["00:00-24:00"]
+
+
+def test_next_window():
+    schedule = RateSchedule(2, 20, ["22:00-06:00", "13:00-13:30"])
+    assert schedule.next_window(at(9)) == at(13)
+    assert schedule.next_window(at(14)) == at(22)
+    # Inside a window: its start, even when that was the day before
+    assert schedule.next_window(at(23)) == at(22)
+    assert schedule.next_window(at(2, day=19)) == at(22, day=18)
+    assert RateSchedule(2, 20).next_window(at(9)) is None
@@ -0,0 +1,67 @@
+import pytest
+
+from concurrency import TokenBucket, retry_after_seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_burst_then_rate(clock):
+    bucket = TokenBucket(100, burst=200, clock=clock, sleep=clock.sleep)
+    assert bucket.consume(200) == 0
+    assert bucket.consume(50) == pytest.approx(0.5)
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_credit_refills_up_to_burst(clock):
+    bucket = TokenBucket(100, burst=200, clock=clock, sleep=clock.sleep)
+    bucket.consume(200)
+    clock.now += 10  # would refill 1000, capped at the burst
+    assert bucket.consume(200) == 0
+    assert bucket.consume(100) == pytest.approx(1.0)
+
+
+def test_oversized_request_goes_through_with_a_longer_pause(clock):
+    bucket = TokenBucket(100, burst=100, clock=clock, sleep=clock.sleep)
+    assert bucket.consume(1000) == pytest.approx(9.0)
+    # The debt is paid: the next bytes wait only for themselves
+    assert bucket.consume(100) == pytest.approx(1.0)
+
+
+def test_zero_rate_is_unlimited(clock):
+    bucket = TokenBucket(0, clock=clock, sleep=clock.sleep)
+    assert bucket.consume(10 ** 12) == 0
+    assert clock.slept == []
+
+
+def test_set_rate_keeps_accrued_debt(clock):
+    bucket = TokenBucket(100, burst=100, clock=clock, sleep=lambda s: None)
+    bucket.consume(300)  # 200 bytes in debt, not slept off
+    bucket.set_rate(200, burst=200)
+    assert bucket.consume(0) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"Retry-After": "7"}, 7.0),
+    ({"Retry-After": "-3"}, 0.0),
+    ({"Retry-After": "soon"}, 5.0),
+    ({}, 5.0),
+    (None, 5.0),
+])
+def test_retry_after_seconds(headers, expected):
+    assert retry_after_seconds(headers, default=5.0) == expected
@@ -0,0 +1,239 @@
+import datetime
+import re
+import sqlite3
+
+import pytest
+
+import db
+from db import QueryCache, RollRecord, roll_dates, roll_range_query
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(db.time, "time", clock)
+    return clock
+
+
+def loader(values):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return values[len(calls) - 1]
+
+    return load, calls
+
+
+def test_entries_live_for_their_ttl(clock):
+    cache = QueryCache()
+    load, calls = loader([["a"], ["b"]])
+    assert cache.get_or_load(("rolls", 1), 60, load) == ["a"]
+    clock.now += 59
+    assert cache.get_or_load(("rolls", 1), 60, load) == ["a"]
+    clock.now += 2
+    assert cache.get_or_load(("rolls", 1), 60, load) == ["b"]
+    assert len(calls) == 2
+
+
+def test_no_ttl_lives_until_invalidated(clock):
+    cache = QueryCache()
+    load, calls = loader([["a"], ["b"]])
+    cache.get_or_load(("mills",), None, load)
+    clock.now += 10 ** 6
+    assert cache.get_or_load(("mills",), None, load) == ["a"]
+    cache.invalidate()
+    assert cache.get_or_load(("mills",), None, load) == ["b"]
+
+
+def test_invalidate_by_prefix(clock):
+    cache = QueryCache()
+    for key in [("rolls", "ip1", 1), ("rolls", "ip1", 2), ("rolls", "ip2", 1), ("mills",)]:
+        cache.get_or_load(key, None, lambda: ["cached"])
+    cache.invalidate("rolls", "ip1")
+    assert cache.get_or_load(("rolls", "ip1", 1), None, lambda: ["fresh"]) == ["fresh"]
+    assert cache.get_or_load(("rolls", "ip2", 1), None, lambda: ["fresh"]) == ["cached"]
+    assert cache.get_or_load(("mills",), None, lambda: ["fresh"]) == ["cached"]
+
+
+@pytest.mark.parametrize("failed", [False, [], None])
+def test_failed_or_empty_results_are_not_cached(clock, failed):
+    cache = QueryCache()
+    load, calls = loader([failed, ["ok"]])
+    assert cache.get_or_load(("k",), 60, load) == failed
+    assert cache.get_or_load(("k",), 60, load) == ["ok"]
+
+
+def test_eviction_drops_expired_then_oldest(clock):
+    cache = QueryCache(max_entries=2)
+    cache.get_or_load(("a",), 10, lambda: [1])
+    cache.get_or_load(("b",), None, lambda: [2])
+    clock.now += 11
+    cache.get_or_load(("c",), None, lambda: [3])  # evicts the expired ("a",)
+    assert cache.get_or_load(("b",), None, lambda: ["reloaded"]) == [2]
+    cache.get_or_load(("d",), None, lambda: [4])  # full: evicts the oldest, ("b",)
+    assert cache.get_or_load(("b",), None, lambda: ["reloaded"]) == ["reloaded"]
+
+
+def test_roll_range_query_branches_share_the_filters():
+    query, params = roll_range_query(statuses=[2, 3], program_ids=[7])
+    start_branch, end_branch = query.split("UNION")
+    for branch in (start_branch, end_branch):
+        assert "roll_sts_id = ANY(%(statuses)s)" in branch
+        assert "roll_sts_id <> ALL(%(exclude_statuses)s)" in branch
+        assert "machineprgdtl_id = ANY(%(program_ids)s)" in branch
+        assert f"SELECT {', '.join(RollRecord._fields)} FROM roll_details" in branch
+    assert "roll_start_date >= %(start)s AND roll_start_date < %(end)s" in start_branch
+    assert "roll_end_date >= %(start)s AND roll_end_date < %(end)s" in end_branch
+    assert " OR " not in query
+    assert params == {"statuses": [2, 3], "exclude_statuses": list(db.EXCLUDED_ROLL_STATUSES), "program_ids": [7]}
+
+
+def test_roll_range_query_without_filters():
+    query, params = roll_range_query(exclude_statuses=None, order_by="roll_start_date, roll_number")
+    assert params == {}
+    assert "WHERE roll_sts_id" not in query and "AND roll_sts_id" not in query
+    assert query.strip().endswith("ORDER BY roll_start_date, roll_number")
+
+
+# The baseline's single-date query: one OR across both date columns
+OR_QUERY = """
+    SELECT roll_number, roll_name, machineprgdtl_id
+    FROM roll_details
+    WHERE roll_sts_id != 1
+    AND (
+            (roll_start_date >= :start AND roll_start_date < :end) OR
+            (roll_end_date   >= :start AND roll_end_date   < :end)
+        )
+    ORDER BY roll_number DESC
+"""
+
+
+def to_sqlite(query, params):
+    """Rewrite the psycopg2 query for sqlite3: named placeholders, ANY/ALL as IN lists."""
+    def in_list(match):
+        column, op, name = match.groups()
+        values = ", ".join(str(v) for v in params[name])
+        return f"{column} {'IN' if op == '= ANY' else 'NOT IN'} ({values})"
+
+    query = re.sub(r"(\w+) (= ANY|<> ALL)\(%\((\w+)\)s\)", in_list, query)
+    return re.sub(r"%\((\w+)\)s", r":\1", query)
+
+
+@pytest.fixture
+def rolls_db():
+    day = datetime.datetime(2024, 5, 10)
+    hours = lambda h: (day + datetime.timedelta(hours=h)).isoformat(" ")  # noqa: E731
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE roll_details (roll_number, roll_name, machineprgdtl_id, "
+                 "roll_start_date, roll_end_date, roll_sts_id)")
+    conn.executemany("INSERT INTO roll_details VALUES (?, ?, ?, ?, ?, ?)", [
+        (1, "before", 7, hours(-30), hours(-20), 3),
+        (2, "crosses into the day", 7, hours(-2), hours(3), 3),
+        (3, "inside", 8, hours(1), hours(5), 3),
+        (4, "crosses out of the day", 7, hours(20), hours(27), 3),
+        (5, "spans the whole day", 7, hours(-2), hours(26), 3),
+        (6, "still running", 8, hours(22), None, 2),
+        (7, "starts at midnight", 7, hours(0), hours(2), 3),
+        (8, "ends at the next midnight", 7, hours(18), hours(24), 3),
+        (9, "excluded status", 7, hours(2), hours(4), 1),
+        (10, "after", 7, hours(30), hours(40), 3),
+    ])
+    return conn, day
+
+
+def test_union_query_returns_the_rows_of_the_or_query(rolls_db):
+    conn, day = rolls_db
+    bounds = {"start": day.isoformat(" "), "end": (day + datetime.timedelta(days=1)).isoformat(" ")}
+    query, params = roll_range_query()
+    params.update(bounds)
+
+    union_rows = [row[:3] for row in conn.execute(to_sqlite(query, params), params)]
+    or_rows = list(conn.execute(OR_QUERY, bounds))
+
+    assert union_rows == or_rows
+    assert [row[0] for row in union_rows] == [8, 7, 6, 4, 3, 2]
+
+
+def test_union_query_applies_filters_to_both_branches(rolls_db):
+    conn, day = rolls_db
+    bounds = {"start": day.isoformat(" "), "end": (day + datetime.timedelta(days=1)).isoformat(" ")}
+    query, params = roll_range_query(statuses=[3], program_ids=[7], order_by="roll_start_date, roll_number")
+    params.update(bounds)
+
+    rows = [RollRecord(*row) for row in conn.execute(to_sqlite(query, params), params)]
+
+    # Same rows as the OR query restricted to program 7 (roll 9 is excluded by status)
+    or_rows = [row[0] for row in conn.execute(OR_QUERY, bounds) if row[2] == 7]
+    assert sorted(r.roll_number for r in rows) == sorted(or_rows)
+    assert [r.roll_number for r in rows] == [2, 7, 8, 4]
+
+
+def roll(start, end):
+    return RollRecord(1, "r", 7, start, end, 3)
+
+
+def test_roll_dates_are_the_days_the_roll_ran_within_the_range():
+    d = datetime.date
+    start, end = d(2024, 5, 10), d(2024, 5, 14)
+    at = lambda day, hour: datetime.datetime(2024, 5, day, hour)  # noqa: E731
+
+    assert roll_dates(roll(at(11, 22), at(12, 3)), start, end) == [d(2024, 5, 11), d(2024, 5, 12)]
+    assert roll_dates(roll(at(8, 1), at(10, 5)), start, end) == [d(2024, 5, 10)]
+    assert roll_dates(roll(at(13, 1), None), start, end) == [d(2024, 5, 13), d(2024, 5, 14)]
+    assert roll_dates(roll(at(12, 1), at(12, 9)), start, end) == [d(2024, 5, 12)]
+
+
+class FakePsycopgPool:
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.closed = False
+
+    def getconn(self):
+        assert not self.closed
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        self.closed = True
+
+
+class FakeConnection:
+    closed = 0
+    autocommit = True
+
+
+@pytest.fixture
+def fake_psycopg_pool(monkeypatch):
+    monkeypatch.setattr(db.psycopg2.pool, "ThreadedConnectionPool", FakePsycopgPool)
+
+
+def test_busy_pool_is_not_closed(fake_psycopg_pool, clock):
+    pool = db.ConnectionPool(2)
+    with pool.connection():
+        clock.now += 3600
+        assert not pool.close_if_idle(60)
+        assert pool.in_use == 1
+    assert pool.in_use == 0
+    assert not pool.close_if_idle(60)
+
+
+def test_idle_pool_is_closed_and_reopens_on_use(fake_psycopg_pool, clock):
+    pool = db.ConnectionPool(2)
+    first = pool._pool
+    clock.now += 61
+
+    assert pool.close_if_idle(60)
+    assert first.closed
+
+    assert pool.run(lambda conn: "ok") == "ok"
+    assert pool._pool is not first and not pool._pool.closed
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import doff_index
+from doff_index import DoffIndex, merged_table, normalize_exts, parse_doff
+from remote_manifest import DoffSummary
+
+
+def touch(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+@pytest.fixture
+def roll(tmp_path):
+    root = tmp_path / "R1" / "2026-10-18"
+    for cam in ("cam1", "cam2"):
+        for frame, doff in enumerate((3, 5, 5, 9)):
+            for ext in ("jpg", "json"):
+                touch(str(root / cam / f"R1_{cam}_x_{doff}_{frame}.{ext}"), doff)
+    touch(str(root / "cam1" / "notes.txt"), 7)
+    return root
+
+
+def index(root, tmp_path, **kwargs):
+    return DoffIndex(str(root), index_dir=str(tmp_path / "index"), **kwargs).refresh()
+
+
+def test_parse_doff():
+    assert parse_doff("R1_cam1_x_42_a.jpg") == 42
+    assert parse_doff("/a/b/R1_cam1_x_7_b.jpg") == 7
+    assert parse_doff("notes.txt") is None
+    assert parse_doff("R1_cam1_x_y.jpg") is None
+
+
+def test_normalize_exts():
+    assert normalize_exts(["JPG", ".json", " "]) == (".jpg", ".json")
+    assert normalize_exts([]) is None
+
+
+def test_range_lookups(roll, tmp_path):
+    idx = index(roll, tmp_path)
+    assert idx.keys == [3, 5, 9]
+    assert [(doff, files) for doff, _, files, _ in idx.table] == [(3, 4), (5, 8), (9, 4)]
+    assert {e.doff for e in idx.range(4, 9)} == {5, 9}
+    assert len(idx.range(5, 5)) == 8
+    assert idx.range(6, 8) == []
+    assert idx.range(10, None) == []
+    assert len(idx.range()) == 16
+    assert [os.path.basename(e.path) for e in idx.undoffed] == ["notes.txt"]
+    assert all(e.path.endswith(".jpg") for e in idx.select(3, 9, exts=normalize_exts(["jpg"])))
+
+
+def test_unchanged_directories_are_reused(roll, tmp_path, monkeypatch):
+    monkeypatch.setattr(doff_index, "HOT_SECONDS", 0)
+    assert index(roll, tmp_path).rescanned == 3
+    again = index(roll, tmp_path)
+    assert again.rescanned == 0 and len(again.range()) == 16
+
+    touch(str(roll / "cam2" / "R1_cam2_x_11_z.jpg"), 11)
+    os.utime(roll / "cam2", ns=(0, os.stat(roll / "cam2").st_mtime_ns + 10 ** 9))
+    updated = index(roll, tmp_path)
+    assert updated.rescanned == 1 and updated.keys == [3, 5, 9, 11]
+
+
+def test_merged_table(roll, tmp_path):
+    cams = [index(roll / cam, tmp_path) for cam in ("cam1", "cam2")]
+    assert merged_table(cams) == [(3, 4, 12), (5, 8, 40), (9, 4, 36)]
+    assert merged_table(cams, normalize_exts(["json"])) == [(3, 2, 6), (5, 4, 20), (9, 2, 18)]
+
+
+def test_doff_summary_totals():
+    summary = DoffSummary.parse("DOFF\t9\t4\t36\nDOFF\t3\t4\t12\nDOFF\t5\t8\t40\nNODOFF\t1\t7\ngarbage\nDOFF\tx\t1\t1\n")
+    assert (summary.first, summary.last, len(summary)) == (3, 9, 3)
+    assert summary.undoffed == (1, 7)
+    assert summary.totals(3, 9) == (16, 88)
+    assert summary.totals(4, 9) == (12, 76)
+    assert summary.totals(5, 5) == (8, 40)
+    assert summary.totals(6, 8) == (0, 0)
+    assert DoffSummary.parse("").totals(0, 100) == (0, 0)
@@ -0,0 +1,227 @@
+import http.client
+import os
+import time
+
+import pytest
+
+import graph_client
+from engine_metrics import EngineMetrics
+from graph_client import ConnectionPool, GraphClient
+from graph_upload import UploadEngine
+from upload_session import CHUNK_ALIGN, ResumableUpload, SessionStore
+
+ROOT = "Mill/M1"
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def make_engine(tmp_path, **kwargs):
+    client = GraphClient()
+    client.tokens.path = str(tmp_path / "token.json")
+    engine = UploadEngine(client, ROOT, base_folder=str(tmp_path / "src"), **kwargs)
+    engine.resumable.store = SessionStore(str(tmp_path / "sessions"))
+    return engine
+
+
+def test_simple_put(fake_graph, tmp_path):
+    a = write(tmp_path / "src" / "cam1" / "a.jpg", b"a" * 1000)
+    b = write(tmp_path / "src" / "cam1" / "b.jpg", b"b" * 2000)
+    engine = make_engine(tmp_path)
+
+    assert engine.run([a, b])
+
+    assert sorted(engine.uploaded) == sorted([a, b])
+    assert fake_graph.files[f"{ROOT}/cam1/a.jpg"] == b"a" * 1000
+    assert fake_graph.files[f"{ROOT}/cam1/b.jpg"] == b"b" * 2000
+    # Parents are addressed by their cached id, not looked up per file
+    puts = fake_graph.calls("PUT", r":/content$")
+    assert len(puts) == 2 and all("/items/" in p[1] for p in puts)
+    assert fake_graph.token_requests == 1
+
+
+def test_folders_are_created_through_batch(fake_graph, tmp_path):
+    paths = [
+        write(tmp_path / "src" / "cam1" / "defect" / "x.jpg", b"x"),
+        write(tmp_path / "src" / "cam1" / "good" / "y.jpg", b"y"),
+        write(tmp_path / "src" / "cam2" / "z.jpg", b"z"),
+    ]
+    engine = make_engine(tmp_path)
+
+    assert engine.run(paths)
+
+    for folder in ("Mill", ROOT, f"{ROOT}/cam1", f"{ROOT}/cam1/defect", f"{ROOT}/cam1/good", f"{ROOT}/cam2"):
+        assert folder in fake_graph.folders
+    assert fake_graph.calls("POST", r"/\$batch$")
+    # No folder was created or looked up outside $batch
+    assert not fake_graph.calls("POST", r"/children$")
+    assert not fake_graph.calls("GET", r"/root:/")
+
+
+def test_resumable_upload_resumes_after_interruption(fake_graph, tmp_path):
+    data = os.urandom(3 * CHUNK_ALIGN + 1234)
+    big = write(tmp_path / "src" / "cam1" / "big.bin", data)
+    options = dict(chunk_size=CHUNK_ALIGN, large_file_threshold=CHUNK_ALIGN, retries=0)
+
+    fake_graph.fail_chunks_after(2)
+    first = make_engine(tmp_path, **options)
+    assert not first.run([big])
+    assert first.failed == [big]
+    state = first.resumable.store.load(big, f"{ROOT}/cam1/big.bin")
+    assert state["offset"] == 2 * CHUNK_ALIGN
+
+    fake_graph.heal()
+    chunks_before = len(fake_graph.calls("PUT", r"/uploadSession\?"))
+    second = make_engine(tmp_path, **options)
+    assert second.run([big])
+
+    assert fake_graph.files[f"{ROOT}/cam1/big.bin"] == data
+    assert len(fake_graph.calls("POST", r":/createUploadSession$")) == 1
+    resumed = fake_graph.calls("PUT", r"/uploadSession\?")[chunks_before:]
+    assert [r[3]["Content-Range"].split()[1].split("-")[0] for r in resumed] == \
+        [str(2 * CHUNK_ALIGN), str(3 * CHUNK_ALIGN)]
+    # The pre-authenticated uploadUrl never gets the bearer token
+    assert not any("Authorization" in r[3] for r in fake_graph.calls(pattern=r"/uploadSession\?"))
+    assert second.resumable.store.load(big, f"{ROOT}/cam1/big.bin") is None
+
+
+def test_throttled_upload_waits_for_retry_after(fake_graph, tmp_path):
+    a = write(tmp_path / "src" / "a.jpg", b"a" * 100)
+    fake_graph.throttle("PUT", r":/content$", count=1, retry_after=1)
+    engine = make_engine(tmp_path, retries=2)
+
+    start = time.monotonic()
+    assert engine.run([a])
+
+    assert time.monotonic() - start >= 1
+    assert [r[2] for r in fake_graph.calls("PUT", r":/content$")] == [429, 201]
+    assert engine.limiter.limit == max(engine.limiter.minimum, 4 // 2)
+    assert fake_graph.files[f"{ROOT}/a.jpg"] == b"a" * 100
+
+
+def test_expired_token_is_refreshed_once(fake_graph, tmp_path):
+    a = write(tmp_path / "src" / "a.jpg", b"a")
+    b = write(tmp_path / "src" / "b.jpg", b"b")
+    engine = make_engine(tmp_path, workers=1, max_workers=1)
+    assert engine.run([a])
+    assert fake_graph.token_requests == 1
+
+    fake_graph.expire_tokens()
+    seen = len(fake_graph.requests)
+    engine = make_engine(tmp_path, workers=1, max_workers=1)
+    assert engine.run([b])
+
+    assert fake_graph.token_requests == 2
+    after = [r for r in fake_graph.requests[seen:] if "/oauth2/" not in r[1]]
+    # Only the first call with the stale token is rejected; it is resent with the new one
+    assert [r[2] for r in after].count(401) == 1
+    assert after[0][2] == 401 and after[1][:2] == after[0][:2] and after[1][2] == 200
+    assert after[0][3]["Authorization"] != after[1][3]["Authorization"]
+    assert fake_graph.files[f"{ROOT}/b.jpg"] == b"b"
+
+
+@pytest.mark.parametrize("sync", [False, True])
+def test_unchanged_files_are_skipped_with_sync(fake_graph, tmp_path, sync):
+    a = write(tmp_path / "src" / "cam1" / "a.jpg", b"same")
+    assert make_engine(tmp_path).run([a])
+
+    engine = make_engine(tmp_path, sync=sync)
+    assert engine.run([a])
+    assert (engine.skipped, engine.uploaded) == (([a], []) if sync else ([], [a]))
+
+
+class HalvingTransformer:
+    """Stands in for image_transform.ImageTransformer: every file shrinks to half."""
+
+    def transform(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        return data[:len(data) // 2]
+
+    def report(self):
+        pass
+
+
+def test_throughput_counts_the_bytes_sent(fake_graph, tmp_path):
+    a = write(tmp_path / "src" / "a.jpg", b"a" * 1000)
+    engine = make_engine(tmp_path, transformer=HalvingTransformer())
+    released = []
+    release = engine.limiter.release
+    engine.limiter.release = lambda nbytes=0: (released.append(nbytes), release(nbytes))
+
+    assert engine.run([a])
+
+    assert fake_graph.files[f"{ROOT}/a.jpg"] == b"a" * 500
+    assert released == [500]
+
+
+def test_requests_are_counted_by_call_site(fake_graph, tmp_path, monkeypatch):
+    recorded = EngineMetrics()
+    monkeypatch.setattr(graph_client, "metrics", recorded)
+    data = os.urandom(2 * CHUNK_ALIGN + 10)
+    big = write(tmp_path / "src" / "cam1" / "big.bin", data)
+    small = write(tmp_path / "src" / "cam1" / "small.jpg", b"s")
+    engine = make_engine(tmp_path, chunk_size=CHUNK_ALIGN, large_file_threshold=CHUNK_ALIGN)
+
+    assert engine.run([big, small])
+
+    # The uploadUrl carries /drives/.../items/... segments, yet its chunks are not item calls
+    assert "/drives/" in fake_graph.calls("PUT", r"/uploadSession\?")[0][1]
+    ops = {}
+    for (op, status), total in recorded.totals.items():
+        ops[op] = ops.get(op, 0) + total[0]
+    assert ops.pop("batch")
+    assert ops == {"token": 1, "session": 1, "chunk": 3, "put": 1}
+
+
+class StuckSessionClient:
+    """Answers every chunk with 416 and every status query with no ranges left to send."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.chunks = []
+
+    def create_upload_session(self, remote_dir, name):
+        self.sessions += 1
+        return f"https://upload.example/session{self.sessions}"
+
+    def session_request(self, upload_url, method, body=None, headers=None, op="chunk"):
+        if method == "GET":
+            return 200, {}, b'{"nextExpectedRanges": []}'
+        self.chunks.append((upload_url, headers["Content-Range"]))
+        return 416, {}, b""
+
+
+def test_stuck_upload_session_is_restarted_once(tmp_path):
+    big = write(tmp_path / "src" / "big.bin", os.urandom(2 * CHUNK_ALIGN))
+    client = StuckSessionClient()
+    resumable = ResumableUpload(client, SessionStore(str(tmp_path / "sessions")), chunk_size=CHUNK_ALIGN)
+
+    assert resumable.upload(big, ROOT, "big.bin") == 416
+
+    assert client.sessions == 2
+    assert [url for url, _ in client.chunks] == ["https://upload.example/session1",
+                                                 "https://upload.example/session2"]
+
+
+class BadStatusConnection:
+    def request(self, *args, **kwargs):
+        pass
+
+    def getresponse(self):
+        raise http.client.BadStatusLine("garbage")
+
+    def close(self):
+        pass
+
+
+def test_malformed_response_is_raised_as_a_transport_error(monkeypatch):
+    pool = ConnectionPool("http://127.0.0.1:9")
+    monkeypatch.setattr(pool, "_connection", BadStatusConnection)
+
+    with pytest.raises(OSError):
+        pool.request("PUT", "/chunk", body=b"x")
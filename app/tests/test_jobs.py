@@ -0,0 +1,92 @@
+import threading
+import time
+
+from jobs import CANCELLED, DONE, QUEUED, RUNNING, SCHEDULED, JobManager
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def blocking_fn(started, release):
+    def fn(job):
+        started.set()
+        release.wait(5)
+        return {}
+    return fn
+
+
+def test_start_now_runs_the_stored_function():
+    manager = JobManager(workers=1)
+    ran = []
+    job = manager.submit("later", "Mill", "M1", lambda j: ran.append(j.id), not_before=time.time() + 3600)
+    assert job.status == SCHEDULED
+
+    assert manager.start_now(job.id)
+    wait_for(lambda: job.status == DONE)
+    assert ran == [job.id]
+
+
+def test_cancelled_queued_job_never_runs():
+    manager = JobManager(workers=1)
+    started, release = threading.Event(), threading.Event()
+    first = manager.submit("first", "Mill", "M1", blocking_fn(started, release))
+    started.wait(5)
+    ran = []
+    second = manager.submit("second", "Mill", "M1", lambda j: ran.append(j.id))
+
+    assert manager.cancel(second.id)
+    release.set()
+    wait_for(lambda: first.status == DONE)
+    manager.executor.shutdown(wait=True)
+    assert second.status == CANCELLED and ran == []
+
+
+def test_cancel_loses_to_a_job_that_already_started():
+    manager = JobManager(workers=1)
+    started, release = threading.Event(), threading.Event()
+    job = manager.submit("running", "Mill", "M1", blocking_fn(started, release))
+    started.wait(5)
+
+    assert job.status == RUNNING
+    assert not manager.cancel(job.id)
+    release.set()
+    wait_for(lambda: job.status == DONE)
+
+
+def test_run_does_not_start_a_job_cancelled_after_pickup():
+    manager = JobManager(workers=1)
+    ran = []
+    job = manager.submit("late", "Mill", "M1", lambda j: ran.append(j.id), not_before=time.time() + 3600)
+    # A worker that picked the job up just as it was cancelled
+    manager.cancel(job.id)
+    manager._run(job)
+    assert job.status == CANCELLED and ran == []
+
+
+def test_job_after_another_waits_without_a_worker():
+    manager = JobManager(workers=2)
+    started, release = threading.Event(), threading.Event()
+    order = []
+    first = manager.submit("json", "Mill", "M1", blocking_fn(started, release))
+    second = manager.submit("roll", "Mill", "M1", lambda j: order.append("roll"), after=first)
+    started.wait(5)
+
+    time.sleep(0.05)
+    assert second.status == QUEUED and second.future is None
+    release.set()
+    wait_for(lambda: second.status == DONE)
+    assert first.status == DONE and order == ["roll"]
+
+
+def test_job_after_a_cancelled_job_still_runs():
+    manager = JobManager(workers=1)
+    first = manager.submit("json", "Mill", "M1", lambda j: {}, not_before=time.time() + 3600)
+    second = manager.submit("roll", "Mill", "M1", lambda j: {}, after=first)
+    assert second.status == QUEUED and second.future is None
+
+    assert manager.cancel(first.id)
+    wait_for(lambda: second.status == DONE)
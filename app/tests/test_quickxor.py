@@ -0,0 +1,39 @@
+import os
+import random
+
+import pytest
+
+from quickxor_reference import quickxor_b64
+from quickxor import BLOCK, QuickXorHash, file_quickxor
+
+
+def b64(data):
+    h = QuickXorHash()
+    h.update(data)
+    return h.b64digest()
+
+
+def test_empty_input():
+    assert b64(b"") == "AAAAAAAAAAAAAAAAAAAAAAAAAAA="
+
+
+@pytest.mark.parametrize("size", [1, 2, 19, 20, 21, BLOCK - 1, BLOCK, BLOCK + 1, 3 * BLOCK + 7, 5000, 65537])
+def test_matches_reference(size):
+    data = random.Random(size).randbytes(size)
+    assert b64(data) == quickxor_b64(data)
+
+
+def test_incremental_updates_match_one_shot():
+    data = random.Random(1).randbytes(10000)
+    h = QuickXorHash()
+    # Split points off the 160-byte fold blocks, including empty updates
+    for start, end in zip([0, 0, 3, 161, 161, 4000, 9999], [0, 3, 161, 161, 4000, 9999, 10000]):
+        h.update(data[start:end])
+    assert h.b64digest() == quickxor_b64(data)
+
+
+def test_file_quickxor(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    path = tmp_path / "f.bin"
+    path.write_bytes(data)
+    assert file_quickxor(str(path)) == b64(data)
@@ -0,0 +1,22 @@
+import shlex
+
+from remote_upload import REMOTE_ENGINE, REMOTE_SCRIPT, BatchUploader
+
+MILL = "O'Brien Mills"
+MACHINE = "M1; rm -rf ~"
+
+
+def test_engine_command_quotes_names():
+    cmd = BatchUploader(None)._command(MILL, MACHINE, "/tmp/manifest.txt", journal="roll 'a'",
+                                       archive="it's.tar", shard_mb=100)
+
+    assert shlex.split(cmd) == [
+        "python3", REMOTE_ENGINE, MILL, MACHINE, "--manifest", "/tmp/manifest.txt", "--workers", "4",
+        "--journal", "roll 'a'", "--archive", "it's.tar", "--shard-mb", "100.0",
+    ]
+
+
+def test_script_command_quotes_names():
+    cmd = BatchUploader(None, use_engine=False)._command(MILL, MACHINE, "/tmp/manifest.txt")
+
+    assert shlex.split(cmd) == ["bash", REMOTE_SCRIPT, MILL, MACHINE, "--manifest", "/tmp/manifest.txt"]
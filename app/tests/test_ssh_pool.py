@@ -0,0 +1,90 @@
+import time
+
+from ssh_pool import IDLE_TIMEOUT, SSHPool, _Session
+
+
+class FakeChannel:
+    def __init__(self, closed=False):
+        self.closed = closed
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def add_session(pool, key, idle_for, channels=()):
+    session = pool._sessions[key] = _Session(key, FakeClient)
+    session.client = FakeClient()
+    session.last_used = time.time() - idle_for
+    session.channels = list(channels)
+    return session
+
+
+MACHINE = ("machine", "10.0.0.1")
+STORAGE = ("storage", "10.0.0.1", "192.168.1.2")
+OTHER_STORAGE = ("storage", "10.0.0.9", "192.168.1.2")
+
+
+def evict(pool):
+    with pool._lock:
+        pool._evict_idle()
+
+
+def test_idle_sessions_are_closed():
+    pool = SSHPool()
+    machine = add_session(pool, MACHINE, IDLE_TIMEOUT + 1)
+    storage = add_session(pool, STORAGE, IDLE_TIMEOUT + 1)
+
+    evict(pool)
+
+    assert machine.client is None and storage.client is None
+
+
+def test_session_with_open_channel_is_kept():
+    pool = SSHPool()
+    machine = add_session(pool, MACHINE, IDLE_TIMEOUT + 1, [FakeChannel(closed=False)])
+
+    evict(pool)
+
+    assert machine.client is not None
+
+
+def test_jump_host_is_kept_while_a_tunnelled_upload_runs():
+    pool = SSHPool()
+    # A long upload: the machine session itself has not been touched for a while,
+    # but the storage session tunnelled through it has a channel open
+    machine = add_session(pool, MACHINE, IDLE_TIMEOUT + 1)
+    storage = add_session(pool, STORAGE, IDLE_TIMEOUT + 1, [FakeChannel(closed=False)])
+
+    evict(pool)
+
+    assert machine.client is not None and not machine.client.closed
+    assert storage.client is not None
+
+
+def test_jump_host_is_kept_while_its_storage_session_is_recent():
+    pool = SSHPool()
+    machine = add_session(pool, MACHINE, IDLE_TIMEOUT + 1)
+    add_session(pool, STORAGE, 10)
+
+    evict(pool)
+
+    assert machine.client is not None
+
+
+def test_only_the_jump_host_of_the_busy_tunnel_is_kept():
+    pool = SSHPool()
+    machine = add_session(pool, MACHINE, IDLE_TIMEOUT + 1)
+    other_machine = add_session(pool, ("machine", "10.0.0.9"), IDLE_TIMEOUT + 1)
+    add_session(pool, OTHER_STORAGE, IDLE_TIMEOUT + 1, [FakeChannel(closed=True)])
+    add_session(pool, STORAGE, IDLE_TIMEOUT + 1, [FakeChannel(closed=False)])
+
+    # Registering any other session runs the eviction, as an operator connecting would
+    pool._register(("machine", "10.0.0.5"), FakeClient)
+
+    assert machine.client is not None
+    assert other_machine.client is None
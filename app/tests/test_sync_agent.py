@@ -0,0 +1,100 @@
+import datetime
+import os
+import sys
+import time
+
+import pytest
+
+import sync_agent
+from sync_agent import IN_CLOSE_WRITE, IN_CREATE, IN_ISDIR, SETTLE_SECONDS, SyncAgent
+
+
+def write(path, data=b"x", age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def queued(agent):
+    return {p for batch in agent.batches.values() for p in batch["paths"]}
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    base = str(tmp_path / "images")
+    os.makedirs(base)
+    monkeypatch.setattr(sync_agent, "WATCH_BASES", (base,))
+    return base
+
+
+@pytest.fixture
+def agent(images):
+    agent = SyncAgent("Mill", "M1")
+    yield agent
+    agent.bucket.close()
+    agent.inotify.close()
+
+
+def test_new_folder_queues_only_settled_files(agent, images):
+    camera = os.path.join(images, "roll1", "2024-05-10", "cam1")
+    done = write(os.path.join(camera, "a.jpg"), age=SETTLE_SECONDS + 5)
+    writing = write(os.path.join(camera, "b.jpg"))
+
+    agent.handle_event(os.path.join(images, "roll1"), "2024-05-10", IN_CREATE | IN_ISDIR)
+    agent.settle_due()
+
+    assert queued(agent) == {done}
+    assert agent.settling == {writing}
+
+    # Once the writer is done (no more changes for SETTLE_SECONDS) it is batched too
+    os.utime(writing, (time.time() - SETTLE_SECONDS - 1,) * 2)
+    agent.settle_due()
+    assert queued(agent) == {done, writing} and not agent.settling
+
+
+def test_close_write_batches_a_settling_file_at_once(agent, images):
+    camera = os.path.join(images, "roll1", "2024-05-10", "cam1")
+    writing = write(os.path.join(camera, "b.jpg"))
+    agent.handle_event(os.path.join(images, "roll1"), "2024-05-10", IN_CREATE | IN_ISDIR)
+    assert not queued(agent)
+
+    agent.handle_event(camera, "b.jpg", IN_CLOSE_WRITE)
+
+    assert queued(agent) == {writing} and not agent.settling
+
+
+def test_rescan_works_one_date_folder_per_step(agent, images):
+    today = datetime.date.today().isoformat()
+    old = SETTLE_SECONDS + 5
+    first = write(os.path.join(images, "roll1", today, "cam1", "a.jpg"), age=old)
+    second = write(os.path.join(images, "roll2", today, "cam1", "b.jpg"), age=old)
+
+    steps = agent.rescan_steps()
+    next(steps)
+    assert not queued(agent)
+    next(steps)
+    assert len(queued(agent)) == 1
+    assert next(steps, "finished") == "finished"
+    assert queued(agent) == {first, second}
+
+
+def test_start_passes_its_own_argv_to_the_child(tmp_path, monkeypatch):
+    spawned = []
+
+    class Popen:
+        def __init__(self, cmd, **kwargs):
+            spawned.append(cmd)
+            self.pid = 4242
+
+    monkeypatch.setattr(sync_agent, "LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setattr(sync_agent, "running_pid", lambda: 0)
+    monkeypatch.setattr(sync_agent.subprocess, "Popen", Popen)
+    monkeypatch.setattr(sys, "argv", ["sync_agent.py", "status"])
+
+    assert sync_agent.main(["start", "Mill", "M1", "--max-mbps", "3", "--workers", "1"]) == 0
+
+    assert spawned[0][2:] == ["run", "Mill", "M1", "--max-mbps", "3", "--workers", "1"]
@@ -0,0 +1,72 @@
+import pytest
+
+from upload_eta import (
+    DEFAULT_MODEL, DEFAULT_SECONDS_PER_FILE, LIVE_WARMUP_FILES, SAMPLE_SECONDS,
+    LiveEta, ThroughputModel, fit_throughput, format_duration,
+)
+
+MB = 1024 ** 2
+
+
+def runs(per_file, bytes_per_sec, sizes, mode="files"):
+    return [{"files": f, "bytes": b, "seconds": f * per_file + b / bytes_per_sec, "mode": mode} for f, b in sizes]
+
+
+def test_no_history_uses_the_default():
+    assert fit_throughput([]) == DEFAULT_MODEL
+    assert fit_throughput([{"files": 0, "bytes": 0, "seconds": 0}]) == DEFAULT_MODEL
+
+
+def test_fit_recovers_overhead_and_bandwidth():
+    history = runs(0.2, 4 * MB, [(100, 50 * MB), (5000, 100 * MB), (20, 800 * MB), (900, 300 * MB)])
+    model = fit_throughput(history, "files")
+    assert model.seconds_per_file == pytest.approx(0.2, rel=1e-6)
+    assert model.bytes_per_sec == pytest.approx(4 * MB, rel=1e-6)
+    assert model.runs == 4
+
+
+def test_same_mode_runs_are_preferred():
+    history = runs(0.2, 4 * MB, [(100, 50 * MB), (5000, 100 * MB), (20, 800 * MB)], mode="files") \
+        + runs(0.01, 40 * MB, [(10, 500 * MB), (20, 900 * MB), (400, 100 * MB)], mode="archive")
+    assert fit_throughput(history, "archive").bytes_per_sec == pytest.approx(40 * MB, rel=1e-6)
+    assert fit_throughput(history, "files").bytes_per_sec == pytest.approx(4 * MB, rel=1e-6)
+
+
+def test_too_few_runs_fall_back_to_bandwidth_only():
+    model = fit_throughput([{"files": 10, "bytes": 10 * MB, "seconds": 10 * DEFAULT_SECONDS_PER_FILE + 2}])
+    assert model.seconds_per_file == DEFAULT_SECONDS_PER_FILE
+    assert model.bytes_per_sec == pytest.approx(5 * MB)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_live_eta_starts_from_the_model():
+    model = ThroughputModel(0.1, MB, 5)
+    eta = LiveEta(model, 100, 100 * MB, clock=Clock())
+    assert eta.remaining() == pytest.approx(100 * 0.1 + 100)
+    eta.skip(MB)
+    assert eta.remaining() == pytest.approx(99 * 0.1 + 99)
+
+
+def test_live_eta_converges_on_the_observed_rate():
+    model = ThroughputModel(0.0, MB, 5)
+    clock = Clock()
+    eta = LiveEta(model, 2 * LIVE_WARMUP_FILES + 10, (2 * LIVE_WARMUP_FILES + 10) * MB, clock=clock)
+    # This run is twice as slow as the model predicts
+    for _ in range(2 * LIVE_WARMUP_FILES):
+        clock.now += 2.0
+        eta.update(MB)
+    assert SAMPLE_SECONDS <= 2.0
+    assert eta.ratio == pytest.approx(2.0)
+    assert eta.remaining() == pytest.approx(10 * 2.0)
+
+
+@pytest.mark.parametrize("seconds, text", [(0, "0m 0s"), (-5, "0m 0s"), (75, "1m 15s"), (3725, "1h 02m")])
+def test_format_duration(seconds, text):
+    assert format_duration(seconds) == text